@@ -0,0 +1,107 @@
+"""
+This module provides functions to measure embeds and pack them into as few messages as possible.
+"""
+from typing import Optional
+
+from interactions import EMBED_MAX_FIELDS, EMBED_TOTAL_MAX, Embed
+
+MAX_EMBEDS_PER_MESSAGE = 10
+
+
+def embed_length(embed: Embed) -> int:
+    """
+    Calculates the length of an embed, as counted by Discord for the limit of a message.
+
+    Parameters:
+    -----------
+    embed : Embed
+        The embed to measure.
+
+    Returns:
+    --------
+    int
+        The number of characters in the title, description, fields, footer and author of the embed.
+    """
+    return (
+        len(embed.title or "")
+        + len(embed.description or "")
+        + sum(len(field.name) + len(field.value) for field in embed.fields)
+        + (len(embed.footer.text) if embed.footer else 0)
+        + (len(embed.author.name) if embed.author else 0)
+    )
+
+
+def split_fields(
+    title: str,
+    fields: list[tuple[str, str]],
+    description: Optional[str] = None,
+    max_length: int = EMBED_TOTAL_MAX,
+) -> list[Embed]:
+    """
+    Puts fields in order into as few embeds with the same title and description as possible.
+
+    Parameters:
+    -----------
+    title : str
+        The title of every embed.
+    fields : list[tuple[str, str]]
+        The name and value of every field, each of them must fit into an embed on its own.
+    description : Optional[str]
+        The description of every embed.
+    max_length : int
+        The maximum length of an embed.
+
+    Returns:
+    --------
+    list[Embed]
+        The embeds, to be sent with pack_embeds.
+    """
+    embeds = [Embed(title=title, description=description)]
+    for name, value in fields:
+        embed = embeds[-1]
+        if embed.fields and (
+            len(embed.fields) >= EMBED_MAX_FIELDS
+            or embed_length(embed) + len(name) + len(value) > max_length
+        ):
+            embed = Embed(title=title, description=description)
+            embeds.append(embed)
+        embed.add_field(name=name, value=value)
+    return embeds
+
+
+def pack_embeds(
+    embeds: list[Embed],
+    max_embeds: int = MAX_EMBEDS_PER_MESSAGE,
+    max_length: int = EMBED_TOTAL_MAX,
+) -> list[list[Embed]]:
+    """
+    Packs embeds in order into as few messages as possible.
+
+    Parameters:
+    -----------
+    embeds : list[Embed]
+        The embeds to send, each of them must fit into a message on its own.
+    max_embeds : int
+        The maximum number of embeds in a message.
+    max_length : int
+        The maximum total length of the embeds in a message.
+
+    Returns:
+    --------
+    list[list[Embed]]
+        The embeds of every message, in order.
+    """
+    messages: list[list[Embed]] = []
+    message_length = 0
+    for embed in embeds:
+        length = embed_length(embed)
+        if (
+            not messages
+            or len(messages[-1]) >= max_embeds
+            or message_length + length > max_length
+        ):
+            messages.append([])
+            message_length = 0
+        messages[-1].append(embed)
+        message_length += length
+    return messages
@@ -17,6 +17,7 @@ from interactions import (
 )
 
 import app.localizer as localizer
+from app.embeds import embed_length
 from app.library.charsheet import (
     AttributeType,
     CategorySetting,
@@ -28,26 +29,18 @@ from app.library.charsheet import (
     RuleSystemRolls,
     SheetModification,
 )
-from app.library.complex_dice_parser import Parser
-from app.library.polydice import ComplexPool
+from app.library.complex_dice_parser import compile_pool
+from app.library.database import run_db, run_db_write
+from app.library.polydice import ComplexPool, rng_for_scope, roll_many, use_rng
+
+MESSAGE_LENGTH = 2000
 
 
 async def is_gm(context: BaseContext):
     """Checks if the user is a GM."""
-    return CategoryUser.get(
-        str(context.channel.category.id), str(context.author.id)
-    ).is_gm
-
-
-def embed_length(embed: Embed):
-    """Calculates the length of an embed."""
     return (
-        len(embed.title)
-        + len(embed.description)
-        + sum(len(field.name) + len(field.value) for field in embed.fields)
-        + (len(embed.footer.text) if embed.footer else 0)
-        + (len(embed.author.name) if embed.author else 0)
-    )
+        await run_db(CategoryUser.get, str(context.channel.category.id), str(context.author.id))
+    ).is_gm
 
 
 class CharSheetManager(Extension):
@@ -57,10 +50,10 @@ class CharSheetManager(Extension):
         """Prints a message when the extension is started."""
         print("Starting CharSheetManager Extension")
 
-    def show_group_info(self, ctx: SlashContext) -> Embed:
+    async def show_group_info(self, ctx: SlashContext) -> Embed:
         """Shows group info."""
-        settings = CategorySetting.get_by_category(str(ctx.channel.category.id))
-        users = CategoryUser.get_by_category(str(ctx.channel.category.id))
+        settings = await run_db(CategorySetting.get_by_category, str(ctx.channel.category.id))
+        users = await run_db(CategoryUser.get_by_category, str(ctx.channel.category.id))
         embed = Embed(
             title=localizer.translate(
                 ctx.locale,
@@ -87,8 +80,8 @@ class CharSheetManager(Extension):
             ),
         )
         characters: dict[str, list[str]] = {}
-        for user_id, char_name in CharacterHeader.get_by_category(
-            str(ctx.channel.category.id)
+        for user_id, char_name in await run_db(
+            CharacterHeader.get_by_category, str(ctx.channel.category.id)
         ):
             if user_id not in characters:
                 characters[user_id] = []
@@ -147,14 +140,13 @@ class CharSheetManager(Extension):
     )
     async def start_group(self, ctx: SlashContext, rule_system: str):
         """Opens a group, creates default settings and makes you GM."""
-        settings = CategorySetting.create(str(ctx.channel.category.id))
-        CategorySetting.update(settings.category_id, rule_system=rule_system)
-        CategoryUser.create(
-            str(ctx.channel.category.id), str(ctx.author.id), is_gm=True
+        settings = await run_db_write(CategorySetting.create, str(ctx.channel.category.id))
+        await run_db_write(CategorySetting.update, settings.category_id, rule_system=rule_system)
+        await run_db_write(
+            CategoryUser.create, str(ctx.channel.category.id), str(ctx.author.id), is_gm=True
         )
         await ctx.send(
-            localizer.translate(ctx.locale, "group_created"),
-            embed=self.show_group_info(ctx),
+            localizer.translate(ctx.locale, "group_created"), embed=await self.show_group_info(ctx)
         )
 
     @slash_command(
@@ -170,10 +162,11 @@ class CharSheetManager(Extension):
     @check(is_gm)
     async def add_player(self, ctx: SlashContext, player: User):
         """Joins a player to the group."""
-        CategoryUser.create(str(ctx.channel.category.id), str(player.id), is_gm=False)
+        await run_db_write(
+            CategoryUser.create, str(ctx.channel.category.id), str(player.id), is_gm=False
+        )
         await ctx.send(
-            localizer.translate(ctx.locale, "player_added"),
-            embed=self.show_group_info(ctx),
+            localizer.translate(ctx.locale, "player_added"), embed=await self.show_group_info(ctx)
         )
 
     @slash_command(
@@ -191,10 +184,9 @@ class CharSheetManager(Extension):
     @check(is_gm)
     async def remove_player(self, ctx: SlashContext, player: User):
         """Removes a player from the group."""
-        CategoryUser.delete(str(ctx.channel.category.id), str(player.id))
+        await run_db_write(CategoryUser.delete, str(ctx.channel.category.id), str(player.id))
         await ctx.send(
-            localizer.translate(ctx.locale, "player_removed"),
-            embed=self.show_group_info(ctx),
+            localizer.translate(ctx.locale, "player_removed"), embed=await self.show_group_info(ctx)
         )
 
     @slash_command(
@@ -210,10 +202,11 @@ class CharSheetManager(Extension):
     @check(is_gm)
     async def add_gm(self, ctx: SlashContext, player: User):
         """Makes a player GM."""
-        CategoryUser.update(str(ctx.channel.category.id), str(player.id), is_gm=True)
+        await run_db_write(
+            CategoryUser.update, str(ctx.channel.category.id), str(player.id), is_gm=True
+        )
         await ctx.send(
-            localizer.translate(ctx.locale, "player_made_gm"),
-            embed=self.show_group_info(ctx),
+            localizer.translate(ctx.locale, "player_made_gm"), embed=await self.show_group_info(ctx)
         )
 
     @slash_command(
@@ -223,12 +216,12 @@ class CharSheetManager(Extension):
     @check(is_gm)
     async def resign_gm(self, ctx: SlashContext):
         """Removes GM status from you."""
-        CategoryUser.update(
-            str(ctx.channel.category.id), str(ctx.author.id), is_gm=False
+        await run_db_write(
+            CategoryUser.update, str(ctx.channel.category.id), str(ctx.author.id), is_gm=False
         )
         await ctx.send(
             localizer.translate(ctx.locale, "gm_status_removed"),
-            embed=self.show_group_info(ctx),
+            embed=await self.show_group_info(ctx),
         )
 
     @slash_command(
@@ -237,7 +230,7 @@ class CharSheetManager(Extension):
     )
     async def show_group(self, ctx: SlashContext):
         """Shows group info."""
-        await ctx.send(embed=self.show_group_info(ctx))
+        await ctx.send(embed=await self.show_group_info(ctx))
 
     @slash_command(
         name="set_rule_system",
@@ -254,10 +247,12 @@ class CharSheetManager(Extension):
     @check(is_gm)
     async def set_rule_system(self, ctx: SlashContext, rule_system: str):
         """Sets the rule system to use."""
-        CategorySetting.update(str(ctx.channel.category.id), rule_system=rule_system)
+        await run_db_write(
+            CategorySetting.update, str(ctx.channel.category.id), rule_system=rule_system
+        )
         await ctx.send(
             localizer.translate(ctx.locale, "rule_system_set"),
-            embed=self.show_group_info(ctx),
+            embed=await self.show_group_info(ctx),
         )
 
     @slash_command(
@@ -269,10 +264,12 @@ class CharSheetManager(Extension):
     @check(is_gm)
     async def creation_finished(self, ctx: SlashContext):
         """Stops free character creation and starts the game."""
-        CategorySetting.update(str(ctx.channel.category.id), state=GroupState.STARTED)
+        await run_db_write(
+            CategorySetting.update, str(ctx.channel.category.id), state=GroupState.STARTED
+        )
         await ctx.send(
             localizer.translate(ctx.locale, "creation_finished"),
-            embed=self.show_group_info(ctx),
+            embed=await self.show_group_info(ctx),
         )
 
     def chunk_list(
@@ -287,7 +284,7 @@ class CharSheetManager(Extension):
             current_string += item + join_char
         yield current_string
 
-    def display_character(self, ctx: SlashContext, character: CharacterHeader) -> Embed:
+    async def display_character(self, ctx: SlashContext, character: CharacterHeader) -> Embed:
         """Displays a character sheet."""
         results = []
         embed = Embed(
@@ -298,8 +295,11 @@ class CharSheetManager(Extension):
         if character.image_url:
             embed.set_image(url=character.image_url)
         char_sheet_entries = (
-            CharactersheetEntry.get(
-                character.user_id, str(ctx.channel.category.id), character.name
+            await run_db(
+                CharactersheetEntry.get,
+                character.user_id,
+                str(ctx.channel.category.id),
+                character.name,
             )
             or []
         )
@@ -376,10 +376,10 @@ class CharSheetManager(Extension):
         """Autocompletes character names."""
         string_option_input = ctx.input_text
         if everyone_see_all or (gm_see_all and await is_gm(ctx)):
-            headers = CharacterHeader.get_by_category(str(ctx.channel.category.id))
+            headers = await run_db(CharacterHeader.get_by_category, str(ctx.channel.category.id))
         else:
-            headers = CharacterHeader.get_available(
-                str(ctx.author.id), str(ctx.channel.category.id)
+            headers = await run_db(
+                CharacterHeader.get_available, str(ctx.author.id), str(ctx.channel.category.id)
             )
         await ctx.send(
             choices=[
@@ -417,12 +417,17 @@ class CharSheetManager(Extension):
         self, ctx: SlashContext, name: str, concept: str, description: str = "..."
     ):
         """Creates a character sheet header."""
-        character = CharacterHeader.create(
-            str(ctx.author.id), str(ctx.channel.category.id), name, concept, description
+        character = await run_db_write(
+            CharacterHeader.create,
+            str(ctx.author.id),
+            str(ctx.channel.category.id),
+            name,
+            concept,
+            description,
         )
         await ctx.send(
             localizer.translate(ctx.locale, "character_created"),
-            embed=self.display_character(ctx, character),
+            embed=await self.display_character(ctx, character),
         )
 
     @slash_command(
@@ -465,7 +470,8 @@ class CharSheetManager(Extension):
         image_url: str = None,
     ):
         """Updates a character sheet header."""
-        character = CharacterHeader.update(
+        character = await run_db_write(
+            CharacterHeader.update,
             str(ctx.author.id),
             str(ctx.channel.category.id),
             name,
@@ -475,7 +481,7 @@ class CharSheetManager(Extension):
         )
         await ctx.send(
             localizer.translate(ctx.locale, "character_updated"),
-            embed=self.display_character(ctx, character),
+            embed=await self.display_character(ctx, character),
         )
 
     @update_character.autocomplete("name")
@@ -507,9 +513,11 @@ class CharSheetManager(Extension):
         if confirm != "confirm":
             await ctx.send(localizer.translate(ctx.locale, "deletion_not_confirmed"))
             return
-        CharacterHeader.delete(str(ctx.author_id), str(ctx.channel.category.id), name)
-        CharactersheetEntry.delete(
-            str(ctx.author_id), str(ctx.channel.category.id), name
+        await run_db_write(
+            CharacterHeader.delete, str(ctx.author_id), str(ctx.channel.category.id), name
+        )
+        await run_db_write(
+            CharactersheetEntry.delete, str(ctx.author_id), str(ctx.channel.category.id), name
         )
         await ctx.send(localizer.translate(ctx.locale, "character_deleted"))
 
@@ -533,15 +541,15 @@ class CharSheetManager(Extension):
     )
     async def show_character(self, ctx: SlashContext, name: str):
         """Shows a character sheet header."""
-        character = CharacterHeader.get(
-            str(ctx.author_id), str(ctx.channel.category.id), name
+        character = await run_db(
+            CharacterHeader.get, str(ctx.author_id), str(ctx.channel.category.id), name
         )
-        await ctx.send(embed=self.display_character(ctx, character))
+        await ctx.send(embed=await self.display_character(ctx, character))
 
     @show_character.autocomplete("name")
     async def show_character_name_autocomplete(self, ctx: AutocompleteContext):
         """Autocompletes character names for showing."""
-        settings = CategorySetting.get_by_category(str(ctx.channel.category.id))
+        settings = await run_db(CategorySetting.get_by_category, str(ctx.channel.category.id))
         await self.character_name_autocomplete(ctx, True, not settings.character_hidden)
 
     @slash_command(
@@ -613,10 +621,10 @@ class CharSheetManager(Extension):
         override: bool = False,
     ):
         """Adds an attribute to a character sheet."""
-        settings = CategorySetting.get_by_category(str(ctx.channel.category.id))
+        settings = await run_db(CategorySetting.get_by_category, str(ctx.channel.category.id))
         is_gm_current = await is_gm(ctx)
-        character_header = CharacterHeader.find_by_name(
-            str(ctx.channel.category.id), name
+        character_header = (
+            await run_db(CharacterHeader.find_by_name, str(ctx.channel.category.id), name)
         )[0]
         owner_id = character_header.user_id if is_gm_current else str(ctx.author_id)
         if (
@@ -625,13 +633,15 @@ class CharSheetManager(Extension):
             or await is_gm(ctx)
         ):
             if override:
-                CharactersheetEntry.remove_key(
+                await run_db_write(
+                    CharactersheetEntry.remove_key,
                     owner_id,
                     str(ctx.channel.category.id),
                     name,
                     attribute_name,
                 )
-            CharactersheetEntry.create(
+            await run_db_write(
+                CharactersheetEntry.create,
                 owner_id,
                 str(ctx.channel.category.id),
                 name,
@@ -642,13 +652,15 @@ class CharSheetManager(Extension):
             await ctx.send(localizer.translate(ctx.locale, "attribute_added"))
         else:
             if override:
-                SheetModification.delete(
+                await run_db_write(
+                    SheetModification.delete,
                     str(ctx.author_id),
                     str(ctx.channel.category.id),
                     name,
                     attribute_name,
                 )
-            SheetModification.create(
+            await run_db_write(
+                SheetModification.create,
                 str(ctx.author_id),
                 str(ctx.channel.category.id),
                 name,
@@ -683,18 +695,20 @@ class CharSheetManager(Extension):
     )
     async def list_pending_changes(self, ctx: SlashContext, name: str):
         """Lists pending changes for a character sheet."""
-        settings = CategorySetting.get_by_category(str(ctx.channel.category.id))
+        settings = await run_db(CategorySetting.get_by_category, str(ctx.channel.category.id))
         if settings.state == GroupState.CREATING or not settings.changes_need_approval:
             await ctx.send(localizer.translate(ctx.locale, "no_pending_changes"))
             return
         is_gm_current = await is_gm(ctx)
         if is_gm_current:
-            relevant_characters = CharacterHeader.find_by_name(str(ctx.channel.category.id), name)
+            relevant_characters = await run_db(
+                CharacterHeader.find_by_name, str(ctx.channel.category.id), name
+            )
             for character in relevant_characters:
                 changes: dict[str, SheetModification] = {
                     f"{change.sheet_key}": change
-                    for change in SheetModification.get(
-                        character.user_id, str(ctx.channel.category.id), name
+                    for change in await run_db(
+                        SheetModification.get, character.user_id, str(ctx.channel.category.id), name
                     )
                     if change.status == ModificationState.PENDING
                 }
@@ -703,16 +717,19 @@ class CharSheetManager(Extension):
                     return
                 original_character: dict[str, CharactersheetEntry] = {
                     f"{entry.sheet_key}": entry
-                    for entry in CharactersheetEntry.get(
-                        character.user_id, str(ctx.channel.category.id), name
+                    for entry in await run_db(
+                        CharactersheetEntry.get,
+                        character.user_id,
+                        str(ctx.channel.category.id),
+                        name,
                     )
                     if entry.sheet_key in changes
                 }
         else:
             changes: dict[str, SheetModification] = {
                 f"{change.sheet_key}": change
-                for change in SheetModification.get(
-                    str(ctx.author_id), str(ctx.channel.category.id), name
+                for change in await run_db(
+                    SheetModification.get, str(ctx.author_id), str(ctx.channel.category.id), name
                 )
                 if change.status == ModificationState.PENDING
             }
@@ -721,8 +738,8 @@ class CharSheetManager(Extension):
                 return
             original_character: dict[str, CharactersheetEntry] = {
                 f"{entry.sheet_key}": entry
-                for entry in CharactersheetEntry.get(
-                    str(ctx.author_id), str(ctx.channel.category.id), name
+                for entry in await run_db(
+                    CharactersheetEntry.get, str(ctx.author_id), str(ctx.channel.category.id), name
                 )
                 if entry.sheet_key in changes
             }
@@ -779,20 +796,23 @@ class CharSheetManager(Extension):
     @check(is_gm)
     async def approve_all_changes(self, ctx: SlashContext, name: str):
         """Approves all pending changes for a character sheet."""
-        settings = CategorySetting.get_by_category(str(ctx.channel.category.id))
+        settings = await run_db(CategorySetting.get_by_category, str(ctx.channel.category.id))
         if settings.state == GroupState.CREATING or not settings.changes_need_approval:
             await ctx.send(localizer.translate(ctx.locale, "no_pending_changes"))
             return
-        character_header = CharacterHeader.find_by_name(str(ctx.channel.category.id), name)[0]
-        changes = SheetModification.get(
-            character_header.user_id, str(ctx.channel.category.id), name
+        character_header = (
+            await run_db(CharacterHeader.find_by_name, str(ctx.channel.category.id), name)
+        )[0]
+        changes = await run_db(
+            SheetModification.get, character_header.user_id, str(ctx.channel.category.id), name
         )
         change_count = 0
         for change in changes:
             print(change)
             if change.status == ModificationState.PENDING:
                 change_count += 1
-                CharactersheetEntry.update(
+                await run_db_write(
+                    CharactersheetEntry.update,
                     str(character_header.user_id),
                     str(ctx.channel.category.id),
                     name,
@@ -800,7 +820,8 @@ class CharSheetManager(Extension):
                     change.value,
                     change.attribute_type,
                 )
-                SheetModification.update(
+                await run_db_write(
+                    SheetModification.update,
                     str(character_header.user_id),
                     str(ctx.channel.category.id),
                     name,
@@ -843,20 +864,23 @@ class CharSheetManager(Extension):
     @check(is_gm)
     async def reject_all_changes(self, ctx: SlashContext, name: str, reason: str):
         """Rejects all pending changes for a character sheet."""
-        settings = CategorySetting.get_by_category(str(ctx.channel.category.id))
+        settings = await run_db(CategorySetting.get_by_category, str(ctx.channel.category.id))
         if settings.state == GroupState.CREATING or not settings.changes_need_approval:
             await ctx.send(localizer.translate(ctx.locale, "no_pending_changes"))
             return
 
-        character_header = CharacterHeader.find_by_name(str(ctx.channel.category.id), name)[0]
-        changes = SheetModification.get(
-            str(character_header.user_id), str(ctx.channel.category.id), name
+        character_header = (
+            await run_db(CharacterHeader.find_by_name, str(ctx.channel.category.id), name)
+        )[0]
+        changes = await run_db(
+            SheetModification.get, str(character_header.user_id), str(ctx.channel.category.id), name
         )
         change_count = 0
         for change in changes:
             if change.status == ModificationState.PENDING:
                 change_count += 1
-                SheetModification.update(
+                await run_db_write(
+                    SheetModification.update,
                     str(character_header.user_id),
                     str(ctx.channel.category.id),
                     name,
@@ -892,9 +916,11 @@ class CharSheetManager(Extension):
             )
             return
         
-        character_header = CharacterHeader.find_by_name(str(ctx.channel.category.id), char_name)[0]
-        changes = SheetModification.get(
-            character_header.user_id, str(ctx.channel.category.id), char_name
+        character_header = (
+            await run_db(CharacterHeader.find_by_name, str(ctx.channel.category.id), char_name)
+        )[0]
+        changes = await run_db(
+            SheetModification.get, character_header.user_id, str(ctx.channel.category.id), char_name
         )
 
         await ctx.send(
@@ -931,16 +957,23 @@ class CharSheetManager(Extension):
     @check(is_gm)
     async def approve_change(self, ctx: SlashContext, name: str, attribute_name: str):
         """Approves a pending change for a character sheet."""
-        settings = CategorySetting.get_by_category(str(ctx.channel.category.id))
+        settings = await run_db(CategorySetting.get_by_category, str(ctx.channel.category.id))
         if settings.state == GroupState.CREATING or not settings.changes_need_approval:
             await ctx.send(localizer.translate(ctx.locale, "no_pending_changes"))
             return
-        character_header = CharacterHeader.find_by_name(str(ctx.channel.category.id), name)[0]
-        change = SheetModification.get_key(
-            character_header.user_id, str(ctx.channel.category.id), name, attribute_name
+        character_header = (
+            await run_db(CharacterHeader.find_by_name, str(ctx.channel.category.id), name)
+        )[0]
+        change = await run_db(
+            SheetModification.get_key,
+            character_header.user_id,
+            str(ctx.channel.category.id),
+            name,
+            attribute_name,
         )
         if change and change.status == ModificationState.PENDING:
-            CharactersheetEntry.update(
+            await run_db_write(
+                CharactersheetEntry.update,
                 character_header.user_id,
                 str(ctx.channel.category.id),
                 name,
@@ -948,7 +981,8 @@ class CharSheetManager(Extension):
                 change.value,
                 change.attribute_type,
             )
-            SheetModification.update(
+            await run_db_write(
+                SheetModification.update,
                 character_header.user_id,
                 str(ctx.channel.category.id),
                 name,
@@ -1006,16 +1040,23 @@ class CharSheetManager(Extension):
         self, ctx: SlashContext, name: str, attribute_name: str, reason: str
     ):
         """Rejects a pending change for a character sheet."""
-        settings = CategorySetting.get_by_category(str(ctx.channel.category.id))
+        settings = await run_db(CategorySetting.get_by_category, str(ctx.channel.category.id))
         if settings.state == GroupState.CREATING or not settings.changes_need_approval:
             await ctx.send(localizer.translate(ctx.locale, "no_pending_changes"))
             return
-        character_header = CharacterHeader.find_by_name(str(ctx.channel.category.id), name)[0]
-        change = SheetModification.get_key(
-            character_header.user_id, str(ctx.channel.category.id), name, attribute_name
+        character_header = (
+            await run_db(CharacterHeader.find_by_name, str(ctx.channel.category.id), name)
+        )[0]
+        change = await run_db(
+            SheetModification.get_key,
+            character_header.user_id,
+            str(ctx.channel.category.id),
+            name,
+            attribute_name,
         )
         if change and change.status == ModificationState.PENDING:
-            SheetModification.update(
+            await run_db_write(
+                SheetModification.update,
                 character_header.user_id,
                 str(ctx.channel.category.id),
                 name,
@@ -1057,7 +1098,7 @@ class CharSheetManager(Extension):
     @check(is_gm)
     async def set_initiative_roll(self, ctx: SlashContext, rule_system: str, roll: str):
         """Sets the initiative roll for the group."""
-        RuleSystemRolls.create(rule_system, "INITIATIVE", roll)
+        await run_db_write(RuleSystemRolls.create, rule_system, "INITIATIVE", roll)
         await ctx.send(localizer.translate(ctx.locale, "initiative_roll_set"))
 
     @slash_command(
@@ -1093,8 +1134,8 @@ class CharSheetManager(Extension):
         hidden: bool = False,
     ):
         """Rolls initiative for all players and GMs."""
-        settings = CategorySetting.get_by_category(str(ctx.channel.category.id))
-        initiative_rule = RuleSystemRolls.get(settings.rule_system, "INITIATIVE")
+        settings = await run_db(CategorySetting.get_by_category, str(ctx.channel.category.id))
+        initiative_rule = await run_db(RuleSystemRolls.get, settings.rule_system, "INITIATIVE")
         if not initiative_rule:
             await ctx.send(
                 localizer.translate(
@@ -1110,7 +1151,7 @@ class CharSheetManager(Extension):
             )
             return
 
-        characters = CharacterHeader.get_by_category(str(ctx.channel.category.id))
+        characters = await run_db(CharacterHeader.get_by_category, str(ctx.channel.category.id))
         result = localizer.translate(ctx.locale, "initiative_rollsn")
         player_rolls: dict[str, ComplexPool] = {}
         for player_id_char_name, character_list in characters.items():
@@ -1120,8 +1161,8 @@ class CharSheetManager(Extension):
                     continue
                 sheet_entries: dict[str, int] = {
                     entry.sheet_key: entry.value
-                    for entry in CharactersheetEntry.get(
-                        player_id, str(ctx.channel.category.id), char_name
+                    for entry in await run_db(
+                        CharactersheetEntry.get, player_id, str(ctx.channel.category.id), char_name
                     )
                     if entry.sheet_key in initiative_rule.needed_sheet_values
                 }
@@ -1138,19 +1179,21 @@ class CharSheetManager(Extension):
                         )
                     )
                     continue
-                player_rolls[char_name] = Parser(
-                    initiative_rule.eval(sheet_entries)
-                ).build_pool()
+                player_rolls[char_name] = compile_pool(initiative_rule.eval(sheet_entries))
         for i in range(npc_slots):
-            player_rolls[localizer.translate(ctx.locale, "npc_i1", i1=i + 1)] = Parser(
+            player_rolls[localizer.translate(ctx.locale, "npc_i1", i1=i + 1)] = compile_pool(
                 npc_roll
-            ).build_pool()
-        results = [
-            (player_name, player_pool.roll().formatted())
-            for player_name, player_pool in player_rolls.items()
-        ]
+            )
+        with use_rng(rng_for_scope(ctx.channel_id, ctx.guild_id)):
+            results = list(zip(player_rolls.keys(), roll_many(list(player_rolls.values()))))
+        lines = [result.rstrip("\n")]
+        # the header is sent in the first message, the rest is shared by the lines
+        line_budget = (MESSAGE_LENGTH - len(result)) // max(len(results), 1)
         for player_name, player_roll in sorted(
-            results, key=lambda x: x[1], reverse=True
+            results, key=lambda x: x[1].total, reverse=True
         ):
-            result += f"{player_name}: {player_roll}\n"
-        await ctx.send(result, ephemeral=hidden)
+            dice_budget = max(line_budget - len(player_name) - 3, 20)
+            lines.append(f"{player_name}: {player_roll.formatted(budget=dice_budget)}")
+        # with many participants the lines keep 20 characters for their dice and are split over several messages
+        for message in self.chunk_list(lines, max_length=MESSAGE_LENGTH - 1):
+            await ctx.send(message, ephemeral=hidden)
@@ -1,33 +1,50 @@
 """This module contains the InitiativeTracker Extension for the Initiative Tracking System."""
+import asyncio
+import os
+from typing import Optional
+
 from interactions import (
+    Button,
+    ButtonStyle,
+    ComponentContext,
     Embed,
     Extension,
+    GuildText,
     LocalisedDesc,
+    Message,
     OptionType,
     SlashContext,
+    component_callback,
     slash_command,
     slash_option,
+    spread_to_rows,
 )
+from interactions.client.errors import NotFound
 
 import app.localizer as localizer
-from app.library.initiativatracking import (
-    InitiativeTracking,
-    get_channel_initiative,
-    insert_after_name,
-    insert_before_index,
-    insert_before_name,
-    insert_channel_message,
-    remove_channel_initiative,
-    remove_from_initiative,
-    set_channel_initiative,
-)
+from app.library.database import run_db_write
+from app.library.initiativatracking import recover_channel_initiatives
+from app.library.initiative_store import ChannelInitiative, initiative_store
+
+# the seconds to wait for more changes before editing the message of a channel
+DISPLAY_DELAY = float(os.getenv("INITIATIVE_DISPLAY_DELAY", "1"))
+
+_pending_edits: dict[str, asyncio.Task] = {}
+_edit_locales: dict[str, str] = {}
 
 
 class InitiativeTracker(Extension):
     """An extension for tracking initiative in a channel."""
     async def async_start(self):
-        """Print a message when the extension is started."""
+        """Repair the trackings of a crash while writing them and print a message when the extension is started."""
         print("Starting InitiativeTracker Extension")
+        if repaired := await run_db_write(recover_channel_initiatives):
+            print(f"Repaired the initiative tracking of {repaired} channels")
+
+    def drop(self):
+        """Write all changed trackings to the database when the extension is unloaded."""
+        initiative_store.flush_all_sync()
+        super().drop()
 
     @slash_command(
         name="initiative_help",
@@ -54,7 +71,10 @@ With /initiative_remove you can remove one participant from the list
 
 With /initiative_delete you can delete the complete list
 
-Use /initiative_show to just refresh the message
+The list message is edited in place after every change,
+use /initiative_show to post it again at the bottom of the channel
+
+The buttons below the list move the turn to the next or previous participant or start a new round
 """  # TODO: LOCALIZATION FLAG
         )
 
@@ -71,11 +91,9 @@ Use /initiative_show to just refresh the message
     async def start_initiative(self, ctx: SlashContext, participants: str = ""):
         """Start a new initiative tracking list."""
         channel_id: str = str(ctx.channel_id)
-        if existing_trackings := get_channel_initiative(channel_id):
-            if old_message := ctx.channel.get_message(existing_trackings[0].message_id):
-                await ctx.channel.delete_message(old_message)
-        set_channel_initiative(
-            channel_id, *[name.strip() for name in participants.split(",") if name]
+        await delete_initiative_message(ctx, await initiative_store.get(channel_id))
+        await initiative_store.set_names(
+            channel_id, [name.strip() for name in participants.split(",") if name]
         )
         await show_channel_initiative(ctx)
 
@@ -85,7 +103,7 @@ Use /initiative_show to just refresh the message
     )
     async def show_initiative(self, ctx: SlashContext):
         """Show the current initiative tracking list."""
-        await show_channel_initiative(ctx)
+        await show_channel_initiative(ctx, True)
 
     @slash_command(
         name="initiative_insert_before",
@@ -103,11 +121,9 @@ Use /initiative_show to just refresh the message
     )
     async def insert_before(self, ctx: SlashContext, name: str, name_after: str):
         """Insert a new entry before the name in the initiative tracking."""
-        channel_id: str = str(ctx.channel_id)
-        if not get_channel_initiative(channel_id):
-            set_channel_initiative(channel_id, name.strip(), name_after.strip())
-        else:
-            insert_before_name(channel_id, name_after.strip(), name.strip())
+        state = await initiative_store.get(str(ctx.channel_id))
+        state.insert_before(name_after.strip(), name.strip())
+        initiative_store.changed(state)
         await show_channel_initiative(ctx)
 
     @slash_command(
@@ -126,11 +142,9 @@ Use /initiative_show to just refresh the message
     )
     async def insert_after(self, ctx: SlashContext, name: str, name_before: str):
         """Insert a new entry after the name in the initiative tracking."""
-        channel_id: str = str(ctx.channel_id)
-        if not get_channel_initiative(channel_id):
-            set_channel_initiative(channel_id, name_before.strip(), name.strip())
-        else:
-            insert_after_name(channel_id, name_before.strip(), name.strip())
+        state = await initiative_store.get(str(ctx.channel_id))
+        state.insert_after(name_before.strip(), name.strip())
+        initiative_store.changed(state)
         await show_channel_initiative(ctx)
 
     @slash_command(
@@ -144,11 +158,9 @@ Use /initiative_show to just refresh the message
     )
     async def insert_first(self, ctx: SlashContext, name: str):
         """Insert a new entry at the beginning of the initiative tracking."""
-        channel_id: str = str(ctx.channel_id)
-        if not get_channel_initiative(channel_id):
-            set_channel_initiative(channel_id, name.strip())
-        else:
-            insert_before_index(channel_id, 0, name.strip())
+        state = await initiative_store.get(str(ctx.channel_id))
+        state.insert(0, name.strip())
+        initiative_store.changed(state)
         await show_channel_initiative(ctx)
 
     @slash_command(
@@ -162,11 +174,9 @@ Use /initiative_show to just refresh the message
     )
     async def insert_last(self, ctx: SlashContext, name: str):
         """Insert a new entry at the end of the initiative tracking."""
-        channel_id: str = str(ctx.channel_id)
-        if existing := get_channel_initiative(channel_id):
-            insert_before_index(channel_id, existing[-1].initiative_order + 1, name.strip())
-        else:
-            set_channel_initiative(channel_id, name.strip())
+        state = await initiative_store.get(str(ctx.channel_id))
+        state.insert(len(state.names), name.strip())
+        initiative_store.changed(state)
         await show_channel_initiative(ctx)
 
     @slash_command(
@@ -180,9 +190,10 @@ Use /initiative_show to just refresh the message
     )
     async def remove_name(self, ctx: SlashContext, name: str):
         """Remove a participant from the initiative tracking."""
-        channel_id: str = str(ctx.channel_id)
-        remove_from_initiative(channel_id, name.strip())
-        await show_channel_initiative(ctx, True)
+        state = await initiative_store.get(str(ctx.channel_id))
+        state.remove(name.strip())
+        initiative_store.changed(state)
+        await show_channel_initiative(ctx)
 
     @slash_command(
         name="initiative_delete",
@@ -203,31 +214,136 @@ Use /initiative_show to just refresh the message
             return
 
         channel_id: str = str(ctx.channel_id)
-        if existing_trackings := get_channel_initiative(channel_id):
-            if old_message := ctx.channel.get_message(existing_trackings[0].message_id):
-                await ctx.channel.delete_message(old_message)
-        remove_channel_initiative(channel_id)
+        await delete_initiative_message(ctx, await initiative_store.get(channel_id))
+        await initiative_store.set_names(channel_id, [])
         await ctx.send(localizer.translate(ctx.locale, "initiative_removed"))
 
+    @component_callback("initiative_previous_turn", "initiative_next_turn", "initiative_new_round")
+    async def turn_button(self, ctx: ComponentContext):
+        """Handle the buttons below the list, moving the turn and editing the pressed message."""
+        state = await initiative_store.get(str(ctx.channel_id))
+        if ctx.custom_id == "initiative_previous_turn":
+            state.previous_turn()
+        elif ctx.custom_id == "initiative_next_turn":
+            state.next_turn()
+        else:
+            state.new_round()
+        initiative_store.changed(state)
+        await ctx.edit_origin(
+            embed=render_initiative(ctx.locale, state), components=initiative_buttons(ctx.locale)
+        )
+
+
+async def fetch_initiative_message(channel: GuildText, state: ChannelInitiative) -> Optional[Message]:
+    """Fetch the message displaying the initiative tracking, None if there is none or it was deleted."""
+    return await channel.fetch_message(state.message_id) if state.message_id else None
+
+
+async def delete_initiative_message(ctx: SlashContext, state: ChannelInitiative):
+    """Delete the message displaying the initiative tracking, together with any pending edit of it."""
+    cancel_initiative_edit(state.channel_id)
+    if old_message := await fetch_initiative_message(ctx.channel, state):
+        await ctx.channel.delete_message(old_message)
+
+
+async def show_channel_initiative(ctx: SlashContext, repost: bool = False):
+    """
+    Show the initiative tracking for the channel.
+
+    If the channel already has a message displaying it, the command is only acknowledged and the message
+    is edited after DISPLAY_DELAY seconds, so a burst of changes results in one edit. Otherwise (or with
+    repost) the tracking is sent as a new message.
+    """
+    state = await initiative_store.get(str(ctx.channel_id))
+    old_message = await fetch_initiative_message(ctx.channel, state)
+    if old_message and not repost:
+        await ctx.send(localizer.translate(ctx.locale, "initiative_updated"), ephemeral=True)
+        schedule_initiative_edit(ctx.channel, ctx.locale)
+        return
+    if old_message:
+        await delete_initiative_message(ctx, state)
+    new_message = await ctx.send(
+        embed=render_initiative(ctx.locale, state), components=initiative_buttons(ctx.locale)
+    )
+    await initiative_store.set_message(state.channel_id, str(new_message.id))
+
 
-async def show_channel_initiative(ctx: SlashContext, refresh_message: bool = False):
-    """Show the initiative tracking for the channel."""
-    channel_id: str = str(ctx.channel_id)
-    trackings = get_channel_initiative(channel_id)
-    if refresh_message and trackings:
-        if old_message := ctx.channel.get_message(trackings[0].message_id):
-            await ctx.channel.delete_message(old_message)
-    new_message = await ctx.send(embed=render_initiative(ctx, trackings))
-    insert_channel_message(channel_id, str(new_message.id))
+def schedule_initiative_edit(channel: GuildText, locale: str):
+    """Edit the message of the channel after DISPLAY_DELAY seconds, unless an edit is already pending."""
+    channel_id = str(channel.id)
+    _edit_locales[channel_id] = locale
+    pending_edit = _pending_edits.get(channel_id)
+    if pending_edit is None or pending_edit.done():
+        _pending_edits[channel_id] = asyncio.create_task(edit_initiative_later(channel))
 
 
-def render_initiative(ctx: SlashContext, trackings: list[InitiativeTracking]):
-    """Render the initiative tracking list as an embed."""
+def cancel_initiative_edit(channel_id: str):
+    """Cancel the pending edit of the message of the channel, e.g. because the message is deleted."""
+    _edit_locales.pop(channel_id, None)
+    if pending_edit := _pending_edits.pop(channel_id, None):
+        pending_edit.cancel()
+
+
+async def edit_initiative_later(channel: GuildText):
+    """
+    Wait for more changes, then render the current tracking into the message, re-posting it if it is gone.
+
+    The task stays registered in _pending_edits until it is finished, so deleting the tracking can cancel it
+    at any point. Changes made while the message is edited are rendered in another round.
+    """
+    channel_id = str(channel.id)
+    try:
+        while channel_id in _edit_locales:
+            await asyncio.sleep(DISPLAY_DELAY)
+            locale = _edit_locales.pop(channel_id)
+            state = await initiative_store.get(channel_id)
+            embed = render_initiative(locale, state)
+            if message := await fetch_initiative_message(channel, state):
+                try:
+                    await message.edit(embed=embed, components=initiative_buttons(locale))
+                    continue
+                except NotFound:
+                    pass
+            new_message = await channel.send(embed=embed, components=initiative_buttons(locale))
+            await initiative_store.set_message(channel_id, str(new_message.id))
+    finally:
+        if _pending_edits.get(channel_id) is asyncio.current_task():
+            del _pending_edits[channel_id]
+
+
+def render_initiative(locale: str, state: ChannelInitiative):
+    """Render the initiative tracking list as an embed, marking the participant whose turn it is."""
+    if not state.names:
+        return Embed(
+            title=localizer.translate(locale, "initiative_tracker"),
+            description=localizer.translate(locale, "empty__use_insert_commands_to_fill_the_slots"),
+        )
     return Embed(
-        title=localizer.translate(ctx.locale, "initiative_tracker"),
+        title=localizer.translate(locale, "initiative_tracker"),
         description="\n".join(
-            f"{index + 1}. {tracking.name}" for index, tracking in enumerate(trackings)
-        )
-        if trackings
-        else localizer.translate(ctx.locale, "empty__use_insert_commands_to_fill_the_slots"),
+            f"**{index + 1}. {name}** ◀" if name == state.current_turn else f"{index + 1}. {name}"
+            for index, name in enumerate(state.names)
+        ),
+        footer=localizer.translate(locale, "round_number", number=state.round) if state.round else None,
+    )
+
+
+def initiative_buttons(locale: str):
+    """The buttons below the list, moving the turn to the previous or next participant or starting a new round."""
+    return spread_to_rows(
+        Button(
+            style=ButtonStyle.GRAY,
+            label=localizer.translate(locale, "previous_turn"),
+            custom_id="initiative_previous_turn",
+        ),
+        Button(
+            style=ButtonStyle.BLUE,
+            label=localizer.translate(locale, "next_turn"),
+            custom_id="initiative_next_turn",
+        ),
+        Button(
+            style=ButtonStyle.GREEN,
+            label=localizer.translate(locale, "new_round"),
+            custom_id="initiative_new_round",
+        ),
     )
@@ -20,17 +20,34 @@ from app.library.polydice import (
     ExplodingBehavior,
     format_dice_result,
     format_dice_success_result,
+    rng_for_scope,
     roll_dice_successes,
     roll_dice_sum,
+    use_rng,
 )
+from app.library.roll_executor import run_roll, start_roll_executor
+from app.library.roll_limits import DEFAULT_MAX_DICE, limits_for_guild
 
 
 class PolyDice(Extension):
     """An extension for rolling dice and counting successes."""
     async def async_start(self):
-        """Print a message when the extension is started."""
+        """Print a message when the extension is started and start the workers for heavy rolls."""
+        start_roll_executor()
         print("Starting PolyDice Extension")
 
+    async def send_if_too_big(self, ctx: SlashContext, number: int) -> bool:
+        """Send an error and return True if the roll needs more dice than the server allows."""
+        limits = limits_for_guild(ctx.guild_id)
+        if number <= limits.max_dice:
+            return False
+        await ctx.send(
+            localizer.translate(
+                ctx.locale, "roll_limit_exceeded", dice=number, max_dice=limits.max_dice
+            )
+        )
+        return True
+
     @slash_command(
         name="roll_successes",
         description=LocalisedDesc(**localizer.translations("roll_successes_description")),
@@ -40,6 +57,8 @@ class PolyDice(Extension):
         description=LocalisedDesc(**localizer.translations("number_description")),
         required=False,
         opt_type=OptionType.INTEGER,
+        min_value=1,
+        max_value=DEFAULT_MAX_DICE,
     )
     @slash_option(
         name="sides",
@@ -105,9 +124,20 @@ class PolyDice(Extension):
         threshold: int = 4,
     ):
         """Rolls a number of dice and counts the number of successes."""
-        result = roll_dice_successes(
-            number, sides, high_exploding, low_subtracting, dice_modifier, pool_modifier, threshold
-        )
+        if await self.send_if_too_big(ctx, number):
+            return
+        with use_rng(rng_for_scope(ctx.channel_id, ctx.guild_id)):
+            result = await run_roll(
+                number,
+                roll_dice_successes,
+                number,
+                sides,
+                high_exploding,
+                low_subtracting,
+                dice_modifier,
+                pool_modifier,
+                threshold,
+            )
         color = 0xFFFFFF
         if result.successes < 0:
             color = 0xFF0000
@@ -168,6 +198,8 @@ class PolyDice(Extension):
         description=LocalisedDesc(**localizer.translations("number_description")),
         required=False,
         opt_type=OptionType.INTEGER,
+        min_value=1,
+        max_value=DEFAULT_MAX_DICE,
     )
     @slash_option(
         name="sides",
@@ -219,7 +251,12 @@ class PolyDice(Extension):
         pool_modifier: int = 0,
     ):
         """Rolls a number of dice and returns the sum of the results."""
-        result = roll_dice_sum(number, sides, high_exploding, dice_modifier, pool_modifier)
+        if await self.send_if_too_big(ctx, number):
+            return
+        with use_rng(rng_for_scope(ctx.channel_id, ctx.guild_id)):
+            result = await run_roll(
+                number, roll_dice_sum, number, sides, high_exploding, dice_modifier, pool_modifier
+            )
         color = 0xFFFFFF
         if result.sum == number:
             color = 0xFF0000
@@ -1,5 +1,10 @@
 """This module contains the RollComplex Extension."""
+import asyncio
+
 from interactions import (
+    EMBED_FIELD_VALUE_LENGTH,
+    EMBED_MAX_FIELDS,
+    EMBED_TOTAL_MAX,
     AutocompleteContext,
     Button,
     ButtonStyle,
@@ -11,6 +16,7 @@ from interactions import (
     Modal,
     ModalContext,
     OptionType,
+    Permissions,
     ShortText,
     SlashCommandChoice,
     SlashContext,
@@ -22,26 +28,53 @@ from interactions import (
 )
 
 import app.localizer as localizer
-from app.library.complex_dice_parser import Parser
+from app.embeds import embed_length, pack_embeds, split_fields
+from app.library.complex_dice_parser import DiceSyntaxError
+from app.library.database import run_db, run_db_write
+from app.library.dice_expression import (
+    ExpressionResult,
+    compile_dice_expressions,
+    roll_dice_expressions,
+)
+from app.library.dice_odds import (
+    DEFAULT_EXPLOSION_DEPTH,
+    OddsTooExpensive,
+    check_odds_cost,
+    describe_odds,
+    trim_chart,
+)
+from app.library.dice_simulation import MAX_SIMULATED_ROLLS, simulate_dice_pool
 from app.library.polydice import (
+    MAX_EXPLOSION_DEPTH,
     DicePoolExclusionsDifference,
     DicePoolExclusionsSuccesses,
     DicePoolExclusionsSum,
+    SecureRng,
+    rng_for_scope,
+    seeded_rng,
+    set_scope_rng,
+    use_rng,
 )
-from app.library.saved_rolls import (
-    SavedRoll,
-    Session,
-    engine,
-    get_by_id,
-    get_by_user,
-    invalidate_cache,
+from app.library.roll_executor import run_roll, start_roll_executor
+from app.library.roll_limits import (
+    DEFAULT_MAX_DICE,
+    DEFAULT_MAX_EXPLOSION_DICE,
+    RollLimitExceeded,
+    RollLimits,
+    estimate_cost,
+    limits_for_guild,
+    max_simulated_rolls,
+    plan_roll,
+    set_guild_limits,
 )
+from app.library.saved_rolls import SavedRoll, add_saved_roll, get_by_id, get_by_user
 
 
 class RollComplex(Extension):
     """An extension for rolling complex dice pools."""
     async def async_start(self):
-        """Print a message when the extension is started."""
+        """Print a message when the extension is started and start the workers for heavy rolls."""
+        start_roll_executor()
         print("Starting RollComplex Extension")
 
     @slash_command(
@@ -69,6 +102,8 @@ b to use only the lowest values (amount)
 +/- to add a modifier to the dice pool (success count if s is used, sum if not)
 ++/-- to add a modifier to each dice result
 
+Descriptions can be combined with +, -, * and / (rounding down, only by numbers) and brackets, without spaces
+
 Each description can be followed by a comment indicated by a #, the comment will be displayed in the result
 
 **Examples:**
@@ -86,6 +121,15 @@ Rolls four 10-sided dice and counts the number of dice that rolled a 6 or higher
 
 ```/roll_complex d20<14 d20<12 d20<13 #Mu Ch Kl```
 Rolls three 20-sided dice and counts the value if it is below 14 / 12 / 13. Says "Mu Ch Kl" in the result.
+
+```/roll_complex 2d6+1d8+3 (3d6h2)*2```
+Adds two 6-sided dice, one 8-sided dice and 3, and doubles the two highest of three 6-sided dice
+
+```/roll_odds 4d6h3```
+Shows the exact probability of every result instead of rolling
+
+```/roll_simulate d20<14 d20<12 d20<13 rolls:1000000```
+Rolls the dice a million times and shows average, percentiles and a histogram
 """
         )
 
@@ -102,7 +146,7 @@ Rolls three 20-sided dice and counts the value if it is below 14 / 12 / 13. Says
     async def roll_complex(self, ctx: SlashContext, dice_pool: str):
         """Roll a complex dice pool."""
         await ctx.defer()
-        result_embeds = self.create_embeds(ctx, ctx.author.display_name.split(" ")[0], dice_pool)
+        result_embeds = await self.create_embeds(ctx, ctx.author.display_name.split(" ")[0], dice_pool)
         action_rows = spread_to_rows(
             Button(style=ButtonStyle.GRAY, label=".", custom_id=dice_pool, disabled=True),
             Button(
@@ -111,8 +155,287 @@ Rolls three 20-sided dice and counts the value if it is below 14 / 12 / 13. Says
                 custom_id="save_complex_pool",
             ),
         )
-        for embed in result_embeds:
-            await ctx.send(f'{ctx.author.mention} {localizer.translate(ctx.locale,"rolled")}',embed=embed, components=action_rows)
+        for embeds in pack_embeds(result_embeds):
+            await ctx.send(f'{ctx.author.mention} {localizer.translate(ctx.locale,"rolled")}',embeds=embeds, components=action_rows)
+
+    @slash_command(
+        name="roll_odds",
+        description=LocalisedDesc(**localizer.translations("roll_odds_description")),
+    )
+    @slash_option(
+        name="dice_pool",
+        description=LocalisedDesc(**localizer.translations("dice_pool_description")),
+        required=True,
+        opt_type=OptionType.STRING,
+    )
+    @slash_option(
+        name="explosion_depth",
+        description=LocalisedDesc(**localizer.translations("explosion_depth_description")),
+        required=False,
+        opt_type=OptionType.INTEGER,
+        min_value=1,
+        max_value=100,
+    )
+    async def roll_odds(
+        self, ctx: SlashContext, dice_pool: str, explosion_depth: int = DEFAULT_EXPLOSION_DEPTH
+    ):
+        """Show the exact outcome distribution of a complex dice pool."""
+        await ctx.defer()
+        try:
+            items = compile_dice_expressions(dice_pool)
+        except DiceSyntaxError as error:
+            await ctx.send(self.describe_syntax_error(ctx, dice_pool, error))
+            return
+        if await self.send_if_too_big(ctx, items):
+            return
+        fields = []
+        for item in items:
+            try:
+                check_odds_cost(item)
+                mean, deviation, chart = await asyncio.get_running_loop().run_in_executor(
+                    start_roll_executor(), describe_odds, item, explosion_depth
+                )
+            except OddsTooExpensive as error:
+                fields.append(
+                    (
+                        f"{item.description}:",
+                        localizer.translate(
+                            ctx.locale,
+                            "odds_too_expensive",
+                            states=error.states,
+                            max_states=error.max_states,
+                        ),
+                    )
+                )
+                continue
+            summary = localizer.translate(
+                ctx.locale,
+                "expected_value_mean_deviation",
+                mean=f"{mean:.2f}",
+                deviation=f"{deviation:.2f}",
+            )
+            fields.append((f"{item.description}:", self.chart_value(summary, chart)))
+        result_embeds = split_fields(
+            localizer.translate(ctx.locale, "odds_for_dice_pool", dice_pool=dice_pool), fields
+        )
+        for embeds in pack_embeds(result_embeds):
+            await ctx.send(embeds=embeds)
+
+    def chart_value(self, summary: str, chart: str) -> str:
+        """Returns the summary followed by the chart as a code block, dropping chart rows to fit into a field."""
+        if not chart:
+            return summary
+        budget = EMBED_FIELD_VALUE_LENGTH - len(summary) - len("\n```\n\n```")
+        return f"{summary}\n```\n{trim_chart(chart, budget)}\n```"
+
+    @slash_command(
+        name="roll_simulate",
+        description=LocalisedDesc(**localizer.translations("roll_simulate_description")),
+    )
+    @slash_option(
+        name="dice_pool",
+        description=LocalisedDesc(**localizer.translations("dice_pool_description")),
+        required=True,
+        opt_type=OptionType.STRING,
+    )
+    @slash_option(
+        name="rolls",
+        description=LocalisedDesc(**localizer.translations("simulated_rolls_description")),
+        required=False,
+        opt_type=OptionType.INTEGER,
+        min_value=1,
+        max_value=MAX_SIMULATED_ROLLS,
+    )
+    async def roll_simulate(self, ctx: SlashContext, dice_pool: str, rolls: int = 100000):
+        """Roll a complex dice pool many times in a worker process and show the statistics."""
+        await ctx.defer()
+        try:
+            items = compile_dice_expressions(dice_pool)
+        except DiceSyntaxError as error:
+            await ctx.send(self.describe_syntax_error(ctx, dice_pool, error))
+            return
+        if await self.send_if_too_big(ctx, items):
+            return
+        max_rolls = max_simulated_rolls(items, limits_for_guild(ctx.guild_id))
+        if rolls > max_rolls:
+            await ctx.send(
+                localizer.translate(
+                    ctx.locale, "simulation_limit_exceeded", rolls=rolls, max_rolls=max_rolls
+                )
+            )
+            return
+        simulation = await asyncio.get_running_loop().run_in_executor(
+            start_roll_executor(), simulate_dice_pool, dice_pool, rolls
+        )
+        fields = []
+        for statistic in simulation.statistics:
+            percentiles = " / ".join(
+                f"{percentile}%: {value:g}" for percentile, value in statistic.percentiles.items()
+            )
+            summary = localizer.translate(
+                ctx.locale,
+                "expected_value_mean_deviation",
+                mean=f"{statistic.mean:.2f}",
+                deviation=f"{statistic.standard_deviation:.2f}",
+            )
+            fields.append(
+                (f"{statistic.label}:", self.chart_value(f"{summary}\n{percentiles}", statistic.chart))
+            )
+        result_embeds = split_fields(
+            localizer.translate(ctx.locale, "simulation_for_dice_pool", dice_pool=dice_pool),
+            fields,
+            description=localizer.translate(
+                ctx.locale,
+                "simulated_rolls_in_seconds",
+                rolls=simulation.rolls,
+                seconds=f"{simulation.seconds:.2f}",
+                rolls_per_second=f"{simulation.rolls_per_second:,.0f}",
+            ),
+        )
+        for embeds in pack_embeds(result_embeds):
+            await ctx.send(embeds=embeds)
+
+    @slash_command(
+        name="roll_rng",
+        description=LocalisedDesc(**localizer.translations("roll_rng_description")),
+        default_member_permissions=Permissions.MANAGE_GUILD,
+    )
+    @slash_option(
+        name="source",
+        description=LocalisedDesc(**localizer.translations("rng_source_description")),
+        required=True,
+        opt_type=OptionType.STRING,
+        choices=[
+            SlashCommandChoice(name=LocalisedName(**localizer.translations("rng_fast")), value="fast"),
+            SlashCommandChoice(
+                name=LocalisedName(**localizer.translations("rng_seeded")), value="seeded"
+            ),
+            SlashCommandChoice(
+                name=LocalisedName(**localizer.translations("rng_secure")), value="secure"
+            ),
+        ],
+    )
+    @slash_option(
+        name="seed",
+        description=LocalisedDesc(**localizer.translations("rng_seed_description")),
+        required=False,
+        opt_type=OptionType.INTEGER,
+        min_value=0,
+    )
+    @slash_option(
+        name="scope",
+        description=LocalisedDesc(**localizer.translations("rng_scope_description")),
+        required=False,
+        opt_type=OptionType.STRING,
+        choices=[
+            SlashCommandChoice(
+                name=LocalisedName(**localizer.translations("serverwide")), value="server"
+            ),
+            SlashCommandChoice(
+                name=LocalisedName(**localizer.translations("channelwide")), value="channel"
+            ),
+        ],
+    )
+    async def roll_rng(
+        self, ctx: SlashContext, source: str, seed: int = 0, scope: str = "channel"
+    ):
+        """Select the random source used for rolls in this channel or server."""
+        if scope == "server" and ctx.guild_id is None:
+            await ctx.send(localizer.translate(ctx.locale, "server_scope_needs_server"), ephemeral=True)
+            return
+        scope_id = ctx.guild_id if scope == "server" else ctx.channel_id
+        if source == "seeded":
+            set_scope_rng(scope_id, seeded_rng(seed, int(scope_id)))
+        elif source == "secure":
+            set_scope_rng(scope_id, SecureRng())
+        else:
+            set_scope_rng(scope_id, None)
+        await ctx.send(
+            localizer.translate(ctx.locale, "rng_selected", source=source, seed=seed, scope=scope)
+        )
+
+    @slash_command(
+        name="roll_limits",
+        description=LocalisedDesc(**localizer.translations("roll_limits_description")),
+        default_member_permissions=Permissions.MANAGE_GUILD,
+    )
+    @slash_option(
+        name="max_dice",
+        description=LocalisedDesc(**localizer.translations("max_dice_description")),
+        required=False,
+        opt_type=OptionType.INTEGER,
+        min_value=1,
+        max_value=DEFAULT_MAX_DICE,
+    )
+    @slash_option(
+        name="max_explosion_dice",
+        description=LocalisedDesc(**localizer.translations("max_explosion_dice_description")),
+        required=False,
+        opt_type=OptionType.INTEGER,
+        min_value=0,
+        max_value=DEFAULT_MAX_EXPLOSION_DICE,
+    )
+    @slash_option(
+        name="mode",
+        description=LocalisedDesc(**localizer.translations("limit_mode_description")),
+        required=False,
+        opt_type=OptionType.STRING,
+        choices=[
+            SlashCommandChoice(
+                name=LocalisedName(**localizer.translations("limit_reject")), value="reject"
+            ),
+            SlashCommandChoice(
+                name=LocalisedName(**localizer.translations("limit_downgrade")), value="downgrade"
+            ),
+        ],
+    )
+    async def roll_limits(
+        self,
+        ctx: SlashContext,
+        max_dice: int = DEFAULT_MAX_DICE,
+        max_explosion_dice: int = DEFAULT_MAX_EXPLOSION_DICE,
+        mode: str = "reject",
+    ):
+        """Set how many dice can be rolled at once on this server."""
+        set_guild_limits(
+            ctx.guild_id,
+            RollLimits(
+                max_dice=max_dice,
+                max_explosion_dice=max_explosion_dice,
+                downgrade=mode == "downgrade",
+            ),
+        )
+        await ctx.send(
+            localizer.translate(
+                ctx.locale,
+                "roll_limits_set",
+                max_dice=max_dice,
+                max_explosion_dice=max_explosion_dice,
+                mode=mode,
+            )
+        )
+
+    async def send_if_too_big(self, ctx: SlashContext, items) -> bool:
+        """Send an error and return True if the pools need more dice than the server allows."""
+        limits = limits_for_guild(ctx.guild_id)
+        cost = estimate_cost(items, limits.max_explosion_dice)
+        if cost.dice <= limits.max_dice:
+            return False
+        await ctx.send(
+            localizer.translate(
+                ctx.locale, "roll_limit_exceeded", dice=cost.dice, max_dice=limits.max_dice
+            )
+        )
+        return True
+
+    def describe_syntax_error(self, ctx: SlashContext, dice_pool: str, error: DiceSyntaxError) -> str:
+        """Describe the token a dice pool could not be parsed at, marking its position with a caret."""
+        return (
+            localizer.translate(
+                ctx.locale, "dice_syntax_error", token=error.token, position=error.position + 1
+            )
+            + f"\n```\n{dice_pool}\n{' ' * error.position}^\n```"
+        )
 
     @slash_command(
         name="save_roll",
@@ -164,7 +487,7 @@ Rolls three 20-sided dice and counts the value if it is below 14 / 12 / 13. Says
     )
     async def my_rolls(self, ctx: SlashContext):
         """List all saved rolls for the user."""
-        saved_rolls = get_by_user(str(ctx.author_id))
+        saved_rolls = await run_db(get_by_user, str(ctx.author_id))
         if not saved_rolls:
             await ctx.send(localizer.translate(ctx.locale, "no_saved_rolls"))
             return
@@ -190,14 +513,14 @@ Rolls three 20-sided dice and counts the value if it is below 14 / 12 / 13. Says
     async def named_roll(self, ctx: SlashContext, roll_name: str):
         """Roll a saved dice pool."""
         saved_roll_id = int(roll_name)
-        saved_roll = get_by_id(saved_roll_id)
+        saved_roll = await run_db(get_by_id, saved_roll_id)
 
         await ctx.defer()
-        result_embeds = self.create_embeds(
+        result_embeds = await self.create_embeds(
             ctx, ctx.author.display_name.split(" ")[0], saved_roll.dice_pool
         )
-        for embed in result_embeds:
-            await ctx.send(embed=embed)
+        for embeds in pack_embeds(result_embeds):
+            await ctx.send(embeds=embeds)
 
     @named_roll.autocomplete("roll_name")
     async def roll_name_autocomplete(self, ctx: AutocompleteContext):
@@ -206,7 +529,7 @@ Rolls three 20-sided dice and counts the value if it is below 14 / 12 / 13. Says
 
         result = [
             {"name": saved_roll.name, "value": str(saved_roll.id)}
-            for saved_roll in get_by_user(str(ctx.author_id))
+            for saved_roll in await run_db(get_by_user, str(ctx.author_id))
             if string_option_input.lower() in saved_roll.name.lower()
             and saved_roll.is_available(
                 str(ctx.guild_id), str(ctx.channel.parent_id), str(ctx.channel_id)
@@ -214,16 +537,46 @@ Rolls three 20-sided dice and counts the value if it is below 14 / 12 / 13. Says
         ][:10]
         await ctx.send(choices=result)
 
-    def create_embeds(self, ctx: SlashContext, display_name: str, dice_pool: str):
+    async def create_embeds(self, ctx: SlashContext, display_name: str, dice_pool: str):
         """Create the embeds for the dice pool."""
         result_embeds = []
-        dice_description = dice_pool.split("#")[0].split(" ")
         comment = dice_pool.split("#")[1] if "#" in dice_pool else ""
-        dice_results = [
-            Parser(description.strip()).build_pool().roll()
-            for description in dice_description
-            if description.strip()
-        ]
+        limits = limits_for_guild(ctx.guild_id)
+        try:
+            plan = plan_roll(compile_dice_expressions(dice_pool), limits)
+        except DiceSyntaxError as error:
+            return [
+                Embed(
+                    title=localizer.translate(
+                        ctx.locale, "rolling_for_display_name", display_name=display_name
+                    ),
+                    description=self.describe_syntax_error(ctx, dice_pool, error),
+                    footer=f"{comment}",
+                )
+            ]
+        except RollLimitExceeded as error:
+            return [
+                Embed(
+                    title=localizer.translate(
+                        ctx.locale, "rolling_for_display_name", display_name=display_name
+                    ),
+                    description=localizer.translate(
+                        ctx.locale,
+                        "roll_limit_exceeded",
+                        dice=error.cost.dice,
+                        max_dice=limits.max_dice,
+                    ),
+                    footer=f"{comment}",
+                )
+            ]
+        with use_rng(rng_for_scope(ctx.channel_id, ctx.guild_id)):
+            dice_results = await run_roll(
+                plan.cost.expected_dice,
+                roll_dice_expressions,
+                plan.items,
+                MAX_EXPLOSION_DEPTH,
+                limits.max_explosion_dice,
+            )
 
         total_successes = sum(
             result.successes
@@ -233,8 +586,15 @@ Rolls three 20-sided dice and counts the value if it is below 14 / 12 / 13. Says
         total_sum = sum(
             result.sum * (-1 if isinstance(result, DicePoolExclusionsDifference) else 1)
             for result in dice_results
-            if isinstance(result, (DicePoolExclusionsSum, DicePoolExclusionsDifference))
+            if isinstance(
+                result, (DicePoolExclusionsSum, DicePoolExclusionsDifference, ExpressionResult)
+            )
         )
+        notes = ""
+        if plan.downgraded:
+            notes += "\n" + localizer.translate(ctx.locale, "roll_downgraded", dice=plan.cost.dice)
+        if plan.summary_only:
+            notes += "\n" + localizer.translate(ctx.locale, "roll_summary_only")
         embed = Embed(
             title=localizer.translate(
                 ctx.locale, "rolling_for_display_name", display_name=display_name
@@ -245,12 +605,21 @@ Rolls three 20-sided dice and counts the value if it is below 14 / 12 / 13. Says
                 dice_pool=dice_pool,
                 total_successes=total_successes,
                 total_sum=total_sum,
-            ),
+            )
+            + notes,
             footer=f"{comment}",
         )
         for result in dice_results:
-            embed.add_field(name=f"{result.description}:", value=result.formatted())
-            if len(embed.fields) > 24:
+            name = f"{result.description}:"
+            value = (
+                result.summarized()
+                if plan.summary_only
+                else result.formatted(budget=EMBED_FIELD_VALUE_LENGTH)
+            )
+            if embed.fields and (
+                len(embed.fields) >= EMBED_MAX_FIELDS
+                or embed_length(embed) + len(name) + len(value) > EMBED_TOTAL_MAX
+            ):
                 result_embeds.append(embed)
                 embed = Embed(
                     title=localizer.translate(
@@ -262,9 +631,11 @@ Rolls three 20-sided dice and counts the value if it is below 14 / 12 / 13. Says
                         dice_pool=dice_pool,
                         total_successes=total_successes,
                         total_sum=total_sum,
-                    ),
+                    )
+                    + notes,
                     footer=f"{comment}",
                 )
+            embed.add_field(name=name, value=value)
         if len(embed.fields) > 0:
             result_embeds.append(embed)
         return result_embeds
@@ -315,9 +686,4 @@ Rolls three 20-sided dice and counts the value if it is below 14 / 12 / 13. Says
             name=roll_name,
         )
         print('saving roll',db_object)
-        with Session(
-            engine,
-        ) as session:
-            session.add(db_object)
-            session.commit()
-        invalidate_cache()
+        await run_db_write(add_saved_roll, db_object)
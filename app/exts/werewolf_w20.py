@@ -22,11 +22,16 @@ from interactions import (
 )
 
 import app.localizer as localizer
+from app.library.database import run_db, run_db_write
 from app.library.polydice import (
     ExplodingBehavior,
     format_dice_success_result,
+    rng_for_scope,
     roll_dice_successes,
+    use_rng,
 )
+from app.library.roll_executor import run_roll, start_roll_executor
+from app.library.roll_limits import DEFAULT_MAX_DICE, limits_for_guild
 from app.library.werewolf_gifts import Gift, load_gifts, parse_json
 
 regex_pattern_gifts = re.compile(r"show_gift_(.*)")
@@ -40,8 +45,9 @@ class WerewolfW20(Extension):
     gift_names: list[str] = []
 
     async def async_start(self):
-        """Print a message when the extension is started."""
-        self.gifts = load_gifts()
+        """Print a message when the extension is started and start the workers for heavy rolls."""
+        start_roll_executor()
+        self.gifts = await run_db(load_gifts)
         self.gift_names = [gift.name.lower() for gift in self.gifts]
         print("Starting Werewolf Extension")
 
@@ -53,6 +59,8 @@ class WerewolfW20(Extension):
         description=LocalisedDesc(**localizer.translations("number_description")),
         required=False,
         opt_type=OptionType.INTEGER,
+        min_value=1,
+        max_value=DEFAULT_MAX_DICE,
     )
     @slash_option(
         name="difficulty",
@@ -93,16 +101,27 @@ class WerewolfW20(Extension):
 
     async def roll_ww(self, ctx:SlashContext, number: int, difficulty: int, ones_cancel: bool, specialty: bool, spent_willpower: bool):
         """Rolls a number of dice and counts the number of successes."""
+        limits = limits_for_guild(ctx.guild_id)
+        if number > limits.max_dice:
+            await ctx.send(
+                localizer.translate(
+                    ctx.locale, "roll_limit_exceeded", dice=number, max_dice=limits.max_dice
+                )
+            )
+            return
         exploding = ExplodingBehavior.PLUSSUCCESS if specialty else ExplodingBehavior.NONE
-        result = roll_dice_successes(
-            number,
-            10,
-            exploding,
-            ones_cancel,
-            0,
-            1 if spent_willpower else 0,
-            difficulty,
-        )
+        with use_rng(rng_for_scope(ctx.channel_id, ctx.guild_id)):
+            result = await run_roll(
+                number,
+                roll_dice_successes,
+                number,
+                10,
+                exploding,
+                ones_cancel,
+                0,
+                1 if spent_willpower else 0,
+                difficulty,
+            )
         color = 0xFFFFFF
         if result.successes < 0:
             color = 0xFF0000
@@ -237,7 +256,7 @@ class WerewolfW20(Extension):
     async def upload_gifts(self, ctx: SlashContext, file: Attachment):
         """Upload gifts from a CSV file."""
         content = await self.download_file(file.url, file.filename)
-        self.gifts = parse_json(content)
+        self.gifts = await run_db_write(parse_json, content)
         self.gift_names = [gift.name.lower() for gift in self.gifts]
         await ctx.send(
             localizer.translate(
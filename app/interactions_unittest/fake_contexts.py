@@ -189,7 +189,10 @@ class FakeSlashContext(SlashContext):
 
         if message_data:
             self.actions += (SendAction(message=message_data),)
-            message = Message.from_dict(deepcopy(message_data), self.client)
+            # like a real message, the cached one knows its channel, so it can be edited
+            message = Message.from_dict(
+                {**deepcopy(message_data), "channel_id": self.channel_id}, self.client
+            )
             self._fake_cache[message.id] = message
             return message
         raise ValueError("Cannot send an empty message")
@@ -400,3 +403,46 @@ class FakeComponentContext(FakeSlashContext):
         super().__init__(client)
         self.fake_custom_id = custom_id
         self.fake_message = message
+
+    async def edit_origin(
+        self,
+        *,
+        content: typing.Optional[str] = None,
+        embeds: typing.Optional[
+            typing.Union[
+                typing.Iterable[typing.Union["Embed", dict]],
+                typing.Union["Embed", dict],
+            ]
+        ] = None,
+        embed: typing.Optional[typing.Union["Embed", dict]] = None,
+        components: typing.Optional[
+            typing.Union[
+                typing.Iterable[typing.Iterable[typing.Union[BaseComponent, dict]]],
+                typing.Iterable[typing.Union[BaseComponent, dict]],
+                BaseComponent,
+                dict,
+            ]
+        ] = None,
+        allowed_mentions: typing.Optional[typing.Union[AllowedMentions, dict]] = None,
+        files: typing.Optional[
+            typing.Union[UPLOADABLE_TYPE, typing.Iterable[UPLOADABLE_TYPE]]
+        ] = None,
+        file: typing.Optional[UPLOADABLE_TYPE] = None,
+        tts: bool = False,
+    ) -> "interactions.Message":
+        """Edit the message the component was attached to."""
+        fake_process_files(files, file)
+        message_payload = process_message_payload(
+            content=content,
+            embeds=embeds or embed,
+            components=components,
+            allowed_mentions=allowed_mentions,
+            tts=tts,
+        )
+        self.fake_message.update_from_dict(message_payload)
+        self._fake_cache[self.fake_message.id] = self.fake_message
+        message_data = deepcopy(message_payload)
+        message_data["id"] = self.fake_message.id
+        self.deconstruct_embeds(message_data)
+        self.actions += (EditAction(message=message_data),)
+        return self.fake_message
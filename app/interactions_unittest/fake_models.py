@@ -196,7 +196,7 @@ class FakeChannel(GuildChannel):
 
     async def delete_message(self, message: "Snowflake_Type") -> None:
         """Delete a message from the channel."""
-        self.client.http.delete_message(self.id, message.id)
+        await self.client.http.delete_message(self.id, message.id)
         self.client.actions += (DeleteAction(message_id=message.id),)
         await sleep(0.001) # simulate a delay to make actions orderable
 
@@ -204,6 +204,12 @@ class FakeChannel(GuildChannel):
         """Get a message from the channel."""
         return self.client.fake_get_message(message_id)
 
+    async def fetch_message(
+        self, message_id: "Snowflake_Type", *, force: bool = False
+    ) -> typing.Optional["Message"]:
+        """Fetch a message from the channel, None if it was deleted."""
+        return self.client._fake_cache.get(to_snowflake(message_id))
+
     def __init__(self, *args, **kwargs):
         self.fake_guild_id = kwargs.pop("guild_id", 0)
         super().__init__(type=ChannelType.GUILD_TEXT, *args, **kwargs)
@@ -6,11 +6,14 @@ from enum import Enum
 
 from sqlalchemy import Boolean, DateTime
 from sqlalchemy import Enum as EnumDB
-from sqlalchemy import Integer, String
-from sqlalchemy.orm import Mapped, mapped_column
+from sqlalchemy import Index, Integer, String
+from sqlalchemy.orm import Mapped, mapped_column, validates
 
 from app.library.db_models import Base, Session
 
+# the highest code point, every string starting with a prefix sorts below prefix + PREFIX_END
+PREFIX_END = "\U0010ffff"
+
 
 class CategoryUser(Base):
     """
@@ -20,6 +23,7 @@ class CategoryUser(Base):
     """
 
     __tablename__ = "category_users"
+    __table_args__ = (Index("ix_category_users_user_id", "user_id"),)
     category_id: Mapped[str] = mapped_column(String, primary_key=True)
     user_id: Mapped[str] = mapped_column(String, primary_key=True)
     is_gm: Mapped[bool] = mapped_column(Boolean, default=False)
@@ -163,14 +167,24 @@ class CharacterHeader(Base):
     """ A class representing the header in a charactersheet. """
 
     __tablename__ = "character_headers"
+    __table_args__ = (
+        Index("ix_character_headers_category_id_name_lower", "category_id", "name_lower"),
+    )
     user_id: Mapped[str] = mapped_column(String, primary_key=True)
     category_id: Mapped[str] = mapped_column(String, primary_key=True)
     name: Mapped[str] = mapped_column(String, primary_key=True)
+    name_lower: Mapped[str] = mapped_column(String)
     concept: Mapped[str] = mapped_column(String)
     description: Mapped[str] = mapped_column(String)
     image_url: Mapped[str] = mapped_column(String)
     is_inactive: Mapped[bool] = mapped_column(Boolean, default=False)
 
+    @validates("name")
+    def _normalize_name(self, key: str, name: str) -> str:
+        """ Keep name_lower in sync with the name, it is the indexed column for name lookups. """
+        self.name_lower = name.lower()
+        return name
+
     @staticmethod
     def create(
         user_id: str,
@@ -222,13 +236,30 @@ class CharacterHeader(Base):
 
     @staticmethod
     def find_by_name(category_id: str, name: str) -> list["CharacterHeader"]:
-        """ Find all character headers by name in a category. """
+        """
+        Find all character headers by name in a category, ignoring case.
+
+        Names starting with name are looked up as a range of the index on (category_id, name_lower).
+        Only if none starts with it, all names of the category containing name are returned.
+        """
+        name_lower = name.lower()
         with Session() as session:
+            by_prefix = (
+                session.query(CharacterHeader)
+                .filter(
+                    CharacterHeader.category_id == category_id,
+                    CharacterHeader.name_lower >= name_lower,
+                    CharacterHeader.name_lower < name_lower + PREFIX_END,
+                )
+                .all()
+            )
+            if by_prefix:
+                return by_prefix
             return (
                 session.query(CharacterHeader)
                 .filter(
                     CharacterHeader.category_id == category_id,
-                    CharacterHeader.name.ilike(f"%{name}%"),
+                    CharacterHeader.name_lower.contains(name_lower, autoescape=True),
                 )
                 .all()
             )
@@ -309,6 +340,9 @@ class CharactersheetEntry(Base):
     """ A class representing an entry in a charactersheet. """
 
     __tablename__ = "charactersheet_entries"
+    __table_args__ = (
+        Index("ix_charactersheet_entries_category_id_user_id_name", "category_id", "user_id", "name"),
+    )
     user_id: Mapped[str] = mapped_column(String, primary_key=True)
     category_id: Mapped[str] = mapped_column(String, primary_key=True)
     name: Mapped[str] = mapped_column(String, primary_key=True)
@@ -482,6 +516,9 @@ class SheetModification(Base):
     """
 
     __tablename__ = "sheet_modifications"
+    __table_args__ = (
+        Index("ix_sheet_modifications_category_id_user_id_name", "category_id", "user_id", "name"),
+    )
     user_id: Mapped[str] = mapped_column(String, primary_key=True)
     category_id: Mapped[str] = mapped_column(String, primary_key=True)
     name: Mapped[str] = mapped_column(String, primary_key=True)
@@ -938,6 +975,7 @@ class RuleSystemSuggestions(Base):
     """
 
     __tablename__ = "rule_system_suggestions"
+    __table_args__ = (Index("ix_rule_system_suggestions_rule_system", "rule_system"),)
     id: Mapped[str] = mapped_column(String, primary_key=True)
     rule_system: Mapped[str] = mapped_column(String)
     suggested_key: Mapped[str] = mapped_column(String)
@@ -1,4 +1,6 @@
+import re
 from enum import Enum
+from functools import lru_cache
 
 from app.library.polydice import ComplexPool, ExplodingBehavior
 
@@ -37,6 +39,15 @@ class ParsingState(Enum):
 # ++/-- to add a modifier to each dice result
 
 
+class DiceSyntaxError(ValueError):
+    """Raised when a dice description contains an unknown token, remembering where it was found."""
+
+    def __init__(self, token: str, position: int):
+        super().__init__(f"Unknown token {token}")
+        self.token = token
+        self.position = position
+
+
 class Parser:
     tokens = {
         "w": ParsingState.SIDES,
@@ -57,6 +68,11 @@ class Parser:
         "--": ParsingState.DICE_MALUS,
     }
     tokens_list = sorted(tokens.keys(), key=len, reverse=True)
+    # longer tokens first, so "!!" wins over "!"
+    token_pattern = "|".join(re.escape(token) for token in tokens_list)
+    description_scanner = re.compile(r"[^\s#]+|#")
+    valid_prefix = re.compile(rf"(\d*)(?:(?:{token_pattern})\d*)*")
+    token_scanner = re.compile(rf"({token_pattern})(\d*)")
     state: ParsingState = ParsingState.NUMBER
     tokens_found: list[tuple[ParsingState, int]] = []
     stack: str = ""
@@ -66,62 +82,120 @@ class Parser:
         self.input_string = description
         self.state = ParsingState.NUMBER
         self.stack = ""
-        self.tokens_found = []
-        while description:
-            if description[0].isdigit():
-                self.stack += description[0]
-                description = description[1:]
-            else:
-                self.tokens_found.append((self.state, int(self.stack) if self.stack else 1))
-                self.stack = ""
-                self.state = ParsingState.NONE
-                for token in self.tokens_list:
-                    if description.startswith(token):
-                        self.state = self.tokens[token]
-                        description = description[len(token) :]
-                        break
-                else:
-                    raise ValueError(f"Unknown token {description[0]}")
-        if self.stack:
-            self.tokens_found.append((self.state, int(self.stack) if self.stack else 1))
-            self.stack = ""
+        pools = Parser.tokenize(description, allow_separators=False)
+        self.tokens_found = pools[0][1] if pools else []
+
+    @staticmethod
+    def tokenize(
+        dice_pool: str, allow_separators: bool = True
+    ) -> list[tuple[str, list[tuple[ParsingState, int]]]]:
+        """
+        Splits a dice pool string into its descriptions and their tokens using the precompiled scanners.
+
+        A token without a number counts as 1, except for the last token of a description, which is dropped.
+        Whitespace separates descriptions and a # starts a comment that is ignored.
+
+        Args:
+            dice_pool (str): The dice pool string to tokenize.
+            allow_separators (bool): If False, whitespace and # are unknown tokens like any other character.
+
+        Returns:
+            The text and the tokens of every description, in order.
+
+        Raises:
+            DiceSyntaxError: If an unknown token is found, with its position in dice_pool.
+        """
+        if not allow_separators:
+            descriptions = [(dice_pool, 0)] if dice_pool else []
+        else:
+            descriptions = []
+            for match in Parser.description_scanner.finditer(dice_pool):
+                if match.group() == "#":
+                    break
+                descriptions.append((match.group(), match.start()))
+        pools = []
+        for description, position in descriptions:
+            match = Parser.valid_prefix.match(description)
+            if match.end() < len(description):
+                raise DiceSyntaxError(description[match.end()], position + match.end())
+            tokens_found = []
+            state = ParsingState.NUMBER
+            number = match.group(1)
+            for token, token_number in Parser.token_scanner.findall(description, match.end(1)):
+                tokens_found.append((state, int(number) if number else 1))
+                state = Parser.tokens[token]
+                number = token_number
+            if number:
+                tokens_found.append((state, int(number)))
+            pools.append((description, tokens_found))
+        return pools
 
     @staticmethod
-    def insert_token_data(pool:ComplexPool,token:tuple[ParsingState,int]):
+    def insert_token_data(fields: dict, token: tuple[ParsingState, int]):
+        """Writes the data of a token into the keyword arguments for a ComplexPool."""
         if token[0] == ParsingState.SUCCESS:
-            pool.success_threshold = token[1]
+            fields["success_threshold"] = token[1]
         elif token[0] == ParsingState.FAILURE:
-            pool.failure_threshold = token[1]
+            fields["failure_threshold"] = token[1]
         elif token[0] == ParsingState.EXPLODE:
-            pool.explode = ExplodingBehavior.ONCE
-            pool.explode_threshold = token[1]
+            fields["explode"] = ExplodingBehavior.ONCE
+            fields["explode_threshold"] = token[1]
         elif token[0] == ParsingState.EXPLODE_CASC:
-            pool.explode = ExplodingBehavior.CASCADING
-            pool.explode_threshold = token[1]
+            fields["explode"] = ExplodingBehavior.CASCADING
+            fields["explode_threshold"] = token[1]
         elif token[0] == ParsingState.HIGHEST:
-            pool.highest_count = token[1]
+            fields["highest_count"] = token[1]
         elif token[0] == ParsingState.LOWEST:
-            pool.lowest_count = token[1]
+            fields["lowest_count"] = token[1]
         elif token[0] == ParsingState.POOL_BONUS:
-            pool.pool_modifier += token[1]
+            fields["pool_modifier"] = fields.get("pool_modifier", 0) + token[1]
         elif token[0] == ParsingState.POOL_MALUS:
-            pool.pool_modifier -= token[1]
+            fields["pool_modifier"] = fields.get("pool_modifier", 0) - token[1]
         elif token[0] == ParsingState.DICE_BONUS:
-            pool.dice_modifier += token[1]
+            fields["dice_modifier"] = fields.get("dice_modifier", 0) + token[1]
         elif token[0] == ParsingState.DICE_MALUS:
-            pool.dice_modifier -= token[1]
+            fields["dice_modifier"] = fields.get("dice_modifier", 0) - token[1]
         elif token[0] == ParsingState.NUMBER:
-            pool.number = token[1]
+            fields["number"] = token[1]
         elif token[0] == ParsingState.SIDES:
-            pool.sides = token[1]
+            fields["sides"] = token[1]
         elif token[0] == ParsingState.ABOVE:
-            pool.count_above = token[1]
+            fields["count_above"] = token[1]
         elif token[0] == ParsingState.BELOW:
-            pool.count_below = token[1]
+            fields["count_below"] = token[1]
+
+    @staticmethod
+    def pool_from_tokens(description: str, tokens: list[tuple[ParsingState, int]]) -> ComplexPool:
+        """Builds the immutable ComplexPool described by the tokens."""
+        fields = {"description": description}
+        for token in tokens:
+            Parser.insert_token_data(fields, token)
+        return ComplexPool(**fields)
+
+    def build_pool(self) -> ComplexPool:
+        """Builds the immutable ComplexPool described by the parsed tokens."""
+        return Parser.pool_from_tokens(self.input_string, self.tokens_found)
+
+
+@lru_cache(maxsize=1024)
+def compile_pool(description: str) -> ComplexPool:
+    """
+    Parses a single dice description into a ComplexPool, caching the result by the raw string.
+
+    Since ComplexPool is immutable, the cached plan can be rolled as often as needed without parsing again.
+    """
+    return Parser(description).build_pool()
+
 
+@lru_cache(maxsize=1024)
+def compile_dice_pool(dice_pool: str) -> tuple[ComplexPool, ...]:
+    """
+    Parses a dice pool string (descriptions separated by spaces, optionally followed by a # comment) in one pass.
 
-    def build_pool(self):
-        pool = ComplexPool(description=self.input_string)
-        for token in self.tokens_found:
-            Parser.insert_token_data(pool,token)
-        return pool
+    Returns:
+        A tuple with the compiled ComplexPool of every description, in order.
+    """
+    return tuple(
+        Parser.pool_from_tokens(description, tokens)
+        for description, tokens in Parser.tokenize(dice_pool)
+    )
@@ -0,0 +1,240 @@
+"""
+This module provides the single database engine and session factory shared by all model modules.
+
+The engine is configured with environment variables:
+
+DB_CONNECTION_STRING
+    The SQLAlchemy URL of the database (default sqlite:///gifts.db).
+DB_POOL_SIZE, DB_MAX_OVERFLOW, DB_POOL_RECYCLE
+    The number of kept connections, the extra connections allowed under load and the seconds after
+    which a connection is replaced.
+DB_POOL_PRE_PING
+    If 1 (default), connections are checked before use, so dropped connections are replaced silently.
+DB_STATEMENT_TIMEOUT_MS
+    Statements running longer are aborted (0 disables the timeout).
+DB_LOG_LEVEL
+    WARNING (default) logs nothing, INFO logs every statement and DEBUG also logs the result rows.
+DB_SQLITE_TUNING
+    If 1 (default), sqlite connections use the WAL journal, synchronous=NORMAL, memory mapping,
+    a bigger page cache and a busy timeout, sized by DB_SQLITE_MMAP_SIZE (bytes),
+    DB_SQLITE_CACHE_KIB and DB_SQLITE_BUSY_TIMEOUT_MS.
+"""
+import asyncio
+import functools
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Optional
+
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.orm import sessionmaker
+
+CONNECTION_STRING = os.getenv("DB_CONNECTION_STRING", "sqlite:///gifts.db")
+POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "5"))
+MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+POOL_RECYCLE = int(os.getenv("DB_POOL_RECYCLE", "1800"))
+POOL_PRE_PING = os.getenv("DB_POOL_PRE_PING", "1") == "1"
+STATEMENT_TIMEOUT_MS = int(os.getenv("DB_STATEMENT_TIMEOUT_MS", "5000"))
+LOG_LEVEL = os.getenv("DB_LOG_LEVEL", "WARNING").upper()
+SQLITE_TUNING = os.getenv("DB_SQLITE_TUNING", "1") == "1"
+SQLITE_MMAP_SIZE = int(os.getenv("DB_SQLITE_MMAP_SIZE", str(256 * 1024 * 1024)))
+SQLITE_CACHE_KIB = int(os.getenv("DB_SQLITE_CACHE_KIB", str(64 * 1024)))
+SQLITE_BUSY_TIMEOUT_MS = int(os.getenv("DB_SQLITE_BUSY_TIMEOUT_MS", "5000"))
+
+# sqlite calls the progress handler every this many virtual machine instructions
+SQLITE_PROGRESS_INSTRUCTIONS = 10000
+
+
+def engine_options(
+    connection_string: str = CONNECTION_STRING,
+    statement_timeout_ms: int = STATEMENT_TIMEOUT_MS,
+    log_level: str = LOG_LEVEL,
+) -> dict[str, Any]:
+    """
+    Builds the keyword arguments for create_engine.
+
+    Parameters:
+    -----------
+    connection_string : str
+        The SQLAlchemy URL of the database.
+    statement_timeout_ms : int
+        The statement timeout in milliseconds, 0 disables it.
+    log_level : str
+        WARNING, INFO or DEBUG.
+
+    Returns:
+    --------
+    dict[str, Any]
+        The keyword arguments for create_engine.
+    """
+    url = make_url(connection_string)
+    options: dict[str, Any] = {
+        "echo": {"DEBUG": "debug", "INFO": True}.get(log_level, False),
+        "pool_pre_ping": POOL_PRE_PING,
+    }
+    in_memory = url.get_backend_name() == "sqlite" and url.database in (None, "", ":memory:")
+    if not in_memory:
+        options.update(pool_size=POOL_SIZE, max_overflow=MAX_OVERFLOW, pool_recycle=POOL_RECYCLE)
+    if url.get_backend_name() == "postgresql" and statement_timeout_ms:
+        options["connect_args"] = {"options": f"-c statement_timeout={statement_timeout_ms}"}
+    return options
+
+
+def create_database_engine(
+    connection_string: str = CONNECTION_STRING,
+    statement_timeout_ms: int = STATEMENT_TIMEOUT_MS,
+    log_level: str = LOG_LEVEL,
+) -> Engine:
+    """
+    Creates an engine with the pool, timeout and logging settings.
+
+    sqlite has no statement timeout of its own, so a progress handler interrupts statements running
+    longer than statement_timeout_ms.
+
+    Parameters:
+    -----------
+    connection_string : str
+        The SQLAlchemy URL of the database.
+    statement_timeout_ms : int
+        The statement timeout in milliseconds, 0 disables it.
+    log_level : str
+        WARNING, INFO or DEBUG.
+
+    Returns:
+    --------
+    Engine
+        The configured engine.
+    """
+    new_engine = create_engine(
+        connection_string, **engine_options(connection_string, statement_timeout_ms, log_level)
+    )
+    if new_engine.dialect.name == "sqlite" and statement_timeout_ms:
+        _add_sqlite_statement_timeout(new_engine, statement_timeout_ms / 1000)
+    if new_engine.dialect.name == "sqlite" and SQLITE_TUNING:
+        _add_sqlite_pragmas(new_engine, sqlite_pragmas(new_engine.url.database))
+    return new_engine
+
+
+def sqlite_pragmas(database: Optional[str]) -> list[str]:
+    """
+    Builds the PRAGMA statements that tune every new sqlite connection.
+
+    WAL lets readers work while a write is running and, together with synchronous=NORMAL, only
+    syncs to disk at checkpoints instead of on every commit. In-memory databases have no journal
+    on disk, so they only get the cache and busy timeout.
+
+    Parameters:
+    -----------
+    database : Optional[str]
+        The path of the database file, None or ":memory:" for in-memory databases.
+
+    Returns:
+    --------
+    list[str]
+        The PRAGMA statements, in order.
+    """
+    pragmas = [
+        f"PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT_MS}",
+        f"PRAGMA cache_size = {-SQLITE_CACHE_KIB}",
+    ]
+    if database not in (None, "", ":memory:"):
+        pragmas += [
+            "PRAGMA journal_mode = WAL",
+            "PRAGMA synchronous = NORMAL",
+            f"PRAGMA mmap_size = {SQLITE_MMAP_SIZE}",
+        ]
+    return pragmas
+
+
+def _add_sqlite_pragmas(sqlite_engine: Engine, pragmas: list[str]):
+    """Runs the pragmas on every new sqlite connection."""
+
+    @event.listens_for(sqlite_engine, "connect")
+    def apply_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for pragma in pragmas:
+            cursor.execute(pragma)
+        cursor.close()
+
+
+def _add_sqlite_statement_timeout(sqlite_engine: Engine, timeout: float):
+    """Interrupts sqlite statements that run longer than timeout seconds."""
+
+    @event.listens_for(sqlite_engine, "connect")
+    def install_progress_handler(dbapi_connection, connection_record):
+        connection_record.info["statement_deadline"] = float("inf")
+        dbapi_connection.set_progress_handler(
+            lambda: time.monotonic() > connection_record.info["statement_deadline"],
+            SQLITE_PROGRESS_INSTRUCTIONS,
+        )
+
+    @event.listens_for(sqlite_engine, "before_cursor_execute")
+    def start_deadline(connection, cursor, statement, parameters, context, executemany):
+        connection.connection.info["statement_deadline"] = time.monotonic() + timeout
+
+    # rows are computed while they are fetched, so the deadline only ends when the connection is returned
+    @event.listens_for(sqlite_engine, "checkin")
+    def stop_deadline(dbapi_connection, connection_record):
+        connection_record.info["statement_deadline"] = float("inf")
+
+
+async def run_db(function: Callable, *args, **kwargs):
+    """
+    Runs a blocking database function in the database threads and awaits its result.
+
+    Slash command callbacks use this for every query, so the event loop keeps serving other guilds
+    while the database works. There are as many threads as pooled connections.
+
+    Parameters:
+    -----------
+    function : Callable
+        The database function, e.g. CategorySetting.get_by_category.
+    *args, **kwargs
+        The arguments for the function.
+
+    Returns:
+    --------
+    Any
+        The result of the function.
+    """
+    return await asyncio.get_running_loop().run_in_executor(
+        _db_executor, functools.partial(function, *args, **kwargs)
+    )
+
+
+async def run_db_write(function: Callable, *args, **kwargs):
+    """
+    Runs a blocking database function that writes, like run_db.
+
+    sqlite only allows one writer at a time, so with sqlite all writes wait in a single queue instead
+    of competing for the lock (and failing with "database is locked"). Other databases handle
+    concurrent writes themselves and use the shared database threads.
+
+    Parameters:
+    -----------
+    function : Callable
+        The database function, e.g. CategorySetting.update.
+    *args, **kwargs
+        The arguments for the function.
+
+    Returns:
+    --------
+    Any
+        The result of the function.
+    """
+    return await asyncio.get_running_loop().run_in_executor(
+        _write_executor, functools.partial(function, *args, **kwargs)
+    )
+
+
+engine = create_database_engine()
+
+Session = sessionmaker(bind=engine, expire_on_commit=False)
+
+_db_executor = ThreadPoolExecutor(max_workers=POOL_SIZE, thread_name_prefix="database")
+_write_executor = (
+    ThreadPoolExecutor(max_workers=1, thread_name_prefix="database-writer")
+    if engine.dialect.name == "sqlite"
+    else _db_executor
+)
@@ -1,12 +1,6 @@
-import os
+from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column
 
-from sqlalchemy import create_engine
-from sqlalchemy.orm import DeclarativeBase, Mapped, mapped_column, sessionmaker
-
-# create engine
-engine = create_engine(os.getenv("DB_CONNECTION_STRING", "sqlite:///gifts.db"), echo=False)
-
-Session = sessionmaker(bind=engine, expire_on_commit=False)
+from app.library.database import Session, engine
 
 
 class Base(DeclarativeBase):
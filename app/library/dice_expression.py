@@ -0,0 +1,303 @@
+"""
+A library for arithmetic expressions of complex dice pools like 2d6+1d8+3 or (3d6h2)*2.
+
+Expressions are compiled once into an immutable tree of pools, constants and operators. Rolling
+an expression rolls all of its pools through a single roll_many call and evaluates the tree.
+"""
+import re
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Optional, Sequence, Union
+
+from app.library.complex_dice_parser import DiceSyntaxError, Parser, compile_pool
+from app.library.polydice import (
+    MAX_EXPLOSION_DEPTH,
+    MAX_EXPLOSION_DICE,
+    ComplexPool,
+    DicePoolExclusionsDifference,
+    RollCost,
+    roll_many,
+)
+
+# the pool alternative does not contain single + and -, those are operators in expressions
+expression_scanner = re.compile(
+    r"(?P<pool>\d*[dDwW]\d*(?:(?:!!|\+\+|--|[sf<>!hb])\d*)*)"
+    r"|(?P<number>\d+)|(?P<operator>[-+*/()])|(?P<separator>\s+)|(?P<unknown>.)",
+    re.DOTALL,
+)
+# a description needs the expression compiler if it uses brackets, * and /, or adds pools together
+expression_marker = re.compile(r"[()*/]|(?<![+-])[+-](?![+-])\d*[dDwW]")
+
+
+@dataclass(frozen=True)
+class Constant:
+    """A constant number in an expression."""
+
+    value: int
+
+    def evaluate(self, values: Sequence):
+        return self.value
+
+
+@dataclass(frozen=True)
+class PoolLeaf:
+    """A dice pool in an expression, its value is the value of the pool result at index."""
+
+    index: int
+
+    def evaluate(self, values: Sequence):
+        return values[self.index]
+
+
+@dataclass(frozen=True)
+class Negation:
+    """The negative value of an expression."""
+
+    operand: "Node"
+
+    def evaluate(self, values: Sequence):
+        return -self.operand.evaluate(values)
+
+
+@dataclass(frozen=True)
+class BinaryOperation:
+    """An operation (+, -, * or / rounding down) on two expressions."""
+
+    operator: str
+    left: "Node"
+    right: "Node"
+
+    def evaluate(self, values: Sequence):
+        left = self.left.evaluate(values)
+        right = self.right.evaluate(values)
+        if self.operator == "+":
+            return left + right
+        if self.operator == "-":
+            return left - right
+        if self.operator == "*":
+            return left * right
+        return left // right
+
+
+Node = Union[Constant, PoolLeaf, Negation, BinaryOperation]
+
+
+@dataclass(frozen=True)
+class DiceExpression:
+    """An immutable, compiled arithmetic expression of dice pools."""
+
+    description: str
+    root: Node
+    pools: tuple[ComplexPool, ...]
+
+    def evaluate(self, values: Sequence):
+        """
+        Evaluates the expression for the given values of its pools.
+
+        Works with ints as well as with NumPy arrays (one value per simulated roll).
+        """
+        return self.root.evaluate(values)
+
+    def estimate_cost(
+        self, max_depth: int = MAX_EXPLOSION_DEPTH, dice_budget: int = MAX_EXPLOSION_DICE
+    ) -> RollCost:
+        """Predicts the cost of rolling all pools of the expression without rolling them."""
+        cost = RollCost(output_characters=len(self.description) + 12)
+        for pool in self.pools:
+            cost += pool.estimate_cost(max_depth, dice_budget)
+        return cost
+
+    def roll(
+        self, max_depth: int = MAX_EXPLOSION_DEPTH, dice_budget: int = MAX_EXPLOSION_DICE
+    ) -> "ExpressionResult":
+        """Rolls all pools of the expression at once and returns the result."""
+        return self.result_from_pool_results(roll_many(self.pools, max_depth, dice_budget))
+
+    def result_from_pool_results(self, results: list) -> "ExpressionResult":
+        """Builds the result of the expression from the already rolled results of its pools."""
+        return ExpressionResult(
+            self.description, results, int(self.evaluate([pool_value(result) for result in results]))
+        )
+
+
+@dataclass
+class ExpressionResult:
+    """Represents the result of rolling a dice expression."""
+
+    description: str
+    results: list
+    value: int
+
+    @property
+    def sum(self) -> int:
+        """Returns the value of the expression."""
+        return self.value
+
+    def formatted(self, budget: Optional[int] = None) -> str:
+        """Returns the formatted results of all pools followed by the value, shortened to at most budget characters."""
+        suffix = f"= {self.value}"
+        lines = []
+        for result in self.results:
+            prefix = f"{result.description}: "
+            pool_budget = None
+            if budget is not None:
+                pool_budget = max((budget - len(suffix)) // len(self.results) - len(prefix) - 1, 0)
+            lines.append(f"{prefix}{result.formatted(pool_budget)}")
+        return "\n".join(lines + [suffix])
+
+    def summarized(self) -> str:
+        """Returns only the number of dice and the result of every pool followed by the value."""
+        lines = [f"{result.description}: {result.summarized()}" for result in self.results]
+        return "\n".join(lines + [f"= {self.value}"])
+
+
+def pool_value(result) -> int:
+    """Returns the value a pool result contributes to an expression, counted like the totals of /roll_complex."""
+    if isinstance(result, DicePoolExclusionsDifference):
+        return -result.sum
+    return result.total
+
+
+def is_expression(description: str) -> bool:
+    """Returns True if the description needs the expression compiler instead of being a single pool."""
+    return expression_marker.search(description) is not None
+
+
+class _ExpressionParser:
+    """A recursive descent parser for dice expressions."""
+
+    def __init__(self, description: str):
+        self.tokens = []
+        for match in expression_scanner.finditer(description):
+            if match.lastgroup == "unknown":
+                raise DiceSyntaxError(match.group(), match.start())
+            if match.lastgroup != "separator":
+                self.tokens.append((match.lastgroup, match.group(), match.start()))
+        self.tokens.append(("end", "", len(description)))
+        self.position = 0
+        self.pools: list[ComplexPool] = []
+
+    def peek(self) -> tuple[str, str, int]:
+        return self.tokens[self.position]
+
+    def take(self) -> tuple[str, str, int]:
+        token = self.tokens[self.position]
+        self.position += 1
+        return token
+
+    def parse(self) -> Node:
+        root = self.expression()
+        kind, text, position = self.peek()
+        if kind != "end":
+            raise DiceSyntaxError(text, position)
+        return root
+
+    def expression(self) -> Node:
+        node = self.term()
+        while self.peek()[1] in {"+", "-"}:
+            operator = self.take()[1]
+            node = BinaryOperation(operator, node, self.term())
+        return node
+
+    def term(self) -> Node:
+        node = self.factor()
+        while self.peek()[1] in {"*", "/"}:
+            _, operator, position = self.take()
+            right = self.factor()
+            if operator == "/" and not (isinstance(right, Constant) and right.value > 0):
+                raise DiceSyntaxError(operator, position)
+            node = BinaryOperation(operator, node, right)
+        return node
+
+    def factor(self) -> Node:
+        kind, text, position = self.take()
+        if text == "-":
+            return Negation(self.factor())
+        if text == "(":
+            node = self.expression()
+            closing_kind, closing_text, closing_position = self.take()
+            if closing_text != ")":
+                raise DiceSyntaxError(closing_text or "(", closing_position)
+            return node
+        if kind == "number":
+            return Constant(int(text))
+        if kind == "pool":
+            self.pools.append(compile_pool(text))
+            return PoolLeaf(len(self.pools) - 1)
+        raise DiceSyntaxError(text or "(", position)
+
+
+@lru_cache(maxsize=1024)
+def compile_expression(description: str) -> DiceExpression:
+    """
+    Compiles an arithmetic expression of dice pools, caching the result by the raw string.
+
+    Supports +, -, * and / (rounding down, only by positive constants), brackets and negation.
+    Pools use the /roll_complex syntax, except that single + and - are operators.
+
+    Raises:
+        DiceSyntaxError: If the expression can not be parsed, with the position of the problem.
+    """
+    parser = _ExpressionParser(description)
+    root = parser.parse()
+    return DiceExpression(description, root, tuple(parser.pools))
+
+
+@lru_cache(maxsize=1024)
+def compile_dice_expressions(dice_pool: str) -> tuple[Union[ComplexPool, DiceExpression], ...]:
+    """
+    Compiles a dice pool string like compile_dice_pool, but descriptions using arithmetic become DiceExpressions.
+
+    Expressions must not contain whitespace, since whitespace separates the descriptions.
+
+    Returns:
+        A tuple with a ComplexPool or DiceExpression for every description, in order.
+
+    Raises:
+        DiceSyntaxError: If a description can not be parsed, with the position in dice_pool.
+    """
+    items = []
+    for match in Parser.description_scanner.finditer(dice_pool):
+        description = match.group()
+        if description == "#":
+            break
+        try:
+            items.append(
+                compile_expression(description)
+                if is_expression(description)
+                else compile_pool(description)
+            )
+        except DiceSyntaxError as error:
+            raise DiceSyntaxError(error.token, match.start() + error.position) from error
+    return tuple(items)
+
+
+def roll_dice_expressions(
+    items: Sequence[Union[ComplexPool, DiceExpression]],
+    max_depth: int = MAX_EXPLOSION_DEPTH,
+    dice_budget: int = MAX_EXPLOSION_DICE,
+) -> list:
+    """
+    Rolls pools and expressions together, with a single roll_many call for all pools they contain.
+
+    Args:
+        items (Sequence[Union[ComplexPool, DiceExpression]]): The pools and expressions to roll.
+        max_depth (int): The maximum number of generations of cascading explosions.
+        dice_budget (int): The maximum number of extra dice added by exploding, per pool.
+
+    Returns:
+        A pool result for every ComplexPool and an ExpressionResult for every DiceExpression, in order.
+    """
+    pools = []
+    for item in items:
+        pools.extend(item.pools if isinstance(item, DiceExpression) else [item])
+    pool_results = iter(roll_many(pools, max_depth, dice_budget))
+    results = []
+    for item in items:
+        if isinstance(item, DiceExpression):
+            results.append(
+                item.result_from_pool_results([next(pool_results) for _ in item.pools])
+            )
+        else:
+            results.append(next(pool_results))
+    return results
@@ -0,0 +1,491 @@
+"""
+A library for calculating the exact probability distribution of complex dice pools and expressions.
+
+The work grows with the number of states: the dice times the sides of the pool, and for pools keeping
+their highest or lowest dice the sides times the squared kept dice of the dynamic program in
+_kept_extremes. Pools with more states than MAX_ODDS_OUTCOMES or MAX_ODDS_KEEP_STATES are rejected
+before anything is calculated.
+"""
+import math
+import os
+from dataclasses import dataclass
+from typing import Union
+
+import numpy as np
+
+from app.library.dice_expression import (
+    Constant,
+    DiceExpression,
+    Negation,
+    Node,
+    PoolLeaf,
+)
+from app.library.polydice import ComplexPool, ExplodingBehavior
+
+DEFAULT_EXPLOSION_DEPTH = 20
+NEGLIGIBLE_PROBABILITY = 1e-18
+FFT_CONVOLUTION_SIZE = 512
+CHART_TAIL_PROBABILITY = 0.0005
+# about a second of calculation each
+MAX_ODDS_OUTCOMES = int(os.getenv("DICE_MAX_ODDS_OUTCOMES", str(5 * 10**6)))
+MAX_ODDS_KEEP_STATES = int(os.getenv("DICE_MAX_ODDS_KEEP_STATES", "10000"))
+
+
+class OddsTooExpensive(ValueError):
+    """Raised when calculating the exact distribution of a pool would take too long."""
+
+    def __init__(self, states: int, max_states: int):
+        super().__init__(states, max_states)
+        self.states = states
+        self.max_states = max_states
+
+    def __str__(self) -> str:
+        return f"{self.states} states, at most {self.max_states} allowed"
+
+
+@dataclass
+class OutcomeDistribution:
+    """Represents a probability distribution over consecutive integer outcomes, starting at the offset."""
+
+    offset: int
+    probabilities: np.ndarray
+
+    @staticmethod
+    def certain(outcome: int = 0) -> "OutcomeDistribution":
+        """Returns the distribution of an outcome that always happens."""
+        return OutcomeDistribution(outcome, np.ones(1))
+
+    @staticmethod
+    def uniform(scores: np.ndarray) -> "OutcomeDistribution":
+        """Returns the distribution of picking one of the scores with equal probability."""
+        offset = int(scores.min())
+        return OutcomeDistribution(offset, np.bincount(scores - offset) / len(scores))
+
+    @property
+    def outcomes(self) -> np.ndarray:
+        """Returns all outcomes covered by the distribution."""
+        return np.arange(self.offset, self.offset + len(self.probabilities))
+
+    @property
+    def mean(self) -> float:
+        """Returns the expected outcome."""
+        return float(np.dot(self.outcomes, self.probabilities))
+
+    @property
+    def standard_deviation(self) -> float:
+        """Returns the standard deviation of the outcome."""
+        return math.sqrt(
+            max(float(np.dot((self.outcomes - self.mean) ** 2, self.probabilities)), 0.0)
+        )
+
+    def probability(self, outcome: int) -> float:
+        """Returns the probability of exactly this outcome."""
+        index = outcome - self.offset
+        return float(self.probabilities[index]) if 0 <= index < len(self.probabilities) else 0.0
+
+    def at_least(self, outcome: int) -> float:
+        """Returns the probability of an outcome greater than or equal to the given one."""
+        return float(self.probabilities[max(outcome - self.offset, 0) :].sum())
+
+    def shifted(self, amount: int) -> "OutcomeDistribution":
+        """Returns the distribution with every outcome increased by amount."""
+        return OutcomeDistribution(self.offset + amount, self.probabilities)
+
+    def scaled(self, weight: float) -> "OutcomeDistribution":
+        """Returns the distribution with every probability multiplied by weight."""
+        return OutcomeDistribution(self.offset, self.probabilities * weight)
+
+    def negated(self) -> "OutcomeDistribution":
+        """Returns the distribution of the negative outcome."""
+        return OutcomeDistribution(1 - self.offset - len(self.probabilities), self.probabilities[::-1])
+
+    def convolve(self, other: "OutcomeDistribution") -> "OutcomeDistribution":
+        """Returns the distribution of the sum of two independent outcomes."""
+        if min(len(self.probabilities), len(other.probabilities)) < FFT_CONVOLUTION_SIZE:
+            probabilities = np.convolve(self.probabilities, other.probabilities)
+        else:
+            size = len(self.probabilities) + len(other.probabilities) - 1
+            probabilities = np.fft.irfft(
+                np.fft.rfft(self.probabilities, size) * np.fft.rfft(other.probabilities, size),
+                size,
+            ).clip(min=0)
+        return OutcomeDistribution(self.offset + other.offset, probabilities).trimmed()
+
+    def power(self, count: int) -> "OutcomeDistribution":
+        """Returns the distribution of the sum of count independent outcomes."""
+        result = OutcomeDistribution.certain()
+        base = self
+        while count:
+            if count & 1:
+                result = result.convolve(base)
+            count >>= 1
+            if count:
+                base = base.convolve(base)
+        return result
+
+    def trimmed(self) -> "OutcomeDistribution":
+        """Returns the distribution without negligible outcomes at both ends."""
+        relevant = np.flatnonzero(self.probabilities > NEGLIGIBLE_PROBABILITY)
+        if not len(relevant):
+            return self
+        return OutcomeDistribution(
+            self.offset + int(relevant[0]), self.probabilities[relevant[0] : relevant[-1] + 1]
+        )
+
+
+def gather(outcomes: np.ndarray, probabilities: np.ndarray) -> OutcomeDistribution:
+    """
+    Adds up the probabilities of arbitrary (repeated or sparse) outcomes into a distribution.
+
+    Raises:
+        OddsTooExpensive: If the outcomes span more than MAX_ODDS_OUTCOMES.
+    """
+    offset = int(outcomes.min())
+    span = int(outcomes.max()) - offset + 1
+    if span > MAX_ODDS_OUTCOMES:
+        raise OddsTooExpensive(span, MAX_ODDS_OUTCOMES)
+    return OutcomeDistribution(
+        offset, np.bincount(outcomes - offset, weights=probabilities, minlength=span)
+    ).trimmed()
+
+
+def mix(distributions: list[OutcomeDistribution]) -> OutcomeDistribution:
+    """
+    Adds up (already weighted) distributions outcome by outcome.
+
+    Args:
+        distributions (list[OutcomeDistribution]): The weighted distributions to add up.
+
+    Returns:
+        An OutcomeDistribution covering the outcomes of all given distributions.
+    """
+    offset = min(distribution.offset for distribution in distributions)
+    end = max(
+        distribution.offset + len(distribution.probabilities) for distribution in distributions
+    )
+    probabilities = np.zeros(end - offset)
+    for distribution in distributions:
+        start = distribution.offset - offset
+        probabilities[start : start + len(distribution.probabilities)] += distribution.probabilities
+    return OutcomeDistribution(offset, probabilities).trimmed()
+
+
+def binomial_probabilities(count: int, probability: float) -> np.ndarray:
+    """
+    Returns the probabilities of 0 to count hits in count tries with the given hit probability.
+
+    Args:
+        count (int): The number of tries.
+        probability (float): The probability of a hit in a single try.
+
+    Returns:
+        An array of length count + 1.
+    """
+    if probability <= 0.0 or probability >= 1.0:
+        result = np.zeros(count + 1)
+        result[count if probability >= 1.0 else 0] = 1.0
+        return result
+    hits = np.arange(count + 1)
+    log_combinations = np.array(
+        [math.lgamma(count + 1) - math.lgamma(hit + 1) - math.lgamma(count - hit + 1) for hit in hits]
+    )
+    return np.exp(
+        log_combinations + hits * math.log(probability) + (count - hits) * math.log1p(-probability)
+    )
+
+
+def check_odds_cost(item: Union[ComplexPool, DiceExpression]):
+    """
+    Estimates the states needed for a pool, or every pool of an expression, without calculating anything.
+
+    Args:
+        item (Union[ComplexPool, DiceExpression]): The pool or expression to check.
+
+    Raises:
+        OddsTooExpensive: If a pool has too many states.
+    """
+    for pool in item.pools if isinstance(item, DiceExpression) else [item]:
+        kept_count = min(pool.highest_count or pool.lowest_count, pool.number)
+        if kept_count:
+            states, max_states = pool.sides * kept_count**2, MAX_ODDS_KEEP_STATES
+        else:
+            states, max_states = pool.number * pool.sides, MAX_ODDS_OUTCOMES
+        if states > max_states:
+            raise OddsTooExpensive(states, max_states)
+
+
+def describe_odds(
+    item: Union[ComplexPool, DiceExpression], explosion_depth: int = DEFAULT_EXPLOSION_DEPTH
+) -> tuple[float, float, str]:
+    """
+    Calculates the distribution of a pool or expression in a worker process, returning only what is displayed.
+
+    Args:
+        item (Union[ComplexPool, DiceExpression]): The pool or expression to calculate the distribution for.
+        explosion_depth (int): The maximum number of extra dice a single cascading dice can add.
+
+    Returns:
+        The mean, the standard deviation and the rendered chart of the distribution.
+
+    Raises:
+        OddsTooExpensive: If the distribution has too many states.
+    """
+    if isinstance(item, DiceExpression):
+        distribution = expression_distribution(item, explosion_depth)
+    else:
+        distribution = pool_distribution(item, explosion_depth)
+    return distribution.mean, distribution.standard_deviation, render_distribution(distribution)
+
+
+def expression_distribution(
+    expression: DiceExpression, explosion_depth: int = DEFAULT_EXPLOSION_DEPTH
+) -> OutcomeDistribution:
+    """
+    Calculates the exact probability distribution of the value of a dice expression.
+
+    Every pool appears once in the expression, so the distributions of the pools are independent and
+    are combined along the tree: sums are convolved, products and divisions map every pair of outcomes.
+    Pools counting the difference to a threshold are negated, like in their rolls (see pool_value).
+
+    Args:
+        expression (DiceExpression): The expression to calculate the distribution for.
+        explosion_depth (int): The maximum number of extra dice a single cascading dice can add.
+
+    Returns:
+        An OutcomeDistribution of the expression value.
+
+    Raises:
+        OddsTooExpensive: If a pool or an intermediate distribution has too many states.
+    """
+    check_odds_cost(expression)
+    leaves = []
+    for pool in expression.pools:
+        distribution = pool_distribution(pool, explosion_depth)
+        if pool.count_below > -1 or pool.count_above > -1:
+            distribution = distribution.negated()
+        leaves.append(distribution)
+    return _node_distribution(expression.root, leaves)
+
+
+def _node_distribution(node: Node, leaves: list[OutcomeDistribution]) -> OutcomeDistribution:
+    """Calculates the distribution of a node of an expression tree from the distributions of its pools."""
+    if isinstance(node, Constant):
+        return OutcomeDistribution.certain(node.value)
+    if isinstance(node, PoolLeaf):
+        return leaves[node.index]
+    if isinstance(node, Negation):
+        return _node_distribution(node.operand, leaves).negated()
+    left = _node_distribution(node.left, leaves)
+    right = _node_distribution(node.right, leaves)
+    if node.operator == "+":
+        return left.convolve(right)
+    if node.operator == "-":
+        return left.convolve(right.negated())
+    pairs = len(left.probabilities) * len(right.probabilities)
+    if pairs > MAX_ODDS_OUTCOMES:
+        raise OddsTooExpensive(pairs, MAX_ODDS_OUTCOMES)
+    left_outcomes, right_outcomes = np.meshgrid(left.outcomes, right.outcomes, indexing="ij")
+    if node.operator == "*":
+        outcomes = left_outcomes * right_outcomes
+    else:
+        outcomes = left_outcomes // right_outcomes
+    return gather(outcomes.ravel(), np.outer(left.probabilities, right.probabilities).ravel())
+
+
+def pool_distribution(
+    pool: ComplexPool, explosion_depth: int = DEFAULT_EXPLOSION_DEPTH
+) -> OutcomeDistribution:
+    """
+    Calculates the exact distribution of the result of a complex pool.
+
+    The result is the number of successes for success pools, the sum for sum pools and the
+    (negative) difference for < and > pools, exactly as reported by the result of ComplexPool.roll.
+
+    Args:
+        pool (ComplexPool): The pool to calculate the distribution for.
+        explosion_depth (int): The maximum number of extra dice a single cascading dice can add.
+
+    Returns:
+        An OutcomeDistribution of the pool result.
+
+    Raises:
+        OddsTooExpensive: If the pool has too many states, see check_odds_cost.
+    """
+    check_odds_cost(pool)
+    depth = {ExplodingBehavior.ONCE: 1, ExplodingBehavior.CASCADING: max(explosion_depth, 1)}.get(
+        pool.explode, 0
+    )
+    max_score = int(pool.score_dice(np.array([pool.sides + pool.dice_modifier]))[0])
+    low_scores = pool.score_dice(np.arange(1, pool.sides) + pool.dice_modifier)
+    max_probability = 1 / pool.sides
+    # chain_probabilities[j]: a dice explodes j times and then shows a low value
+    chain_probabilities = max_probability ** np.arange(depth + 1) * (1 - max_probability)
+    truncated_probability = max_probability ** (depth + 1)
+    if pool.highest_count > 0 or pool.lowest_count > 0:
+        result = _kept_distribution(
+            pool, depth, max_score, low_scores, chain_probabilities, truncated_probability
+        )
+    else:
+        parts = [OutcomeDistribution.certain((depth + 1) * max_score).scaled(truncated_probability)]
+        if len(low_scores):
+            low_distribution = OutcomeDistribution.uniform(low_scores)
+            parts += [
+                low_distribution.shifted(explosions * max_score).scaled(chain_probability)
+                for explosions, chain_probability in enumerate(chain_probabilities)
+            ]
+        result = mix(parts).power(pool.number)
+    return result.shifted(pool.pool_modifier)
+
+
+def _kept_distribution(
+    pool: ComplexPool,
+    depth: int,
+    max_score: int,
+    low_scores: np.ndarray,
+    chain_probabilities: np.ndarray,
+    truncated_probability: float,
+) -> OutcomeDistribution:
+    """
+    Calculates the distribution of a pool that only keeps its highest or lowest dice.
+
+    Every maximum dice ranks above every low dice, so the pool is split into the count of maximum
+    dice and the count of low dice. The low dice are independent and uniform, so only the order
+    statistics of the low dice need a dynamic program.
+    """
+    terminated_probabilities = binomial_probabilities(pool.number, 1 - truncated_probability)
+    low_distribution = None
+    explosions = OutcomeDistribution.certain()
+    if len(low_scores):
+        low_distribution = OutcomeDistribution.uniform(low_scores)
+        explosions = OutcomeDistribution(0, chain_probabilities / chain_probabilities.sum())
+    kept_count = pool.highest_count or pool.lowest_count
+    face_scores = low_scores[::-1] if pool.highest_count > 0 else low_scores
+    extremes_cache: dict[tuple[int, int], OutcomeDistribution] = {}
+
+    def kept_low(count: int, keep: int) -> OutcomeDistribution:
+        if (count, keep) not in extremes_cache:
+            if keep >= count:
+                extremes_cache[count, keep] = low_distribution.power(count)
+            else:
+                extremes_cache[count, keep] = _kept_extremes(count, keep, face_scores)
+        return extremes_cache[count, keep]
+
+    parts = []
+    low_explosions = OutcomeDistribution.certain()
+    for low_count, low_count_probability in enumerate(terminated_probabilities):
+        if low_count:
+            low_explosions = low_explosions.convolve(explosions)
+        if low_count_probability <= NEGLIGIBLE_PROBABILITY:
+            continue
+        max_counts = low_explosions.shifted((depth + 1) * (pool.number - low_count))
+        if pool.lowest_count > 0 and kept_count <= low_count:
+            parts.append(kept_low(low_count, kept_count).scaled(low_count_probability))
+            continue
+        for max_count, max_count_probability in zip(
+            max_counts.outcomes.tolist(), max_counts.probabilities.tolist()
+        ):
+            weight = low_count_probability * max_count_probability
+            if weight <= NEGLIGIBLE_PROBABILITY:
+                continue
+            if pool.highest_count > 0:
+                kept_max = min(max_count, kept_count)
+                kept = OutcomeDistribution.certain(kept_max * max_score)
+                if kept_max < kept_count and low_count:
+                    kept = kept_low(low_count, kept_count - kept_max).shifted(kept_max * max_score)
+            else:
+                kept = OutcomeDistribution.certain(min(max_count, kept_count - low_count) * max_score)
+                if low_count:
+                    kept = kept_low(low_count, low_count).shifted(kept.offset)
+            parts.append(kept.scaled(weight))
+    return mix(parts)
+
+
+def _kept_extremes(count: int, keep: int, face_scores: np.ndarray) -> OutcomeDistribution:
+    """
+    Calculates the distribution of the summed scores of the first keep of count uniform dice.
+
+    The faces are walked in keeping order. While fewer than keep dice are assigned, all assigned
+    dice are kept and the remaining dice are uniform over the faces not walked yet, so the number
+    of dice showing the current face is binomial.
+
+    Args:
+        count (int): The number of dice.
+        keep (int): The number of dice to keep, less than count.
+        face_scores (np.ndarray): The score of each face, in the order the dice are kept.
+
+    Returns:
+        An OutcomeDistribution of the summed scores of the kept dice.
+    """
+    states: list[OutcomeDistribution | None] = [OutcomeDistribution.certain()] + [None] * (keep - 1)
+    finished = []
+    for face_index, score in enumerate(face_scores.tolist()):
+        face_probability = 1 / (len(face_scores) - face_index)
+        new_states: list[list[OutcomeDistribution]] = [[] for _ in range(keep)]
+        for assigned, state in enumerate(states):
+            if state is None:
+                continue
+            needed = keep - assigned
+            hits = binomial_probabilities(count - assigned, face_probability)
+            for hit_count in range(needed):
+                if hits[hit_count] > NEGLIGIBLE_PROBABILITY:
+                    new_states[assigned + hit_count].append(
+                        state.shifted(hit_count * score).scaled(hits[hit_count])
+                    )
+            finished.append(state.shifted(needed * score).scaled(float(hits[needed:].sum())))
+        states = [mix(parts) if parts else None for parts in new_states]
+    return mix(finished)
+
+
+def render_distribution(
+    distribution: OutcomeDistribution, max_rows: int = 20, bar_width: int = 15
+) -> str:
+    """
+    Renders a distribution as a text chart with one row per outcome (or range of outcomes).
+
+    Each row shows the probability of the outcome, the probability of at least the outcome and a bar.
+    Only the tails with less than CHART_TAIL_PROBABILITY of the mass each are left out, so wide
+    distributions keep their range even if no single outcome is likely.
+
+    Args:
+        distribution (OutcomeDistribution): The distribution to render.
+        max_rows (int): The maximum number of rows, outcomes are grouped into ranges beyond that.
+        bar_width (int): The width of the bar of the most likely row.
+
+    Returns:
+        The chart as a multiline string.
+    """
+    cumulative = np.cumsum(distribution.probabilities)
+    first = int(np.searchsorted(cumulative, CHART_TAIL_PROBABILITY, side="right"))
+    last = int(np.searchsorted(cumulative, cumulative[-1] - CHART_TAIL_PROBABILITY))
+    last = min(last, len(cumulative) - 1)
+    first = min(first, last)
+    bucket_size = math.ceil((last - first + 1) / max_rows)
+    rows = []
+    for start in range(first, last + 1, bucket_size):
+        end = min(start + bucket_size, last + 1) - 1
+        low, high = distribution.offset + start, distribution.offset + end
+        rows.append(
+            (
+                str(low) if low == high else f"{low}-{high}",
+                float(distribution.probabilities[start : end + 1].sum()),
+                distribution.at_least(low),
+            )
+        )
+    label_width = max(len(label) for label, _, _ in rows)
+    highest = max(probability for _, probability, _ in rows)
+    return "\n".join(
+        f"{label:>{label_width}} {probability:7.2%} ≥{at_least:7.2%} "
+        + "█" * round(bar_width * probability / highest)
+        for label, probability, at_least in rows
+    )
+
+
+
+def trim_chart(chart: str, max_length: int) -> str:
+    """Drops rows from both ends of a chart (the least likely outcomes) until it is at most max_length long."""
+    rows = chart.splitlines()
+    from_start = False
+    while len(rows) > 1 and len("\n".join(rows)) > max_length:
+        rows.pop(0 if from_start else -1)
+        from_start = not from_start
+    return "\n".join(rows)
@@ -0,0 +1,202 @@
+"""A library for simulating complex dice pools with many vectorized rolls."""
+import time
+from dataclasses import dataclass
+from typing import Optional, Union
+
+import numpy as np
+
+from app.library.dice_expression import DiceExpression, compile_dice_expressions
+from app.library.dice_odds import MAX_ODDS_OUTCOMES, OutcomeDistribution, render_distribution
+from app.library.polydice import MAX_EXPLOSION_DEPTH, ComplexPool, ExplodingBehavior, dice_dtype
+
+MAX_SIMULATED_ROLLS = 10**7
+BATCH_DICE = 2**22
+PERCENTILES = (5, 25, 50, 75, 95)
+
+
+@dataclass
+class SimulatedStatistic:
+    """
+    Summarizes the simulated results of one dice pool (or the total of several pools).
+
+    The summary is calculated where the dice were rolled, so a worker process only sends back a few
+    numbers and the chart instead of every result.
+    """
+
+    label: str
+    mean: float
+    standard_deviation: float
+    percentiles: dict[int, float]
+    chart: str
+
+    @staticmethod
+    def from_results(label: str, results: np.ndarray) -> "SimulatedStatistic":
+        """Summarizes the results, the chart is left empty if the results span more than MAX_ODDS_OUTCOMES."""
+        offset = int(results.min())
+        chart = ""
+        if int(results.max()) - offset < MAX_ODDS_OUTCOMES:
+            chart = render_distribution(
+                OutcomeDistribution(offset, np.bincount(results - offset) / len(results))
+            )
+        return SimulatedStatistic(
+            label,
+            float(results.mean()),
+            float(results.std()),
+            dict(zip(PERCENTILES, np.percentile(results, PERCENTILES).tolist())),
+            chart,
+        )
+
+
+@dataclass
+class Simulation:
+    """Represents the outcome of simulating a dice pool string."""
+
+    dice_pool: str
+    rolls: int
+    seconds: float
+    statistics: list[SimulatedStatistic]
+
+    @property
+    def rolls_per_second(self) -> float:
+        """Returns how many complete rolls of the dice pool string were simulated per second."""
+        return self.rolls / self.seconds if self.seconds > 0 else float("inf")
+
+
+def simulate_dice_pool(dice_pool: str, rolls: int, seed: Optional[int] = None) -> Simulation:
+    """
+    Rolls a dice pool string many times and collects the results.
+
+    The string is split like in /roll_complex: every description (pool or expression) gets its own statistic,
+    and if several descriptions are rolled the total successes and total sum are added as statistics as well.
+
+    Args:
+        dice_pool (str): A dice pool string, descriptions separated by spaces and an optional # comment.
+        rolls (int): How often the dice pool string is rolled, at most MAX_SIMULATED_ROLLS.
+        seed (Optional[int]): The seed for the random generator, a random seed is used if None.
+
+    Returns:
+        The simulation with a summarized statistic for each description.
+    """
+    rolls = min(max(rolls, 1), MAX_SIMULATED_ROLLS)
+    generator = np.random.default_rng(seed)
+    items = compile_dice_expressions(dice_pool)
+    start = time.perf_counter()
+    results = [simulate_item(item, rolls, generator) for item in items]
+    seconds = time.perf_counter() - start
+    statistics = [
+        SimulatedStatistic.from_results(item.description, item_results)
+        for item, item_results in zip(items, results)
+    ]
+    success_results = [
+        item_results
+        for item, item_results in zip(items, results)
+        if not isinstance(item, DiceExpression)
+        and (item.success_threshold > 0 or item.failure_threshold > 0)
+    ]
+    sum_results = [
+        item_results * (-1 if _is_difference(item) else 1)
+        for item, item_results in zip(items, results)
+        if isinstance(item, DiceExpression)
+        or (item.success_threshold <= 0 and item.failure_threshold <= 0)
+    ]
+    if len(success_results) > 1:
+        statistics.append(
+            SimulatedStatistic.from_results("Σ successes", np.sum(success_results, axis=0))
+        )
+    if len(sum_results) > 1:
+        statistics.append(
+            SimulatedStatistic.from_results("Σ sum", np.sum(sum_results, axis=0))
+        )
+    return Simulation(dice_pool, rolls, seconds, statistics)
+
+
+def simulate_item(
+    item: Union[ComplexPool, DiceExpression], rolls: int, generator: np.random.Generator
+) -> np.ndarray:
+    """Rolls a dice pool or a dice expression many times, the pools of an expression counted like in its rolls."""
+    if not isinstance(item, DiceExpression):
+        return simulate_pool(item, rolls, generator)
+    return item.evaluate(
+        [
+            simulate_pool(pool, rolls, generator) * (-1 if _is_difference(pool) else 1)
+            for pool in item.pools
+        ]
+    )
+
+
+def _is_difference(item: Union[ComplexPool, DiceExpression]) -> bool:
+    """Returns True for pools counting the difference to a threshold, their sums are negated for totals."""
+    return not isinstance(item, DiceExpression) and (item.count_below > -1 or item.count_above > -1)
+
+
+def simulate_pool(pool: ComplexPool, rolls: int, generator: np.random.Generator) -> np.ndarray:
+    """
+    Rolls a single dice pool many times.
+
+    The rolls are done in batches of roughly BATCH_DICE dice, so memory stays bounded for big pools.
+    Cascading explosions stop after MAX_EXPLOSION_DEPTH generations, like in ComplexPool.roll.
+
+    Args:
+        pool (ComplexPool): The dice pool to roll.
+        rolls (int): How often the pool is rolled.
+        generator (np.random.Generator): The random generator to use.
+
+    Returns:
+        An integer array with the result of every roll.
+    """
+    batch_size = max(BATCH_DICE // max(pool.number, 1), 1)
+    return np.concatenate(
+        [
+            _simulate_batch(pool, min(batch_size, rolls - start), generator)
+            for start in range(0, rolls, batch_size)
+        ]
+    )
+
+
+def _simulate_batch(pool: ComplexPool, rolls: int, generator: np.random.Generator) -> np.ndarray:
+    """Rolls a dice pool rolls times, returning the result of every roll."""
+    dice = generator.integers(
+        1, pool.sides, size=(rolls, pool.number), endpoint=True, dtype=dice_dtype(pool.sides)
+    )
+    if pool.explode in {ExplodingBehavior.ONCE, ExplodingBehavior.CASCADING}:
+        dice = _add_explosions(dice, pool, generator)
+    valid = dice > 0
+    if pool.highest_count > 0:
+        dice = -np.sort(-dice, axis=1)[:, : pool.highest_count]
+        valid = dice > 0
+    elif pool.lowest_count > 0:
+        dice = np.sort(np.where(valid, dice, pool.sides + 1), axis=1)[:, : pool.lowest_count]
+        valid = dice <= pool.sides
+    scores = np.where(valid, pool.score_dice(dice + pool.dice_modifier), 0)
+    return scores.sum(axis=1) + pool.pool_modifier
+
+
+def _add_explosions(dice: np.ndarray, pool: ComplexPool, generator: np.random.Generator) -> np.ndarray:
+    """Appends the extra dice of exploding maximum values as columns, padding rows with 0."""
+    extra_rows = []
+    extra_values = []
+    exploding_rows = np.nonzero(dice == pool.sides)[0]
+    for _ in range(MAX_EXPLOSION_DEPTH):
+        if not len(exploding_rows):
+            break
+        generation = generator.integers(
+            1, pool.sides, size=len(exploding_rows), endpoint=True, dtype=dice.dtype
+        )
+        extra_rows.append(exploding_rows)
+        extra_values.append(generation)
+        if pool.explode == ExplodingBehavior.ONCE:
+            break
+        exploding_rows = exploding_rows[generation == pool.sides]
+    if not extra_rows:
+        return dice
+    rows = np.concatenate(extra_rows)
+    values = np.concatenate(extra_values)
+    order = np.argsort(rows, kind="stable")
+    rows, values = rows[order], values[order]
+    counts = np.bincount(rows, minlength=len(dice))
+    columns = np.arange(len(rows)) - (np.cumsum(counts) - counts)[rows]
+    padded = np.zeros((len(dice), dice.shape[1] + int(counts.max())), dtype=dice.dtype)
+    padded[:, : dice.shape[1]] = dice
+    padded[rows, dice.shape[1] + columns] = values
+    return padded
+
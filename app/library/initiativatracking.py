@@ -2,13 +2,14 @@
 This module contains classes and functions for initiative tracking in a Discord bot.
 It utilizes the sqlmodel library for database operations.
 """
-import os
 from typing import Optional
-from sqlmodel import Field,SQLModel,create_engine,Session,select,delete
-connection_string = os.getenv("DB_CONNECTION_STRING", "sqlite:///gifts.db")
+from sqlalchemy import Index
+from sqlmodel import Field,SQLModel,Session,select,delete
 
+from app.library.database import engine
 
-engine = create_engine(connection_string, echo=False)
+# the distance between the orders of neighbouring entries after they were (re)numbered
+ORDER_GAP = 1024
 
 class InitiativeTracking(SQLModel, table=True):
     """
@@ -24,33 +25,124 @@ class InitiativeTracking(SQLModel, table=True):
         The unique identifier of the channel.
     name : str
         The name of the entry.
-    message_id : str
-        The unique identifier of the message displaying the initiative tracking.
     """
+    __table_args__ = (Index("ix_initiativetracking_channel_id_initiative_order","channel_id","initiative_order"),)
     id: Optional[int] = Field(default=None, primary_key=True,index=True)
     initiative_order:int
     channel_id:str
     name:str
-    message_id:Optional[str]
 
-def shift_order(trackings:list[InitiativeTracking],insert_index:Optional[int]=None,remove_index:Optional[int]=None):
+class InitiativeChannel(SQLModel, table=True):
     """
-    Shift the initiative order of all entries in the list of trackings.
+    A class representing the initiative tracking of a channel as a whole.
+
+    Attributes:
+    -----------
+    channel_id : str
+        The unique identifier of the channel.
+    message_id : Optional[str]
+        The unique identifier of the message displaying the initiative tracking.
+    current_turn : Optional[str]
+        The name of the entry whose turn it is, None if the tracking was not started.
+    round : int
+        The number of the current round.
+    version : int
+        The number of times the channel was saved, increased by every write.
+    """
+    channel_id: str = Field(primary_key=True)
+    message_id: Optional[str] = None
+    current_turn: Optional[str] = None
+    round: int = 0
+    version: int = 0
+
+def _save_channel_header(session:Session,channel_id:str,header:dict):
+    """Set the columns of the channel's InitiativeChannel (creating it if needed) and increase its version."""
+    channel = session.get(InitiativeChannel,channel_id)
+    if channel is None:
+        channel = InitiativeChannel(channel_id=channel_id)
+        session.add(channel)
+    for column,value in header.items():
+        setattr(channel,column,value)
+    channel.version += 1
+
+def order_between(before:Optional[int],after:Optional[int]) -> Optional[int]:
+    """
+    Find an initiative order between the orders of two neighbouring entries.
+
+    Orders are spaced ORDER_GAP apart, so most inserts find a free order without changing any other entry.
 
     Parameters:
     -----------
-    trackings : list[InitiativeTracking]
-        The list of initiative trackings to shift.
-    insert_index : Optional[int]
-        The index to insert a new entry at.
-    remove_index : Optional[int]
-        The index to remove an entry from.
+    before : Optional[int]
+        The order of the entry before the new one, None to insert at the beginning.
+    after : Optional[int]
+        The order of the entry after the new one, None to insert at the end.
+
+    Returns:
+    --------
+    Optional[int]
+        A free order between the two, or None if there is none and the orders must be rebalanced.
+    """
+    if before is None and after is None:
+        return 0
+    if before is None:
+        return after - ORDER_GAP
+    if after is None:
+        return before + ORDER_GAP
+    if after - before < 2:
+        return None
+    return (before + after) // 2
+
+def spaced_orders(count:int) -> list[int]:
+    """
+    Get evenly spaced initiative orders for a number of entries.
+
+    Parameters:
+    -----------
+    count : int
+        The number of entries.
+
+    Returns:
+    --------
+    list[int]
+        The orders 0, ORDER_GAP, 2*ORDER_GAP, ...
     """
-    for entry in trackings:
-        if remove_index is not None and entry.initiative_order >= remove_index:
-            entry.initiative_order -= 1
-        if insert_index is not None and entry.initiative_order >= insert_index:
-            entry.initiative_order += 1
+    return [i*ORDER_GAP for i in range(count)]
+
+def place_entry(current:list[InitiativeTracking],entry:InitiativeTracking,index:int):
+    """
+    Give an entry the order that places it at the index, only changing other entries if there is no free order.
+
+    Parameters:
+    -----------
+    current : list[InitiativeTracking]
+        The entries of the channel in order, the entry itself is ignored if it is in the list.
+    entry : InitiativeTracking
+        The entry to place.
+    index : int
+        The index among the other entries to place the entry at.
+    """
+    others = [other for other in current if other is not entry]
+    index = min(index,len(others))
+    before = others[index-1].initiative_order if index > 0 else None
+    after = others[index].initiative_order if index < len(others) else None
+    order = order_between(before,after)
+    if order is not None:
+        entry.initiative_order = order
+        return
+    reordered = others[:index]+[entry]+others[index:]
+    for tracking,order in zip(reordered,spaced_orders(len(reordered))):
+        tracking.initiative_order = order
+
+def _insert_at(session:Session,channel_id:str,name:str,index_of):
+    """Insert or move the entry with the name to the index returned by index_of for the other entries."""
+    current:list[InitiativeTracking] = list(session.exec(select(InitiativeTracking).where(InitiativeTracking.channel_id == channel_id).order_by(InitiativeTracking.initiative_order)))
+    entry:Optional[InitiativeTracking] = next(iter([entry for entry in current if entry.name == name]),None)
+    if entry is None:
+        entry = InitiativeTracking(initiative_order=0,channel_id=channel_id,name=name)
+        session.add(entry)
+    place_entry(current,entry,index_of([other for other in current if other is not entry]))
+    session.commit()
 
 def insert_before_index(channel_id:str,index:int,name:str):
     """
@@ -66,16 +158,7 @@ def insert_before_index(channel_id:str,index:int,name:str):
         The name of the new entry.
     """
     with Session(engine) as session:
-        current:list[InitiativeTracking] = list(session.exec(select(InitiativeTracking).where(InitiativeTracking.channel_id == channel_id).order_by(InitiativeTracking.initiative_order)))
-        message_id = current[0].message_id if current else None
-        existing_entry:Optional[InitiativeTracking] = next(iter([entry for entry in current if entry.name == name]),None)
-        old_index = existing_entry.initiative_order if existing_entry else None
-        shift_order(current,index,old_index)
-        if existing_entry:
-            existing_entry.initiative_order = index
-        else:
-            session.add(InitiativeTracking(initiative_order=index,channel_id=channel_id,name=name,message_id=message_id))
-        session.commit()
+        _insert_at(session,channel_id,name,lambda others: index)
 
 def insert_before_name(channel_id:str,name_after:str,name:str):
     """
@@ -91,23 +174,7 @@ def insert_before_name(channel_id:str,name_after:str,name:str):
         The name of the new entry.
     """
     with Session(engine) as session:
-        current:list[InitiativeTracking] = list(session.exec(select(InitiativeTracking).where(InitiativeTracking.channel_id == channel_id).order_by(InitiativeTracking.initiative_order)))
-        message_id = current[0].message_id if current else None
-        existing_entry:Optional[InitiativeTracking] = next(iter([entry for entry in current if entry.name == name]),None)
-        old_index = existing_entry.initiative_order if existing_entry else None
-        index = [entry for entry in current if entry.name == name_after][0].initiative_order
-        print('name_after',index)
-        print('existing',old_index)
-        for entry in current:
-            print("before shift",entry.initiative_order,entry.name)
-        shift_order(current,index,old_index)
-        for entry in current:
-            print("after shift",entry.initiative_order,entry.name)
-        if existing_entry:
-            existing_entry.initiative_order = index
-        else:
-            session.add(InitiativeTracking(initiative_order=index,channel_id=channel_id,name=name,message_id=message_id))
-        session.commit()
+        _insert_at(session,channel_id,name,lambda others: [entry.name for entry in others].index(name_after))
 
 def insert_after_name(channel_id:str,name_before:str,name:str):
     """
@@ -123,17 +190,7 @@ def insert_after_name(channel_id:str,name_before:str,name:str):
         The name of the new entry.
     """
     with Session(engine) as session:
-        current:list[InitiativeTracking] = list(session.exec(select(InitiativeTracking).where(InitiativeTracking.channel_id == channel_id).order_by(InitiativeTracking.initiative_order)))
-        message_id = current[0].message_id if current else None
-        existing_entry:Optional[InitiativeTracking] = next(iter([entry for entry in current if entry.name == name]),None)
-        old_index = existing_entry.initiative_order if existing_entry else None
-        index = [entry for entry in current if entry.name == name_before][0].initiative_order+1
-        shift_order(current,index,old_index)
-        if existing_entry:
-            existing_entry.initiative_order = index
-        else:
-            session.add(InitiativeTracking(initiative_order=index,channel_id=channel_id,name=name,message_id=message_id))
-        session.commit()
+        _insert_at(session,channel_id,name,lambda others: [entry.name for entry in others].index(name_before)+1)
 
 def set_channel_initiative(channel_id:str,*names:tuple[str], message_id:str=None):
     """
@@ -144,15 +201,17 @@ def set_channel_initiative(channel_id:str,*names:tuple[str], message_id:str=None
     channel_id : str
         The unique identifier of the channel.
     *names : tuple[str]
-        The names of the entries in the initiative tracking.
+        The names of the entries in the initiative tracking, repeated names are only added once.
     message_id : str
         The unique identifier of the message displaying the initiative tracking.
     """
     with Session(engine) as session:
         session.exec(delete(InitiativeTracking).where(InitiativeTracking.channel_id == channel_id))
         session.commit()
-        for i,name in enumerate(names):
-            session.add(InitiativeTracking(initiative_order=i,channel_id=channel_id,name=name,message_id=message_id))
+        names = list(dict.fromkeys(names))
+        for order,name in zip(spaced_orders(len(names)),names):
+            session.add(InitiativeTracking(initiative_order=order,channel_id=channel_id,name=name))
+        _save_channel_header(session,channel_id,{"message_id":message_id,"current_turn":None,"round":0})
         session.commit()
 
 def insert_channel_message(channel_id:str,message_id:str):
@@ -167,9 +226,7 @@ def insert_channel_message(channel_id:str,message_id:str):
         The unique identifier of the message displaying the initiative tracking.
     """
     with Session(engine) as session:
-        current:list[InitiativeTracking] = list(session.exec(select(InitiativeTracking).where(InitiativeTracking.channel_id == channel_id).order_by(InitiativeTracking.initiative_order)))
-        for tracking in current:
-            tracking.message_id = message_id
+        _save_channel_header(session,channel_id,{"message_id":message_id})
         session.commit()
 
 def remove_from_initiative(channel_id:str,name:str):
@@ -184,10 +241,6 @@ def remove_from_initiative(channel_id:str,name:str):
         The name of the entry to remove.
     """
     with Session(engine) as session:
-        current:list[InitiativeTracking] = list(session.exec(select(InitiativeTracking).where(InitiativeTracking.channel_id == channel_id).order_by(InitiativeTracking.initiative_order)))
-        existing_entry:Optional[InitiativeTracking] = next(iter([entry for entry in current if entry.name == name]),None)
-        old_index = existing_entry.initiative_order if existing_entry else None
-        shift_order(current,remove_index=old_index)
         session.exec(delete(InitiativeTracking).where(InitiativeTracking.channel_id == channel_id,InitiativeTracking.name == name))
         session.commit()
 
@@ -203,6 +256,7 @@ def remove_channel_initiative(channel_id:str):
     """
     with Session(engine) as session:
         session.exec(delete(InitiativeTracking).where(InitiativeTracking.channel_id == channel_id))
+        session.exec(delete(InitiativeChannel).where(InitiativeChannel.channel_id == channel_id))
         session.commit()
 
 def get_channel_initiative(channel_id:str):
@@ -222,3 +276,132 @@ def get_channel_initiative(channel_id:str):
     with Session(engine) as session:
         current:list[InitiativeTracking] = list(session.exec(select(InitiativeTracking).where(InitiativeTracking.channel_id == channel_id).order_by(InitiativeTracking.initiative_order)))
         return current
+
+def get_initiative_channel(channel_id:str) -> Optional[InitiativeChannel]:
+    """
+    Get the message, turn and round of a channel's initiative tracking.
+
+    Parameters:
+    -----------
+    channel_id : str
+        The unique identifier of the channel.
+
+    Returns:
+    --------
+    Optional[InitiativeChannel]
+        The initiative tracking of the channel, None if it never had one.
+    """
+    with Session(engine) as session:
+        return session.get(InitiativeChannel,channel_id)
+
+def load_channel_initiative(channel_id:str) -> tuple[list[InitiativeTracking],Optional[InitiativeChannel]]:
+    """
+    Get the entries and the InitiativeChannel of a channel's initiative tracking in one session.
+
+    Parameters:
+    -----------
+    channel_id : str
+        The unique identifier of the channel.
+
+    Returns:
+    --------
+    tuple[list[InitiativeTracking],Optional[InitiativeChannel]]
+        The entries in order and the initiative tracking of the channel (None if it never had one).
+    """
+    with Session(engine) as session:
+        current:list[InitiativeTracking] = list(session.exec(select(InitiativeTracking).where(InitiativeTracking.channel_id == channel_id).order_by(InitiativeTracking.initiative_order)))
+        return current,session.get(InitiativeChannel,channel_id)
+
+def save_channel_initiative(channel_id:str,names:list[str],orders:Optional[list[int]]=None,header:Optional[dict]=None):
+    """
+    Replace the initiative tracking of a channel in a single transaction.
+
+    Unlike set_channel_initiative, the old entries are only removed together with adding the new ones,
+    so a crash while saving leaves either the old or the new order.
+
+    Parameters:
+    -----------
+    channel_id : str
+        The unique identifier of the channel.
+    names : list[str]
+        The names of the entries in the initiative tracking, in order.
+    orders : Optional[list[int]]
+        The initiative orders of the entries, evenly spaced orders if None.
+    header : Optional[dict]
+        The new values of InitiativeChannel columns (message_id, current_turn, round), None keeps them.
+    """
+    with Session(engine) as session:
+        session.exec(delete(InitiativeTracking).where(InitiativeTracking.channel_id == channel_id))
+        for order,name in zip(orders if orders is not None else spaced_orders(len(names)),names):
+            session.add(InitiativeTracking(initiative_order=order,channel_id=channel_id,name=name))
+        if header is not None:
+            _save_channel_header(session,channel_id,header)
+        session.commit()
+
+def update_channel_initiative(channel_id:str,orders:dict[str,int],removed:list[str],header:Optional[dict]=None):
+    """
+    Write the changed entries of a channel's initiative tracking in a single transaction.
+
+    Only the rows of the changed and removed names are touched, the other entries keep their orders.
+
+    Parameters:
+    -----------
+    channel_id : str
+        The unique identifier of the channel.
+    orders : dict[str,int]
+        The new initiative orders of the added or moved entries by name.
+    removed : list[str]
+        The names of the removed entries.
+    header : Optional[dict]
+        The new values of InitiativeChannel columns (message_id, current_turn, round), None keeps them.
+    """
+    with Session(engine) as session:
+        if removed:
+            session.exec(delete(InitiativeTracking).where(InitiativeTracking.channel_id == channel_id,InitiativeTracking.name.in_(removed)))
+        existing:dict[str,InitiativeTracking] = {
+            tracking.name: tracking
+            for tracking in session.exec(select(InitiativeTracking).where(InitiativeTracking.channel_id == channel_id,InitiativeTracking.name.in_(list(orders))))
+        } if orders else {}
+        for name,order in orders.items():
+            if name in existing:
+                existing[name].initiative_order = order
+            else:
+                session.add(InitiativeTracking(initiative_order=order,channel_id=channel_id,name=name))
+        if header is not None:
+            _save_channel_header(session,channel_id,header)
+        session.commit()
+
+def recover_channel_initiatives() -> int:
+    """
+    Repair the initiative trackings left inconsistent by a crash while they were written row by row.
+
+    The entries of channels with duplicate orders or names are renumbered evenly spaced (keeping the order
+    they were inserted in for equal orders, and the first entry of every name).
+
+    Returns:
+    --------
+    int
+        The number of repaired channels.
+    """
+    with Session(engine) as session:
+        channels:dict[str,list[InitiativeTracking]] = {}
+        for tracking in session.exec(select(InitiativeTracking).order_by(InitiativeTracking.channel_id,InitiativeTracking.initiative_order,InitiativeTracking.id)):
+            channels.setdefault(tracking.channel_id,[]).append(tracking)
+        repaired = 0
+        for trackings in channels.values():
+            orders = [tracking.initiative_order for tracking in trackings]
+            if len(set(orders)) == len(orders) and len({tracking.name for tracking in trackings}) == len(trackings):
+                continue
+            names:set[str] = set()
+            kept:list[InitiativeTracking] = []
+            for tracking in trackings:
+                if tracking.name in names:
+                    session.delete(tracking)
+                else:
+                    names.add(tracking.name)
+                    kept.append(tracking)
+            for order,tracking in zip(spaced_orders(len(kept)),kept):
+                tracking.initiative_order = order
+            repaired += 1
+        session.commit()
+        return repaired
@@ -0,0 +1,355 @@
+"""
+An in-memory store for the initiative tracking of every channel, persisted in the background.
+
+Reads are served from memory and mutations only change the order in memory. Changed channels are
+written to the database at most once per FLUSH_DELAY seconds, as one transaction per channel, so a
+burst of commands costs a single write. A crash loses at most the changes of the last FLUSH_DELAY
+seconds, the database always holds a complete order (see save_channel_initiative).
+
+The store is configured with environment variables:
+
+INITIATIVE_FLUSH_DELAY
+    The seconds between the first change of a channel and writing it (default 2).
+INITIATIVE_CACHED_CHANNELS
+    The number of channels kept in memory (default 1000), the least recently used saved channels
+    are dropped.
+"""
+import asyncio
+import atexit
+import bisect
+import os
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Callable, Optional
+
+from app.library.database import run_db, run_db_write
+from app.library.initiativatracking import (
+    InitiativeChannel,
+    InitiativeTracking,
+    load_channel_initiative,
+    order_between,
+    save_channel_initiative,
+    spaced_orders,
+    update_channel_initiative,
+)
+
+FLUSH_DELAY = float(os.getenv("INITIATIVE_FLUSH_DELAY", "2"))
+CACHED_CHANNELS = int(os.getenv("INITIATIVE_CACHED_CHANNELS", "1000"))
+
+
+@dataclass
+class ChannelInitiative:
+    """
+    The initiative order of a channel, with the changes that were not saved yet.
+
+    Every participant has a sparse order key (see order_between), so moving or adding one only changes
+    its own key and only its row is written. When two neighbours have no free key in between, all keys
+    are spaced out again and the whole channel is written.
+
+    Attributes:
+    -----------
+    channel_id : str
+        The unique identifier of the channel.
+    names : list[str]
+        The names of the participants, in initiative order.
+    orders : list[int]
+        The ascending order keys of the participants.
+    message_id : Optional[str]
+        The unique identifier of the message displaying the initiative tracking.
+    current_turn : Optional[str]
+        The name of the participant whose turn it is.
+    round : int
+        The number of the current round.
+    version : int
+        The number of times the message, turn or round were saved.
+    dirty : bool
+        True if the order changed since it was last saved.
+    """
+
+    channel_id: str
+    names: list[str] = field(default_factory=list)
+    orders: list[int] = field(default_factory=list)
+    message_id: Optional[str] = None
+    current_turn: Optional[str] = None
+    round: int = 0
+    version: int = 0
+    dirty: bool = False
+    replace_all: bool = False
+    header_changed: bool = False
+    changed_names: set[str] = field(default_factory=set)
+    removed_names: set[str] = field(default_factory=set)
+    order_by_name: dict[str, int] = field(default_factory=dict)
+
+    @staticmethod
+    def from_trackings(
+        channel_id: str, trackings: list[InitiativeTracking], channel: Optional[InitiativeChannel]
+    ) -> "ChannelInitiative":
+        """Creates the state from the rows of a channel, repeated names or orders are replaced on the next save."""
+        state = ChannelInitiative(channel_id)
+        if channel is not None:
+            state.message_id = channel.message_id
+            state.current_turn = channel.current_turn
+            state.round = channel.round
+            state.version = channel.version
+        for tracking in trackings:
+            if tracking.name not in state.order_by_name:
+                state.names.append(tracking.name)
+                state.orders.append(tracking.initiative_order)
+                state.order_by_name[tracking.name] = tracking.initiative_order
+        if len(state.names) < len(trackings) or len(set(state.orders)) < len(state.orders):
+            state._respace()
+        return state
+
+    def index(self, name: str) -> int:
+        """Returns the position of a participant in the order."""
+        return bisect.bisect_left(self.orders, self.order_by_name[name])
+
+    def reset(self, names: list[str], message_id: Optional[str] = None):
+        """Replaces the order and starts over without a current turn, repeated names are only added once."""
+        self.names = list(dict.fromkeys(names))
+        self.message_id = message_id
+        self.current_turn = None
+        self.round = 0
+        self.header_changed = True
+        self._respace()
+
+    def insert(self, index: int, name: str):
+        """Inserts name at index, moving it there if it is already in the order."""
+        if name in self.order_by_name:
+            self._pop(name)
+        index = min(index, len(self.names))
+        order = order_between(
+            self.orders[index - 1] if index > 0 else None,
+            self.orders[index] if index < len(self.orders) else None,
+        )
+        self.names.insert(index, name)
+        if order is None:
+            self._respace()
+            return
+        self.orders.insert(index, order)
+        self.order_by_name[name] = order
+        self.changed_names.add(name)
+        self.removed_names.discard(name)
+
+    def insert_before(self, name_after: str, name: str):
+        """Inserts name before name_after, name_after is added at the end if it is not in the order."""
+        if name_after not in self.order_by_name:
+            self.insert(len(self.names), name_after)
+        if name != name_after:
+            if name in self.order_by_name:
+                self._pop(name)
+            self.insert(self.index(name_after), name)
+
+    def insert_after(self, name_before: str, name: str):
+        """Inserts name after name_before, name_before is added at the end if it is not in the order."""
+        if name_before not in self.order_by_name:
+            self.insert(len(self.names), name_before)
+        if name != name_before:
+            if name in self.order_by_name:
+                self._pop(name)
+            self.insert(self.index(name_before) + 1, name)
+
+    def remove(self, name: str):
+        """Removes name from the order, if it is in it. If it was their turn, the turn passes on."""
+        if name in self.order_by_name:
+            if name == self.current_turn:
+                if len(self.names) > 1:
+                    self.next_turn()
+                else:
+                    self.current_turn = None
+                    self.header_changed = True
+            self._pop(name)
+            self.removed_names.add(name)
+            self.changed_names.discard(name)
+
+    def next_turn(self):
+        """Passes the turn to the next participant, after the last one a new round starts."""
+        if not self.names:
+            return
+        if self.current_turn not in self.order_by_name:
+            self.current_turn = self.names[0]
+            self.round = max(self.round, 1)
+        elif (index := self.index(self.current_turn) + 1) < len(self.names):
+            self.current_turn = self.names[index]
+        else:
+            self.current_turn = self.names[0]
+            self.round += 1
+        self.header_changed = True
+
+    def previous_turn(self):
+        """Gives the turn back to the previous participant, before the first one the last round continues."""
+        if self.current_turn not in self.order_by_name:
+            return
+        if (index := self.index(self.current_turn)) > 0:
+            self.current_turn = self.names[index - 1]
+        elif self.round > 1:
+            self.current_turn = self.names[-1]
+            self.round -= 1
+        else:
+            return
+        self.header_changed = True
+
+    def new_round(self):
+        """Starts the next round with the turn of the first participant."""
+        if not self.names:
+            return
+        self.current_turn = self.names[0]
+        self.round += 1
+        self.header_changed = True
+
+    def set_message(self, message_id: Optional[str]):
+        """Sets the message displaying the order."""
+        self.message_id = message_id
+        self.header_changed = True
+
+    def take_changes(self) -> tuple[Callable, tuple]:
+        """Returns the database function and its arguments that save the changes, and forgets them."""
+        header = None
+        if self.header_changed:
+            header = {
+                "message_id": self.message_id,
+                "current_turn": self.current_turn,
+                "round": self.round,
+            }
+            self.version += 1
+        if self.replace_all:
+            write = (
+                save_channel_initiative,
+                (self.channel_id, list(self.names), list(self.orders), header),
+            )
+        else:
+            write = (
+                update_channel_initiative,
+                (
+                    self.channel_id,
+                    {name: self.order_by_name[name] for name in self.changed_names},
+                    list(self.removed_names),
+                    header,
+                ),
+            )
+        self.dirty = self.replace_all = self.header_changed = False
+        self.changed_names.clear()
+        self.removed_names.clear()
+        return write
+
+    def _pop(self, name: str):
+        """Takes a participant out of the order."""
+        index = self.index(name)
+        del self.names[index]
+        del self.orders[index]
+        del self.order_by_name[name]
+
+    def _respace(self):
+        """Gives all participants evenly spaced order keys, the whole channel is written on the next save."""
+        self.orders = spaced_orders(len(self.names))
+        self.order_by_name = dict(zip(self.names, self.orders))
+        self.replace_all = True
+        self.changed_names.clear()
+        self.removed_names.clear()
+
+
+class InitiativeStore:
+    """
+    Keeps the initiative order of the recently used channels in memory and writes changes behind.
+
+    Parameters:
+    -----------
+    flush_delay : float
+        The seconds between the first change of a channel and writing it.
+    cached_channels : int
+        The number of channels kept in memory.
+    """
+
+    def __init__(self, flush_delay: float = FLUSH_DELAY, cached_channels: int = CACHED_CHANNELS):
+        self.flush_delay = flush_delay
+        self.cached_channels = cached_channels
+        self.channels: OrderedDict[str, ChannelInitiative] = OrderedDict()
+        self._flushes: dict[str, asyncio.Task] = {}
+
+    async def get(self, channel_id: str) -> ChannelInitiative:
+        """Returns the initiative order of a channel, loading it from the database on first use."""
+        if channel_id in self.channels:
+            self.channels.move_to_end(channel_id)
+            return self.channels[channel_id]
+        trackings, channel = await run_db(load_channel_initiative, channel_id)
+        # another command may have loaded the channel while the database was queried
+        if channel_id not in self.channels:
+            state = ChannelInitiative.from_trackings(channel_id, trackings, channel)
+            self.channels[channel_id] = state
+            if state.replace_all:
+                self.changed(state)
+            self._evict()
+        return self.channels[channel_id]
+
+    def changed(self, state: ChannelInitiative):
+        """Marks the order of a channel as changed and schedules writing it."""
+        state.dirty = True
+        flush = self._flushes.get(state.channel_id)
+        if flush is None or flush.done():
+            self._flushes[state.channel_id] = asyncio.create_task(
+                self._flush_later(state.channel_id)
+            )
+
+    async def set_names(self, channel_id: str, names: list[str], message_id: Optional[str] = None):
+        """Replaces the order of a channel."""
+        state = await self.get(channel_id)
+        state.reset(names, message_id)
+        self.changed(state)
+        return state
+
+    async def set_message(self, channel_id: str, message_id: Optional[str]):
+        """Sets the message displaying the order of a channel."""
+        state = await self.get(channel_id)
+        state.set_message(message_id)
+        self.changed(state)
+        return state
+
+    async def flush(self, channel_id: str):
+        """Writes the order of a channel to the database now, if it changed."""
+        state = self.channels.get(channel_id)
+        if state is None or not state.dirty:
+            return
+        function, args = state.take_changes()
+        try:
+            await run_db_write(function, *args)
+        except Exception as error:
+            print(f"Saving the initiative of channel {channel_id} failed, retrying: {error}")
+            # the changes are lost with the failed transaction, so the next save writes everything
+            state.replace_all = state.header_changed = state.dirty = True
+
+    async def flush_all(self):
+        """Writes all changed orders to the database now."""
+        for channel_id in list(self.channels):
+            await self.flush(channel_id)
+
+    def flush_all_sync(self):
+        """Writes all changed orders to the database from outside of the event loop, e.g. at exit."""
+        for state in list(self.channels.values()):
+            if state.dirty:
+                function, args = state.take_changes()
+                function(*args)
+
+    async def _flush_later(self, channel_id: str):
+        """Waits for more changes of the channel, then writes them all at once until nothing is left."""
+        while True:
+            await asyncio.sleep(self.flush_delay)
+            await self.flush(channel_id)
+            # changes made while writing (or a failed write) are written after the next delay
+            state = self.channels.get(channel_id)
+            if state is None or not state.dirty:
+                return
+
+    def _evict(self):
+        """Drops the least recently used saved channels, until at most cached_channels are left."""
+        # the most recently used channel is the one that was just loaded
+        for channel_id in list(self.channels)[:-1]:
+            if len(self.channels) <= self.cached_channels:
+                return
+            flush = self._flushes.get(channel_id)
+            if not self.channels[channel_id].dirty and (flush is None or flush.done()):
+                del self.channels[channel_id]
+                self._flushes.pop(channel_id, None)
+
+
+initiative_store = InitiativeStore()
+atexit.register(initiative_store.flush_all_sync)
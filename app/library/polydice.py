@@ -1,8 +1,15 @@
 """A library for rolling dice and calculating the results."""
-import random
-from dataclasses import dataclass, field
+import dataclasses
+import secrets
+from abc import ABC, abstractmethod
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass
 from enum import IntEnum
 from functools import total_ordering
+from typing import Callable, Iterator, Optional, Sequence
+
+import numpy as np
 
 
 class ExplodingBehavior(IntEnum):
@@ -14,7 +21,104 @@ class ExplodingBehavior(IntEnum):
     PLUSSUCCESS = 3
 
 
-@dataclass
+class DiceRng(ABC):
+    """Base class for the sources of randomness dice can be rolled with."""
+
+    @abstractmethod
+    def integers(self, sides: int, size: int, dtype: type = np.int64) -> np.ndarray:
+        """
+        Rolls size dice with the given number of sides.
+
+        Args:
+            sides (int): The number of sides on each dice.
+            size (int): The number of dice to roll.
+            dtype (type): The integer dtype of the returned array.
+
+        Returns:
+            An integer array with values between 1 and sides (inclusive).
+        """
+
+
+class NumpyRng(DiceRng):
+    """A fast, batched random source using NumPy's PCG64 generator, reproducible if a seed is given."""
+
+    def __init__(self, seed: Optional[int | np.random.SeedSequence] = None):
+        self.generator = np.random.Generator(np.random.PCG64(seed))
+
+    def integers(self, sides: int, size: int, dtype: type = np.int64) -> np.ndarray:
+        return self.generator.integers(1, sides, size=size, endpoint=True, dtype=dtype)
+
+
+class SecureRng(DiceRng):
+    """A cryptographically secure random source using the secrets module, slower than NumpyRng."""
+
+    def integers(self, sides: int, size: int, dtype: type = np.int64) -> np.ndarray:
+        return np.array([secrets.randbelow(sides) + 1 for _ in range(size)], dtype=dtype)
+
+
+def seeded_rng(seed: int, *scope_ids: int) -> NumpyRng:
+    """
+    Returns a NumpyRng for audited replays: the same seed and scope ids always produce the same rolls.
+
+    Args:
+        seed (int): The seed chosen for the replay.
+        *scope_ids (int): Ids (e.g. guild and channel) mixed into the seed, so scopes sharing a seed differ.
+    """
+    return NumpyRng(np.random.SeedSequence(seed, spawn_key=scope_ids))
+
+
+MAX_EXPLOSION_DEPTH = 100
+MAX_EXPLOSION_DICE = 10000
+RUN_LENGTH_THRESHOLD = 3
+
+_default_rng: DiceRng = NumpyRng()
+_current_rng: ContextVar[Optional[DiceRng]] = ContextVar("dice_rng", default=None)
+_scope_rngs: dict[int, DiceRng] = {}
+
+
+def current_rng() -> DiceRng:
+    """Returns the random source the dice are currently rolled with."""
+    return _current_rng.get() or _default_rng
+
+
+@contextmanager
+def use_rng(rng: Optional[DiceRng]) -> Iterator[DiceRng]:
+    """
+    Rolls all dice inside the with block using the given random source (the default one if None).
+
+    Example:
+        with use_rng(SecureRng()):
+            result = roll_dice_sum(3, 6)
+    """
+    token = _current_rng.set(rng)
+    try:
+        yield current_rng()
+    finally:
+        _current_rng.reset(token)
+
+
+def set_scope_rng(scope_id: int, rng: Optional[DiceRng]):
+    """Configures the random source for a guild or channel, removing the configuration if rng is None."""
+    if rng is None:
+        _scope_rngs.pop(scope_id, None)
+    else:
+        _scope_rngs[scope_id] = rng
+
+
+def rng_for_scope(*scope_ids: int) -> Optional[DiceRng]:
+    """Returns the random source configured for the first of the scope ids that has one, or None."""
+    for scope_id in scope_ids:
+        if scope_id in _scope_rngs:
+            return _scope_rngs[scope_id]
+    return None
+
+
+def dice_dtype(sides: int) -> type:
+    """Returns the integer dtype used to store rolls of dice with this number of sides, 32 bit unless the dice are huge."""
+    return np.int32 if sides < 2**31 - 1 else np.int64
+
+
+@dataclass(slots=True)
 class DiceResult:
     """Represents the result of a single dice roll."""
 
@@ -36,7 +140,7 @@ class DiceResult:
         return self.result == self.sides
 
 
-@dataclass
+@dataclass(slots=True)
 class DicePoolResult:
     """Represents the result of a pool of dice rolls."""
 
@@ -44,16 +148,50 @@ class DicePoolResult:
     dice_results: list[DiceResult]
     extra_dice: list[DiceResult]
     description: str = ""
+    capped: bool = False
 
     @property
     def all_result(self):
         """Returns all the dice rolls, including any modifiers."""
         return self.dice_results + self.extra_dice
 
+    def __reduce__(self):
+        """Pickles the dice as one integer array each, e.g. when a worker process sends the result back."""
+        fields = {
+            field.name: getattr(self, field.name)
+            for field in dataclasses.fields(self)
+            if field.name not in {"dice_results", "extra_dice"}
+        }
+        return (
+            _unpickle_pool_result,
+            (type(self), fields, _dice_array(self.dice_results), _dice_array(self.extra_dice)),
+        )
+
+
+def _dice_array(dice: list[DiceResult]) -> np.ndarray:
+    """Packs dice into an array with a row of sides, dice modifier and result per dice."""
+    return np.array(
+        [(dice_result.sides, dice_result.dice_modifier, dice_result.result) for dice_result in dice],
+        dtype=np.int64,
+    ).reshape(-1, 3)
+
+
+def _unpickle_pool_result(
+    result_type: type, fields: dict, dice_results: np.ndarray, extra_dice: np.ndarray
+) -> "DicePoolResult":
+    """Rebuilds a pickled DicePoolResult, see DicePoolResult.__reduce__."""
+    return result_type(
+        dice_results=[DiceResult(*row) for row in dice_results.tolist()],
+        extra_dice=[DiceResult(*row) for row in extra_dice.tolist()],
+        **fields,
+    )
+
 
 class DicePoolResultSum(DicePoolResult):
     """Represents the result of a pool of dice rolls where the final result is the sum of all the dice rolls."""
 
+    __slots__ = ()
+
     @property
     def sum(self):
         """Returns the sum of all the dice rolls, including any modifiers."""
@@ -64,7 +202,7 @@ class DicePoolResultSum(DicePoolResult):
         )
 
 
-@dataclass
+@dataclass(slots=True)
 class DicePoolResultSuccesses(DicePoolResult):
     """Represents the result of a pool of dice rolls where the final result is the number of dice that rolled a value greater than or equal to the threshold."""
 
@@ -86,12 +224,168 @@ class DicePoolResultSuccesses(DicePoolResult):
         return successes
 
 
-@dataclass
+class DicePoolExclusions(ABC):
+    """
+    Represents the array-backed result of a ComplexPool roll where some dice are excluded from the final result.
+
+    The rolled values are kept as integer arrays (struct of arrays) in slots, the DiceResult objects
+    are only built when the single dice are needed, e.g. for formatting.
+    """
+
+    __slots__ = (
+        "sides",
+        "dice_modifier",
+        "pool_modifier",
+        "base_rolls",
+        "extra_rolls",
+        "kept",
+        "description",
+        "capped",
+        "_dice_results",
+        "_extra_dice",
+        "_total",
+        "_formatted",
+    )
+
+    def __init__(
+        self,
+        sides: int,
+        dice_modifier: int,
+        pool_modifier: int,
+        base_rolls: np.ndarray,
+        extra_rolls: np.ndarray,
+        kept: np.ndarray,
+        description: str = "",
+        capped: bool = False,
+    ):
+        self.sides = sides
+        self.dice_modifier = dice_modifier
+        self.pool_modifier = pool_modifier
+        self.base_rolls = base_rolls
+        self.extra_rolls = extra_rolls
+        self.kept = kept
+        self.description = description
+        self.capped = capped
+        self._dice_results: Optional[list[DiceResult]] = None
+        self._extra_dice: Optional[list[DiceResult]] = None
+        self._total: Optional[int] = None
+        self._formatted: dict[Optional[int], str] = {}
+
+    @property
+    def total(self) -> int:
+        """Returns the final result of the pool, calculated on first access and remembered afterwards."""
+        if self._total is None:
+            self._total = self._calculate_total()
+        return self._total
+
+    @abstractmethod
+    def _calculate_total(self) -> int:
+        """Calculates the final result of the pool from the kept dice."""
+
+    @property
+    def kept_values(self) -> np.ndarray:
+        """Returns the values (including the dice modifier) of all dice that are not excluded."""
+        return np.concatenate((self.base_rolls, self.extra_rolls))[self.kept] + self.dice_modifier
+
+    @property
+    def dice_results(self) -> list[DiceResult]:
+        """Returns the rolled dice as DiceResult objects."""
+        if self._dice_results is None:
+            self._dice_results = materialize_dice(self.base_rolls, self.sides, self.dice_modifier)
+        return self._dice_results
+
+    @property
+    def extra_dice(self) -> list[DiceResult]:
+        """Returns the dice added by exploding as DiceResult objects."""
+        if self._extra_dice is None:
+            self._extra_dice = materialize_dice(self.extra_rolls, self.sides, self.dice_modifier)
+        return self._extra_dice
+
+    @property
+    def all_result(self) -> list[DiceResult]:
+        """Returns all the dice rolls, including any modifiers."""
+        return self.dice_results + self.extra_dice
+
+    @property
+    def excluded(self) -> list[DiceResult]:
+        """Returns the dice that are excluded from the final result."""
+        all_result = self.all_result
+        return [all_result[index] for index in np.flatnonzero(~self.kept).tolist()]
+
+    def summarized(self) -> str:
+        """Returns only the number of dice and the result, without listing the single dice."""
+        extra = f" + {len(self.extra_rolls)} Bonuswürfel" if len(self.extra_rolls) else ""
+        return f"{len(self.base_rolls)}W{self.sides}{extra} -> {self.total}"
+
+    def _formatted_pieces(
+        self, format_dice: Callable[[DiceResult], str], separator: str
+    ) -> Iterator[tuple[str, int]]:
+        """
+        Yields the formatted dice piece by piece, together with the number of dice in each piece.
+
+        Every distinct value is only formatted once, and runs of at least RUN_LENGTH_THRESHOLD equal
+        dice are compressed into a single piece like "7×**10**".
+        """
+        formatted_values: dict[int, str] = {}
+        header = "Bonuswürfel (begrenzt):\n" if self.capped else "Bonuswürfel:\n"
+        sections = [(self.base_rolls, self.kept[: len(self.base_rolls)], "")]
+        if len(self.extra_rolls) or self.capped:
+            sections.append((self.extra_rolls, self.kept[len(self.base_rolls) :], header))
+        for rolls, kept, section_header in sections:
+            if section_header:
+                yield section_header, 0
+            starts, lengths = dice_runs(rolls, kept)
+            for start, length in zip(starts.tolist(), lengths.tolist()):
+                value = int(rolls[start])
+                if value not in formatted_values:
+                    formatted_values[value] = format_dice(
+                        DiceResult(sides=self.sides, dice_modifier=self.dice_modifier, result=value)
+                    )
+                formatted_dice = formatted_values[value]
+                count = 1
+                if length >= RUN_LENGTH_THRESHOLD:
+                    formatted_dice, count = f"{length}×{formatted_dice}", length
+                piece = f"{formatted_dice}{separator}" if kept[start] else f"~~{formatted_dice}~~{separator}"
+                for _ in range(length // count):
+                    yield piece, count
+
+    def _formatted_dice(
+        self, format_dice: Callable[[DiceResult], str], separator: str, budget: Optional[int] = None
+    ) -> str:
+        """
+        Formats all dice with the given function, striking through the excluded ones.
+
+        The result is cached per budget. If a budget is given, formatting stops before the text gets
+        longer than budget characters and the number of missing dice is appended instead.
+        """
+        if budget in self._formatted:
+            return self._formatted[budget]
+        total_dice = len(self.base_rolls) + len(self.extra_rolls)
+        reserved = len(f"… (+{total_dice})")
+        pieces = []
+        length = 0
+        shown_dice = 0
+        for piece, count in self._formatted_pieces(format_dice, separator):
+            if budget is not None and length + len(piece) + reserved > budget:
+                pieces.append(f"… (+{total_dice - shown_dice})")
+                break
+            pieces.append(piece)
+            length += len(piece)
+            shown_dice += count
+        self._formatted[budget] = "".join(pieces)
+        return self._formatted[budget]
+
+
 @total_ordering
-class DicePoolExclusionsSuccesses(DicePoolResultSuccesses):
-    """Represents the result of a pool of dice rolls where some dice are excluded from the final result."""
+class DicePoolExclusionsSuccesses(DicePoolExclusions):
+    """Represents the result of a pool of dice rolls where the final result is the number of not excluded dice that rolled a value greater than or equal to the threshold."""
+
+    __slots__ = ("success_threshold", "failure_threshold")
 
-    excluded: list[DiceResult] = field(default_factory=list)
+    def __init__(self, *args, success_threshold: int = -1, failure_threshold: int = -1, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.success_threshold = success_threshold
+        self.failure_threshold = failure_threshold
 
     def __eq__(self, other):
         if not isinstance(other, DicePoolExclusionsSuccesses):
@@ -106,52 +400,31 @@ class DicePoolExclusionsSuccesses(DicePoolResultSuccesses):
     @property
     def successes(self):
         """Returns the number of dice that rolled a value greater than or equal to the threshold."""
-        successes = len(
-            [
-                dice
-                for dice in self.all_result
-                if dice not in self.excluded and dice.value >= self.success_threshold
-            ]
-        )
+        return self.total
+
+    def _calculate_total(self) -> int:
+        values = self.kept_values
+        successes = int(np.count_nonzero(values >= self.success_threshold))
         if self.failure_threshold > 0:
-            successes -= len(
-                [
-                    dice
-                    for dice in self.all_result
-                    if dice not in self.excluded and dice.value <= self.failure_threshold
-                ]
-            )
-        successes += self.pool_modifier
-        return successes
+            successes -= int(np.count_nonzero(values <= self.failure_threshold))
+        return successes + self.pool_modifier
 
-    def formatted(self):
-        """Returns the sum of all the dice rolls, including any modifiers."""
-        result = ""
-        for dice in self.dice_results:
-            formatted_dice = format_dice_success_result(
+    def formatted(self, budget: Optional[int] = None):
+        """Returns the formatted dice, each on its own line, shortened to at most budget characters."""
+        return self._formatted_dice(
+            lambda dice: format_dice_success_result(
                 dice, self.success_threshold, self.failure_threshold
-            )
-            if dice in self.excluded:
-                formatted_dice = f"~~{formatted_dice}~~"
-            result += f"{formatted_dice}\n"
-        if self.extra_dice:
-            result += "Bonuswürfel:\n"
-            for dice in self.extra_dice:
-                formatted_dice = format_dice_success_result(
-                    dice, self.success_threshold, self.failure_threshold
-                )
-                if dice in self.excluded:
-                    formatted_dice = f"~~{formatted_dice}~~"
-                result += f"{formatted_dice}\n"
-        return result
-
-
-@dataclass
+            ),
+            "\n",
+            budget,
+        )
+
+
 @total_ordering
-class DicePoolExclusionsSum(DicePoolResult):
-    """Represents the result of a pool of dice rolls where some dice are excluded from the final result."""
+class DicePoolExclusionsSum(DicePoolExclusions):
+    """Represents the result of a pool of dice rolls where the final result is the sum of the not excluded dice."""
 
-    excluded: list[DiceResult] = field(default_factory=list)
+    __slots__ = ()
 
     def __eq__(self, other):
         if not isinstance(other, DicePoolExclusionsSum):
@@ -166,85 +439,82 @@ class DicePoolExclusionsSum(DicePoolResult):
     @property
     def sum(self):
         """Returns the sum of all the dice rolls, including any modifiers."""
-        return (
-            sum(
-                dice.value
-                for dice in self.dice_results + self.extra_dice
-                if dice not in self.excluded
-            )
-            + self.pool_modifier
+        return self.total
+
+    def _calculate_total(self) -> int:
+        return int(self.kept_values.sum()) + self.pool_modifier
+
+    def formatted(self, budget: Optional[int] = None):
+        """Returns the formatted dice followed by the sum, shortened to at most budget characters."""
+        suffix = f" -> {self.sum}"
+        result = self._formatted_dice(
+            format_dice_result, ", ", None if budget is None else max(budget - len(suffix), 0)
         )
+        return f"{result.strip().strip(',')}{suffix}"
+
 
-    def formatted(self):
-        """Returns the sum of all the dice rolls, including any modifiers."""
-        result = ""
-        for dice in self.dice_results:
-            formatted_dice = format_dice_result(dice)
-            if dice in self.excluded:
-                formatted_dice = f"~~{formatted_dice}~~"
-            result += f"{formatted_dice}, "
-        if self.extra_dice:
-            result += "Bonuswürfel:\n"
-            for dice in self.extra_dice:
-                formatted_dice = format_dice_result(dice)
-                if dice in self.excluded:
-                    formatted_dice = f"~~{formatted_dice}~~"
-                result += f"{formatted_dice}, "
-        return f"{result.strip().strip(',')} -> {self.sum}"
-
-
-@dataclass
 @total_ordering
-class DicePoolExclusionsDifference(DicePoolResult):
-    """Represents the result of a pool of dice rolls where some dice are excluded from the final result."""
+class DicePoolExclusionsDifference(DicePoolExclusions):
+    """Represents the result of a pool of dice rolls where the final result is the difference of the not excluded dice to a threshold."""
 
-    threshold: int = 0
-    count_below: bool = True
-    excluded: list[DiceResult] = field(default_factory=list)
+    __slots__ = ("threshold", "count_below")
+
+    def __init__(self, *args, threshold: int = 0, count_below: bool = True, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.threshold = threshold
+        self.count_below = count_below
 
     def __eq__(self, other):
-        if not isinstance(other, DicePoolExclusionsSum):
+        if not isinstance(other, DicePoolExclusionsDifference):
             return NotImplemented
         return self.sum == other.sum
 
     def __lt__(self, other):
-        if not isinstance(other, DicePoolExclusionsSum):
+        if not isinstance(other, DicePoolExclusionsDifference):
             return NotImplemented
         return self.sum < other.sum
 
     @property
     def sum(self):
         """Returns the sum of all the dice rolls, including any modifiers."""
-        return (
-            sum(
-                min(0,self.threshold-dice.value) if self.count_below else min(0,dice.value-self.threshold)
-                for dice in self.dice_results + self.extra_dice
-                if dice not in self.excluded
-            )
-            + self.pool_modifier
+        return self.total
+
+    def _calculate_total(self) -> int:
+        values = self.kept_values
+        differences = self.threshold - values if self.count_below else values - self.threshold
+        return int(np.minimum(differences, 0).sum()) + self.pool_modifier
+
+    def formatted(self, budget: Optional[int] = None):
+        """Returns the formatted dice, shortened to at most budget characters."""
+        return self._formatted_dice(format_dice_result, ", ", budget)
+
+
+@dataclass(frozen=True)
+class RollCost:
+    """The predicted cost of rolling dice pools, estimated from their plans before any dice are drawn."""
+
+    dice: int = 0
+    expected_explosion_dice: float = 0.0
+    explosion_budget: int = 0
+    output_characters: int = 0
+
+    @property
+    def expected_dice(self) -> float:
+        """Returns the number of dice rolled on average, including explosions."""
+        return self.dice + self.expected_explosion_dice
+
+    def __add__(self, other: "RollCost") -> "RollCost":
+        return RollCost(
+            self.dice + other.dice,
+            self.expected_explosion_dice + other.expected_explosion_dice,
+            self.explosion_budget + other.explosion_budget,
+            self.output_characters + other.output_characters,
         )
 
-    def formatted(self):
-        """Returns the sum of all the dice rolls, including any modifiers."""
-        result = ""
-        for dice in self.dice_results:
-            formatted_dice = format_dice_result(dice)
-            if dice in self.excluded:
-                formatted_dice = f"~~{formatted_dice}~~"
-            result += f"{formatted_dice}, "
-        if self.extra_dice:
-            result += "Bonuswürfel:\n"
-            for dice in self.extra_dice:
-                formatted_dice = format_dice_result(dice)
-                if dice in self.excluded:
-                    formatted_dice = f"~~{formatted_dice}~~"
-                result += f"{formatted_dice}, "
-        return result
-
-
-@dataclass
+
+@dataclass(frozen=True)
 class ComplexPool:
-    """Represents a complex pool of dice rolls with various options."""
+    """Represents an immutable (and hashable) plan for rolling a complex pool of dice with various options."""
     number: int = 1
     sides: int = 6
     explode: ExplodingBehavior = ExplodingBehavior.NONE
@@ -259,70 +529,295 @@ class ComplexPool:
     count_above: int = -1
     description: str = ""
 
-    def roll(self):
-        """Rolls the dice pool and returns the result."""
+    @property
+    def effective_success_threshold(self) -> int:
+        """Returns the success threshold, defaulting to the upper half of the dice if only failures are given."""
         if self.failure_threshold > -1 and self.success_threshold == -1:
-            self.success_threshold = self.sides // 2 + 1
-        base_result = roll_dice_basic(self.number, self.sides, self.dice_modifier)
-        extra_result = []
-        if self.explode != ExplodingBehavior.NONE:
-            exploding_count = len([dice for dice in base_result if dice.is_max])
-            extra_result = roll_dice_basic(exploding_count, self.sides, self.dice_modifier)
-        if self.explode == ExplodingBehavior.CASCADING:
-            new_dice = extra_result.copy()
-            extra_result = []
-            while new_dice:
-                current_dice = new_dice.pop()
-                extra_result.append(current_dice)
-                if current_dice.is_max:
-                    new_dice.append(
-                        DiceResult(
-                            sides=self.sides,
-                            dice_modifier=self.dice_modifier,
-                            result=random.randint(1, self.sides),
-                        )
-                    )
-        all_dice = base_result + extra_result
-        if self.highest_count > 0:
-            all_dice = sorted(all_dice, key=lambda dice: dice.value, reverse=True)[
-                : self.highest_count
-            ]
-        elif self.lowest_count > 0:
-            all_dice = sorted(all_dice, key=lambda dice: dice.value)[: self.lowest_count]
-        if self.success_threshold > 0 or self.failure_threshold > 0:
-            successes = len([dice for dice in all_dice if dice.value >= self.success_threshold])
-            if self.failure_threshold > 0:
-                successes -= len(
-                    [dice for dice in all_dice if dice.value <= self.failure_threshold]
-                )
-            successes += self.pool_modifier
-            return DicePoolExclusionsSuccesses(
-                pool_modifier=self.pool_modifier,
-                dice_results=base_result,
-                extra_dice=extra_result,
-                success_threshold=self.success_threshold,
-                excluded=[dice for dice in base_result + extra_result if dice not in all_dice],
-                description=self.description,
+            return self.sides // 2 + 1
+        return self.success_threshold
+
+    def estimate_cost(
+        self, max_depth: int = MAX_EXPLOSION_DEPTH, dice_budget: int = MAX_EXPLOSION_DICE
+    ) -> RollCost:
+        """
+        Predicts the cost of rolling the dice pool without rolling it.
+
+        Args:
+            max_depth (int): The maximum number of generations of cascading explosions.
+            dice_budget (int): The maximum number of extra dice added by exploding.
+
+        Returns:
+            The number of dice, the expected and the maximal number of extra dice from explosions
+            and the length of the listing of all dice.
+        """
+        chance = 1 / max(self.sides, 1)
+        if self.explode == ExplodingBehavior.ONCE:
+            explosion_budget = self.number
+            expected_explosion_dice = self.number * chance
+        elif self.explode == ExplodingBehavior.CASCADING:
+            explosion_budget = min(dice_budget, self.number * max_depth)
+            expected_explosion_dice = (
+                self.number * chance / (1 - chance) if chance < 1 else float(explosion_budget)
             )
         else:
-            successes = None
+            explosion_budget = 0
+            expected_explosion_dice = 0.0
+        expected_explosion_dice = min(expected_explosion_dice, explosion_budget)
+        value_length = len(str(self.sides + abs(self.dice_modifier)))
+        dice_length = value_length + 3
+        if self.dice_modifier:
+            dice_length += len(str(abs(self.dice_modifier))) + value_length + 8
+        if self.effective_success_threshold > 0 or self.failure_threshold > 0:
+            dice_length += 4
+        return RollCost(
+            self.number,
+            expected_explosion_dice,
+            explosion_budget,
+            int((self.number + expected_explosion_dice) * dice_length) + len(self.description) + 12,
+        )
+
+    def roll(self, max_depth: int = MAX_EXPLOSION_DEPTH, dice_budget: int = MAX_EXPLOSION_DICE):
+        """
+        Rolls the dice pool and returns the result.
+
+        Args:
+            max_depth (int): The maximum number of generations of cascading explosions.
+            dice_budget (int): The maximum number of extra dice added by exploding.
+        """
+        base_rolls, extra_rolls, capped = roll_pool_arrays(
+            self.number, self.sides, self.explode, max_depth, dice_budget
+        )
+        return self.result_from_rolls(base_rolls, extra_rolls, capped)
+
+    def result_from_rolls(self, base_rolls: np.ndarray, extra_rolls: np.ndarray, capped: bool = False):
+        """
+        Builds the result of the dice pool from already rolled dice.
+
+        Args:
+            base_rolls (np.ndarray): The rolled dice.
+            extra_rolls (np.ndarray): The extra dice added by exploding.
+            capped (bool): Whether the explosions were capped.
+        """
+        success_threshold = self.effective_success_threshold
+        kept = keep_mask(
+            np.concatenate((base_rolls, extra_rolls)), self.highest_count, self.lowest_count
+        )
+        pool_arguments = (
+            self.sides,
+            self.dice_modifier,
+            self.pool_modifier,
+            base_rolls,
+            extra_rolls,
+            kept,
+            self.description,
+            capped,
+        )
+        if success_threshold > 0 or self.failure_threshold > 0:
+            return DicePoolExclusionsSuccesses(
+                *pool_arguments,
+                success_threshold=success_threshold,
+                failure_threshold=self.failure_threshold,
+            )
         if self.count_below > -1 or self.count_above > -1:
             return DicePoolExclusionsDifference(
-                pool_modifier=self.pool_modifier,
-                dice_results=base_result,
-                extra_dice=extra_result,
-                excluded=[dice for dice in base_result + extra_result if dice not in all_dice],
-                description=self.description,
-                threshold=max(self.count_below,self.count_above),
-                count_below=self.count_below>-1
+                *pool_arguments,
+                threshold=max(self.count_below, self.count_above),
+                count_below=self.count_below > -1,
             )
-        return DicePoolExclusionsSum(
-            pool_modifier=self.pool_modifier,
-            dice_results=base_result,
-            extra_dice=extra_result,
-            excluded=[dice for dice in base_result + extra_result if dice not in all_dice],
-            description=self.description,
+        return DicePoolExclusionsSum(*pool_arguments)
+
+    def score_dice(self, values: np.ndarray) -> np.ndarray:
+        """
+        Returns what each of the given dice values contributes to the result of the pool.
+
+        The result of a roll is the sum of these scores over all kept dice plus the pool modifier.
+
+        Args:
+            values (np.ndarray): The dice values, including the dice modifier.
+
+        Returns:
+            An integer array with the score of each dice value.
+        """
+        success_threshold = self.effective_success_threshold
+        if success_threshold > 0 or self.failure_threshold > 0:
+            scores = (values >= success_threshold).astype(np.int64)
+            if self.failure_threshold > 0:
+                scores -= values <= self.failure_threshold
+            return scores
+        if self.count_below > -1 or self.count_above > -1:
+            threshold = max(self.count_below, self.count_above)
+            differences = threshold - values if self.count_below > -1 else values - threshold
+            return np.minimum(differences, 0)
+        return values
+
+
+def roll_pool_arrays(
+    number: int,
+    sides: int,
+    high_exploding: ExplodingBehavior,
+    max_depth: int = MAX_EXPLOSION_DEPTH,
+    dice_budget: int = MAX_EXPLOSION_DICE,
+):
+    """
+    Rolls a number of dice as integer arrays, without building a DiceResult per dice.
+
+    Exploding dice are rolled generation by generation. Cascading explosions stop after max_depth
+    generations or when dice_budget extra dice have been rolled, whatever comes first.
+
+    Args:
+        number (int): The number of dice to roll.
+        sides (int): The number of sides on each dice.
+        high_exploding (ExplodingBehavior): The exploding behavior for dice that roll the maximum value.
+        max_depth (int): The maximum number of explosion generations.
+        dice_budget (int): The maximum number of extra dice added by exploding.
+
+    Returns:
+        A tuple of the rolled dice, the extra dice added by exploding (both integer arrays)
+        and whether the explosions were capped by max_depth or dice_budget.
+    """
+    return roll_pools_arrays([number], sides, high_exploding, max_depth, dice_budget)[0]
+
+
+def roll_pools_arrays(
+    numbers: list[int],
+    sides: int,
+    high_exploding: ExplodingBehavior,
+    max_depth: int = MAX_EXPLOSION_DEPTH,
+    dice_budget: int = MAX_EXPLOSION_DICE,
+) -> list[tuple[np.ndarray, np.ndarray, bool]]:
+    """
+    Rolls several pools of dice with the same sides and exploding behavior, drawing each generation at once.
+
+    Args:
+        numbers (list[int]): The number of dice in each pool.
+        sides (int): The number of sides on each dice.
+        high_exploding (ExplodingBehavior): The exploding behavior for dice that roll the maximum value.
+        max_depth (int): The maximum number of explosion generations.
+        dice_budget (int): The maximum number of extra dice added by exploding, per pool.
+
+    Returns:
+        For every pool a tuple like returned by roll_pool_arrays.
+    """
+    dtype = dice_dtype(sides)
+    rng = current_rng()
+    numbers = np.asarray(numbers, dtype=np.int64)
+    pool_indices = np.arange(len(numbers))
+    base_rolls = rng.integers(sides, int(numbers.sum()), dtype)
+    base_parts = np.split(base_rolls, np.cumsum(numbers)[:-1])
+    extra_parts = [[] for _ in numbers]
+    pending = np.zeros(len(numbers), dtype=np.int64)
+    if high_exploding in {ExplodingBehavior.ONCE, ExplodingBehavior.CASCADING}:
+        owners = np.repeat(pool_indices, numbers)
+        pending = np.bincount(owners[base_rolls == sides], minlength=len(numbers))
+    remaining_budget = np.full(len(numbers), dice_budget, dtype=np.int64)
+    for _ in range(max_depth):
+        drawn = np.minimum(pending, remaining_budget)
+        if not drawn.any():
+            break
+        generation = rng.integers(sides, int(drawn.sum()), dtype)
+        for index, part in enumerate(np.split(generation, np.cumsum(drawn)[:-1])):
+            if len(part):
+                extra_parts[index].append(part)
+        remaining_budget -= drawn
+        pending -= drawn
+        if high_exploding == ExplodingBehavior.CASCADING:
+            owners = np.repeat(pool_indices, drawn)
+            pending += np.bincount(owners[generation == sides], minlength=len(numbers))
+    return [
+        (base, np.concatenate(extra) if extra else base[:0], bool(capped))
+        for base, extra, capped in zip(base_parts, extra_parts, pending > 0)
+    ]
+
+
+def roll_many(
+    pools: Sequence[ComplexPool],
+    max_depth: int = MAX_EXPLOSION_DEPTH,
+    dice_budget: int = MAX_EXPLOSION_DICE,
+) -> list:
+    """
+    Rolls many dice pools, drawing the dice of all pools with the same sides and exploding behavior together.
+
+    Thresholds, modifiers and keep rules only matter once the dice are rolled, so pools that differ only
+    in those share one vectorized draw per explosion generation.
+
+    Args:
+        pools (Sequence[ComplexPool]): The dice pools to roll.
+        max_depth (int): The maximum number of generations of cascading explosions.
+        dice_budget (int): The maximum number of extra dice added by exploding, per pool.
+
+    Returns:
+        The result of every pool, in the same order as the pools (like calling roll() on each).
+    """
+    groups: dict[tuple[int, ExplodingBehavior], list[int]] = {}
+    for index, pool in enumerate(pools):
+        groups.setdefault((pool.sides, pool.explode), []).append(index)
+    results = [None] * len(pools)
+    for (sides, explode), indices in groups.items():
+        rolls = roll_pools_arrays(
+            [pools[index].number for index in indices], sides, explode, max_depth, dice_budget
         )
+        for index, (base_rolls, extra_rolls, capped) in zip(indices, rolls):
+            results[index] = pools[index].result_from_rolls(base_rolls, extra_rolls, capped)
+    return results
+
+
+def keep_mask(rolls: np.ndarray, highest_count: int = 0, lowest_count: int = 0) -> np.ndarray:
+    """
+    Selects the dice that count for the result of a pool.
+
+    Args:
+        rolls (np.ndarray): The rolled dice.
+        highest_count (int): If greater than 0, only this many of the highest dice are kept.
+        lowest_count (int): If greater than 0 (and no highest_count is given), only this many of the lowest dice are kept.
+
+    Returns:
+        A boolean array that is True for every dice that is kept.
+    """
+    if highest_count > 0:
+        selected = np.argsort(-rolls, kind="stable")[:highest_count]
+    elif lowest_count > 0:
+        selected = np.argsort(rolls, kind="stable")[:lowest_count]
+    else:
+        return np.ones(rolls.shape, dtype=bool)
+    kept = np.zeros(rolls.shape, dtype=bool)
+    kept[selected] = True
+    return kept
+
+
+def dice_runs(rolls: np.ndarray, kept: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Finds the runs of consecutive dice with the same value and the same keep status.
+
+    Args:
+        rolls (np.ndarray): The rolled dice.
+        kept (np.ndarray): A boolean array that is True for every dice that is kept.
+
+    Returns:
+        A tuple of two integer arrays: the start index and the length of every run.
+    """
+    if not len(rolls):
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    changes = np.flatnonzero((rolls[1:] != rolls[:-1]) | (kept[1:] != kept[:-1])) + 1
+    starts = np.concatenate(([0], changes))
+    return starts, np.diff(np.append(starts, len(rolls)))
+
+
+def materialize_dice(rolls: np.ndarray, sides: int, dice_modifier: int) -> list[DiceResult]:
+    """
+    Builds DiceResult objects for an array of rolled dice.
+
+    Args:
+        rolls (np.ndarray): The rolled dice.
+        sides (int): The number of sides on each dice.
+        dice_modifier (int): The modifier to add to each dice roll.
+
+    Returns:
+        A list of DiceResult objects, one for each rolled dice.
+    """
+    return [
+        DiceResult(sides=sides, dice_modifier=dice_modifier, result=result)
+        for result in rolls.tolist()
+    ]
 
 
 def roll_dice_basic(number: int = 1, sides: int = 6, dice_modifier: int = 0):
@@ -338,8 +833,8 @@ def roll_dice_basic(number: int = 1, sides: int = 6, dice_modifier: int = 0):
         A list of DiceResult objects representing the result of each dice roll.
     """
     return [
-        DiceResult(sides=sides, dice_modifier=dice_modifier, result=random.randint(1, sides))
-        for _ in range(number)
+        DiceResult(sides=sides, dice_modifier=dice_modifier, result=result)
+        for result in current_rng().integers(sides, number).tolist()
     ]
 
 
@@ -363,45 +858,46 @@ def roll_dice_sum(
     Returns:
         A DicePoolResultSum object representing the result of the dice rolls.
     """
-    original_dice, extra_dice = roll_pool(number, sides, high_exploding, dice_modifier)
+    original_dice, extra_dice, capped = roll_pool(number, sides, high_exploding, dice_modifier)
     return DicePoolResultSum(
-        pool_modifier=pool_modifier, dice_results=original_dice, extra_dice=extra_dice
+        pool_modifier=pool_modifier,
+        dice_results=original_dice,
+        extra_dice=extra_dice,
+        capped=capped,
     )
 
 
-def roll_pool(number: int, sides: int, high_exploding: ExplodingBehavior, dice_modifier: int):
+def roll_pool(
+    number: int,
+    sides: int,
+    high_exploding: ExplodingBehavior,
+    dice_modifier: int,
+    max_depth: int = MAX_EXPLOSION_DEPTH,
+    dice_budget: int = MAX_EXPLOSION_DICE,
+):
     """
-    Rolls a number of dice and returns the sum of the results.
+    Rolls a number of dice, adding extra dice for exploding ones.
 
     Args:
         number (int): The number of dice to roll.
         sides (int): The number of sides on each dice.
         high_exploding (ExplodingBehavior): The exploding behavior for dice that roll the maximum value.
         dice_modifier (int): The modifier to add to each dice roll.
-        pool_modifier (int): The modifier to add to the final result.
+        max_depth (int): The maximum number of generations of cascading explosions.
+        dice_budget (int): The maximum number of extra dice added by exploding.
+
+    Returns:
+        A tuple of the rolled dice, the extra dice (both lists of DiceResult objects)
+        and whether the explosions were capped.
     """
-    original_dice = roll_dice_basic(number=number, sides=sides, dice_modifier=dice_modifier)
-    extra_dice = []
-    if high_exploding not in {ExplodingBehavior.NONE, ExplodingBehavior.PLUSSUCCESS}:
-        exploding_count = len([dice for dice in original_dice if dice.is_max])
-        extra_dice = roll_dice_basic(
-            number=exploding_count, sides=sides, dice_modifier=dice_modifier
-        )
-    if high_exploding == ExplodingBehavior.CASCADING:
-        new_dice = extra_dice.copy()
-        extra_dice = []
-        while new_dice:
-            current_dice = new_dice.pop()
-            extra_dice.append(current_dice)
-            if current_dice.is_max:
-                new_dice.append(
-                    DiceResult(
-                        sides=sides,
-                        dice_modifier=dice_modifier,
-                        result=random.randint(1, sides),
-                    )
-                )
-    return original_dice, extra_dice
+    base_rolls, extra_rolls, capped = roll_pool_arrays(
+        number, sides, high_exploding, max_depth, dice_budget
+    )
+    return (
+        materialize_dice(base_rolls, sides, dice_modifier),
+        materialize_dice(extra_rolls, sides, dice_modifier),
+        capped,
+    )
 
 
 def roll_dice_successes(
@@ -425,11 +921,12 @@ def roll_dice_successes(
         pool_modifier (int): The modifier to add to the final result.
         threshold (int): The threshold value to compare the dice rolls to.
     """
-    original_dice, extra_dice = roll_pool(number, sides, high_exploding, dice_modifier)
+    original_dice, extra_dice, capped = roll_pool(number, sides, high_exploding, dice_modifier)
     return DicePoolResultSuccesses(
         pool_modifier=pool_modifier,
         dice_results=original_dice,
         extra_dice=extra_dice,
+        capped=capped,
         success_threshold=threshold,
         failure_threshold=1 if low_subtracion else -1,
         high_exploding=high_exploding,
@@ -0,0 +1,86 @@
+"""
+A library for running heavy dice rolls in worker processes instead of the event loop.
+
+Small rolls are rolled directly, since sending them to another process costs more than rolling them.
+Rolls with at least PROCESS_THRESHOLD_DICE expected dice are rolled in a pool of worker processes, so one
+huge roll does not delay the commands of every other guild. The default threshold is half of the default
+dice limit, so the biggest rolls a guild allows run in a worker. The same pool runs /roll_simulate and the
+exact odds of /roll_odds.
+"""
+import asyncio
+import os
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Optional
+
+import numpy as np
+
+from app.library.polydice import DiceRng, NumpyRng, SecureRng, current_rng, use_rng
+from app.library.roll_limits import DEFAULT_MAX_DICE
+
+PROCESS_THRESHOLD_DICE = int(os.getenv("DICE_PROCESS_THRESHOLD", str(DEFAULT_MAX_DICE // 2)))
+ROLL_WORKERS = int(os.getenv("DICE_ROLL_WORKERS", "2"))
+
+_executor: Optional[ProcessPoolExecutor] = None
+
+
+def _warm_up() -> int:
+    """Does nothing in a worker, submitting it makes the pool start its processes before the first roll."""
+    return os.getpid()
+
+
+def start_roll_executor(workers: int = ROLL_WORKERS) -> ProcessPoolExecutor:
+    """Returns the process pool for heavy rolls, creating it with all workers started on first use."""
+    global _executor
+    if _executor is None:
+        _executor = ProcessPoolExecutor(max_workers=workers)
+        for _ in range(workers):
+            _executor.submit(_warm_up)
+    return _executor
+
+
+def shutdown_roll_executor():
+    """Stops the worker processes, the next heavy roll starts a new pool."""
+    global _executor
+    if _executor is not None:
+        _executor.shutdown(cancel_futures=True)
+        _executor = None
+
+
+def worker_rng() -> DiceRng:
+    """
+    Returns a random source for a roll in a worker process.
+
+    The seed is drawn from the current random source, so seeded rolls stay reproducible although the
+    worker can not advance the state of the source in this process.
+    """
+    rng = current_rng()
+    if isinstance(rng, SecureRng):
+        return rng
+    return NumpyRng(np.random.SeedSequence(rng.integers(2**62, 4, dtype=np.int64).tolist()))
+
+
+def _roll_with_rng(rng: DiceRng, function: Callable, args: tuple):
+    """Runs a roll function in a worker process with the given random source."""
+    with use_rng(rng):
+        return function(*args)
+
+
+async def run_roll(dice: float, function: Callable, *args):
+    """
+    Runs a roll function, in a worker process if it rolls at least PROCESS_THRESHOLD_DICE dice.
+
+    The function and its arguments must be picklable, i.e. module level functions and plain data.
+
+    Args:
+        dice (float): The (expected) number of dice the roll needs.
+        function (Callable): The function that rolls the dice.
+        *args: The arguments for the function.
+
+    Returns:
+        The result of the function.
+    """
+    if dice < PROCESS_THRESHOLD_DICE:
+        return function(*args)
+    return await asyncio.get_running_loop().run_in_executor(
+        start_roll_executor(), _roll_with_rng, worker_rng(), function, args
+    )
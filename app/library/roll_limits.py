@@ -0,0 +1,138 @@
+"""
+A library for limiting the size of dice rolls per guild, based on the predicted cost of the pools.
+
+The cost of a roll is estimated from the compiled pools before any dice are drawn, so huge requests
+like 99999999d100!! are rejected (or downgraded) without allocating anything.
+"""
+import dataclasses
+import math
+import os
+from dataclasses import dataclass
+from typing import Optional, Sequence, Union
+
+from app.library.dice_expression import DiceExpression
+from app.library.polydice import MAX_EXPLOSION_DICE, ComplexPool, RollCost
+
+DEFAULT_MAX_DICE = int(os.getenv("DICE_MAX_DICE", "10000"))
+DEFAULT_MAX_EXPLOSION_DICE = int(os.getenv("DICE_MAX_EXPLOSION_DICE", str(MAX_EXPLOSION_DICE)))
+DEFAULT_SUMMARY_CHARACTERS = int(os.getenv("DICE_SUMMARY_CHARACTERS", "4000"))
+# about a second of a worker process
+DEFAULT_MAX_SIMULATED_DICE = int(os.getenv("DICE_MAX_SIMULATED_DICE", str(10**8)))
+
+
+@dataclass(frozen=True)
+class RollLimits:
+    """
+    The limits for dice rolls in a guild.
+
+    Attributes:
+    -----------
+    max_dice : int
+        The maximum number of dice (without explosions) in one roll.
+    max_explosion_dice : int
+        The maximum number of extra dice added by exploding, per pool.
+    summary_characters : int
+        Rolls whose listing of all dice is predicted to be longer only show the results.
+    downgrade : bool
+        If True, too big rolls are shrunk to max_dice instead of being rejected.
+    max_simulated_dice : int
+        The maximum number of dice (with expected explosions) over all rolls of one simulation.
+    """
+
+    max_dice: int = DEFAULT_MAX_DICE
+    max_explosion_dice: int = DEFAULT_MAX_EXPLOSION_DICE
+    summary_characters: int = DEFAULT_SUMMARY_CHARACTERS
+    downgrade: bool = False
+    max_simulated_dice: int = DEFAULT_MAX_SIMULATED_DICE
+
+
+class RollLimitExceeded(ValueError):
+    """Raised when a roll needs more dice than the limits allow."""
+
+    def __init__(self, cost: RollCost, limits: RollLimits):
+        super().__init__(f"{cost.dice} dice requested, at most {limits.max_dice} allowed")
+        self.cost = cost
+        self.limits = limits
+
+
+@dataclass(frozen=True)
+class RollPlan:
+    """The pools and expressions of a roll after the limits were applied, with their predicted cost."""
+
+    items: tuple[Union[ComplexPool, DiceExpression], ...]
+    cost: RollCost
+    summary_only: bool = False
+    downgraded: bool = False
+
+
+_guild_limits: dict[int, RollLimits] = {}
+
+
+def set_guild_limits(guild_id: int, limits: Optional[RollLimits]):
+    """Sets the limits for rolls in a guild, None restores the default limits."""
+    if limits is None:
+        _guild_limits.pop(guild_id, None)
+    else:
+        _guild_limits[guild_id] = limits
+
+
+def limits_for_guild(guild_id: Optional[int]) -> RollLimits:
+    """Returns the limits for rolls in a guild (or the default limits outside of guilds)."""
+    return _guild_limits.get(guild_id, RollLimits()) if guild_id else RollLimits()
+
+
+def estimate_cost(
+    items: Sequence[Union[ComplexPool, DiceExpression]], max_explosion_dice: int = MAX_EXPLOSION_DICE
+) -> RollCost:
+    """Predicts the cost of rolling all the pools and expressions without rolling them."""
+    cost = RollCost()
+    for item in items:
+        cost += item.estimate_cost(dice_budget=max_explosion_dice)
+    return cost
+
+
+def max_simulated_rolls(
+    items: Sequence[Union[ComplexPool, DiceExpression]], limits: RollLimits
+) -> int:
+    """Returns how often the pools and expressions can be simulated within limits.max_simulated_dice."""
+    dice = estimate_cost(items, limits.max_explosion_dice).expected_dice
+    return int(limits.max_simulated_dice // max(dice, 1))
+
+
+def plan_roll(
+    items: Sequence[Union[ComplexPool, DiceExpression]], limits: RollLimits
+) -> RollPlan:
+    """
+    Applies the limits to the pools and expressions of a roll.
+
+    Args:
+        items (Sequence[Union[ComplexPool, DiceExpression]]): The compiled pools and expressions.
+        limits (RollLimits): The limits of the guild.
+
+    Returns:
+        The plan to roll, with the (possibly downgraded) items and whether only the results should be shown.
+
+    Raises:
+        RollLimitExceeded: If the roll needs too many dice and can not be downgraded.
+    """
+    items = tuple(items)
+    cost = estimate_cost(items, limits.max_explosion_dice)
+    downgraded = False
+    if cost.dice > limits.max_dice:
+        if not limits.downgrade:
+            raise RollLimitExceeded(cost, limits)
+        items = tuple(_downgrade(item, limits.max_dice / cost.dice) for item in items)
+        cost = estimate_cost(items, limits.max_explosion_dice)
+        downgraded = True
+        if cost.dice > limits.max_dice:
+            raise RollLimitExceeded(cost, limits)
+    return RollPlan(items, cost, cost.output_characters > limits.summary_characters, downgraded)
+
+
+def _downgrade(item: Union[ComplexPool, DiceExpression], factor: float):
+    """Shrinks the number of dice of a pool (or of all pools of an expression) by factor, keeping at least one."""
+    if isinstance(item, DiceExpression):
+        return dataclasses.replace(
+            item, pools=tuple(_downgrade(pool, factor) for pool in item.pools)
+        )
+    return dataclasses.replace(item, number=max(math.floor(item.number * factor), 1))
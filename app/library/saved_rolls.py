@@ -1,14 +1,10 @@
 """ This file contains the model for saved rolls and the functions to interact with the database."""
-import os
 from functools import lru_cache
 from typing import Optional
 
-from sqlmodel import Field, Session, SQLModel, create_engine, select
+from sqlmodel import Field, Session, SQLModel, select
 
-connection_string = os.getenv("DB_CONNECTION_STRING", "sqlite:///gifts.db")
-
-
-engine = create_engine(connection_string, echo=True)
+from app.library.database import engine
 
 
 class SavedRoll(SQLModel, table=True):
@@ -31,7 +27,7 @@ class SavedRoll(SQLModel, table=True):
         The dice pool of the saved roll.
     """
     id: Optional[int] = Field(default=None, primary_key=True, index=True)
-    user_id: str
+    user_id: str = Field(index=True)
     discord_id: str
     scope: str
     name: str
@@ -102,6 +98,21 @@ def get_by_id(saved_id: int):
         return session.get(SavedRoll, saved_id)
 
 
+def add_saved_roll(saved_roll: SavedRoll):
+    """
+    Add a saved roll to the database and invalidate the cached lookups.
+
+    Parameters:
+    -----------
+    saved_roll : SavedRoll
+        The saved roll to add.
+    """
+    with Session(engine) as session:
+        session.add(saved_roll)
+        session.commit()
+    invalidate_cache()
+
+
 def invalidate_cache():
     """ Invalidate the cache for the get_by_user function. """
     get_by_user.cache_clear()
@@ -1,13 +1,15 @@
-import os
 from logging.config import fileConfig
 
 from alembic import context
-from sqlalchemy import engine_from_config, pool
+from sqlalchemy import create_engine
+from sqlalchemy.pool import NullPool
+
+from app.library.database import CONNECTION_STRING
 
 # this is the Alembic Config object, which provides
 # access to the values within the .ini file in use.
 config = context.config  # type: ignore
-config.set_main_option("sqlalchemy.url", os.getenv("DB_CONNECTION_STRING", "sqlite:///gifts.db"))
+config.set_main_option("sqlalchemy.url", CONNECTION_STRING.replace("%", "%%"))
 
 # Interpret the config file for Python logging.
 # This line sets up loggers basically.
@@ -67,11 +69,8 @@ def run_migrations_online() -> None:
                 directives[:] = []
                 print("No changes in schema detected.")
 
-    connectable = engine_from_config(
-        config.get_section(config.config_ini_section, {}),
-        prefix="sqlalchemy.",
-        poolclass=pool.NullPool,
-    )
+    # not the runtime engine: its statement timeout would abort long index builds and backfills
+    connectable = create_engine(CONNECTION_STRING, poolclass=NullPool)
 
     with connectable.connect() as connection:
         context.configure(
@@ -0,0 +1,96 @@
+"""indexes for hot lookups
+
+Revision ID: 7f3c1a9e5b2d
+Revises: 3ddfd2d40d9c
+Create Date: 2026-10-18 10:12:41.503117
+
+Adds indexes for the queries the bot runs on every command:
+
+- initiativetracking by channel, in initiative order
+- savedroll by user
+- category_users by user (the primary key starts with the category)
+- rule_system_suggestions by rule system
+- charactersheet_entries and sheet_modifications by category (lookups by user, category and name
+  already use the primary key)
+- character_headers by category and the new lowercase name_lower column, used by find_by_name
+
+Check the query plans with benchmarks/explain_queries.py.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '7f3c1a9e5b2d'
+down_revision: Union[str, None] = '3ddfd2d40d9c'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_index(
+        "ix_initiativetracking_channel_id_initiative_order",
+        "initiativetracking",
+        ["channel_id", "initiative_order"],
+    )
+    op.create_index("ix_savedroll_user_id", "savedroll", ["user_id"])
+    op.create_index("ix_category_users_user_id", "category_users", ["user_id"])
+    op.create_index(
+        "ix_rule_system_suggestions_rule_system", "rule_system_suggestions", ["rule_system"]
+    )
+    op.create_index(
+        "ix_charactersheet_entries_category_id_user_id_name",
+        "charactersheet_entries",
+        ["category_id", "user_id", "name"],
+    )
+    op.create_index(
+        "ix_sheet_modifications_category_id_user_id_name",
+        "sheet_modifications",
+        ["category_id", "user_id", "name"],
+    )
+
+    op.add_column("character_headers", sa.Column("name_lower", sa.String(), nullable=True))
+    # lowercased in Python, since the lower() of sqlite only handles ASCII letters
+    character_headers = sa.table(
+        "character_headers",
+        sa.column("user_id", sa.String()),
+        sa.column("category_id", sa.String()),
+        sa.column("name", sa.String()),
+        sa.column("name_lower", sa.String()),
+    )
+    connection = op.get_bind()
+    for user_id, category_id, name in connection.execute(
+        sa.select(character_headers.c.user_id, character_headers.c.category_id, character_headers.c.name)
+    ).all():
+        connection.execute(
+            character_headers.update()
+            .where(
+                character_headers.c.user_id == user_id,
+                character_headers.c.category_id == category_id,
+                character_headers.c.name == name,
+            )
+            .values(name_lower=name.lower())
+        )
+    with op.batch_alter_table("character_headers") as batch_op:
+        batch_op.alter_column("name_lower", existing_type=sa.String(), nullable=False)
+    op.create_index(
+        "ix_character_headers_category_id_name_lower",
+        "character_headers",
+        ["category_id", "name_lower"],
+    )
+
+
+def downgrade() -> None:
+    op.drop_index("ix_character_headers_category_id_name_lower", table_name="character_headers")
+    with op.batch_alter_table("character_headers") as batch_op:
+        batch_op.drop_column("name_lower")
+    op.drop_index("ix_sheet_modifications_category_id_user_id_name", table_name="sheet_modifications")
+    op.drop_index(
+        "ix_charactersheet_entries_category_id_user_id_name", table_name="charactersheet_entries"
+    )
+    op.drop_index("ix_rule_system_suggestions_rule_system", table_name="rule_system_suggestions")
+    op.drop_index("ix_category_users_user_id", table_name="category_users")
+    op.drop_index("ix_savedroll_user_id", table_name="savedroll")
+    op.drop_index("ix_initiativetracking_channel_id_initiative_order", table_name="initiativetracking")
@@ -0,0 +1,49 @@
+"""add InitiativeChannel table
+
+Revision ID: 9b4e2c7d1f60
+Revises: 7f3c1a9e5b2d
+Create Date: 2026-10-18 14:37:05.218336
+
+Moves the message ID from every initiativetracking row into one initiativechannel row per channel,
+which also holds the current turn, the round and a version counter.
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '9b4e2c7d1f60'
+down_revision: Union[str, None] = '7f3c1a9e5b2d'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    op.create_table(
+        "initiativechannel",
+        sa.Column("channel_id", sa.String(), nullable=False),
+        sa.Column("message_id", sa.String(), nullable=True),
+        sa.Column("current_turn", sa.String(), nullable=True),
+        sa.Column("round", sa.Integer(), nullable=False),
+        sa.Column("version", sa.Integer(), nullable=False),
+        sa.PrimaryKeyConstraint("channel_id"),
+    )
+    # every channel with entries gets a row, with the message ID of its entries (they all had the same)
+    op.execute(
+        "INSERT INTO initiativechannel (channel_id, message_id, current_turn, round, version)"
+        " SELECT channel_id, MAX(message_id), NULL, 0, 0 FROM initiativetracking GROUP BY channel_id"
+    )
+    with op.batch_alter_table("initiativetracking") as batch_op:
+        batch_op.drop_column("message_id")
+
+
+def downgrade() -> None:
+    with op.batch_alter_table("initiativetracking") as batch_op:
+        batch_op.add_column(sa.Column("message_id", sa.String(), nullable=True))
+    op.execute(
+        "UPDATE initiativetracking SET message_id = (SELECT message_id FROM initiativechannel"
+        " WHERE initiativechannel.channel_id = initiativetracking.channel_id)"
+    )
+    op.drop_table("initiativechannel")
@@ -0,0 +1,106 @@
+"""
+Measures inserts into initiative trackers with 500 entries, like battle maps with many tokens.
+
+Compares the sparse order keys with renumbering every entry after the insert point, as the tracker
+did before. Runs on a temporary sqlite database.
+"""
+import os
+import random
+import sys
+import tempfile
+import time
+
+sys.path.append(".")
+
+os.environ["DB_CONNECTION_STRING"] = f"sqlite:///{os.path.join(tempfile.mkdtemp(), 'bench.db')}"
+
+from sqlalchemy import event
+from sqlmodel import Session, select
+
+from app.library.database import engine
+from app.library.initiativatracking import (
+    InitiativeChannel,
+    InitiativeTracking,
+    get_channel_initiative,
+    insert_before_name,
+    set_channel_initiative,
+)
+from app.library.initiative_store import ChannelInitiative
+
+ENTRIES = 500
+INSERTS = 200
+
+
+def legacy_insert_before_name(channel_id: str, name_after: str, name: str):
+    """insert_before_name as it was before, shifting the order of every entry after the insert point."""
+    with Session(engine) as session:
+        current = list(
+            session.exec(
+                select(InitiativeTracking)
+                .where(InitiativeTracking.channel_id == channel_id)
+                .order_by(InitiativeTracking.initiative_order)
+            )
+        )
+        index = [entry for entry in current if entry.name == name_after][0].initiative_order
+        for entry in current:
+            if entry.initiative_order >= index:
+                entry.initiative_order += 1
+        session.add(
+            InitiativeTracking(initiative_order=index, channel_id=channel_id, name=name)
+        )
+        session.commit()
+
+
+def measure_database(insert, channel_id: str) -> tuple[float, float]:
+    """Returns the milliseconds and the number of written rows per insert."""
+    names = [f"token {number}" for number in range(ENTRIES)]
+    set_channel_initiative(channel_id, *names)
+    targets = random.Random(1).choices(names, k=INSERTS)
+    written = 0
+
+    def count_rows(connection, cursor, statement, parameters, context, executemany):
+        nonlocal written
+        if statement.startswith(("UPDATE", "INSERT")):
+            written += cursor.rowcount if cursor.rowcount > 0 else len(parameters)
+
+    event.listen(engine, "after_cursor_execute", count_rows)
+    start = time.perf_counter()
+    for number, target in enumerate(targets):
+        insert(channel_id, target, f"new {number}")
+    seconds = time.perf_counter() - start
+    event.remove(engine, "after_cursor_execute", count_rows)
+    assert len(get_channel_initiative(channel_id)) == ENTRIES + INSERTS
+    return seconds * 1000 / INSERTS, written / INSERTS
+
+
+def measure_memory() -> tuple[float, float]:
+    """Returns the microseconds and the number of rows to write per insert into the in-memory state."""
+    state = ChannelInitiative("memory")
+    state.reset([f"token {number}" for number in range(ENTRIES)])
+    state.take_changes()
+    generator = random.Random(1)
+    written = 0
+    start = time.perf_counter()
+    for number in range(INSERTS):
+        state.insert_before(generator.choice(state.names), f"new {number}")
+        written += len(state.names) if state.replace_all else len(state.changed_names)
+        state.take_changes()
+    seconds = time.perf_counter() - start
+    return seconds * 1e6 / INSERTS, written / INSERTS
+
+
+def main():
+    InitiativeTracking.__table__.create(engine)
+    InitiativeChannel.__table__.create(engine)
+    for label, insert in [
+        ("renumbering", legacy_insert_before_name),
+        ("order keys", insert_before_name),
+    ]:
+        milliseconds, rows = measure_database(insert, label)
+        print(f"database {label:12} {milliseconds:8.2f} ms per insert {rows:8.1f} rows written")
+    microseconds, rows = measure_memory()
+    print(f"in memory {'order keys':11} {microseconds:8.2f} µs per insert {rows:8.1f} rows to write")
+
+
+if __name__ == "__main__":
+    main()
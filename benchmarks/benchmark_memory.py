@@ -0,0 +1,56 @@
+"""Measures the memory used per rolled die by the different dice result representations."""
+import sys
+import tracemalloc
+from dataclasses import dataclass
+
+sys.path.append(".")
+
+from app.library.polydice import (
+    ComplexPool,
+    DiceResult,
+    ExplodingBehavior,
+    materialize_dice,
+    roll_pool_arrays,
+)
+
+
+@dataclass
+class LegacyDiceResult:
+    """DiceResult as it was before it used slots."""
+
+    sides: int
+    dice_modifier: int
+    result: int
+
+
+def bytes_per_die(build, number: int) -> float:
+    """Returns the memory allocated by build() (and still alive) divided by the number of dice."""
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = build()
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    del result
+    return (after - before) / number
+
+
+def main():
+    number = 100000
+    rolls, _, _ = roll_pool_arrays(number, 10, ExplodingBehavior.NONE)
+    values = rolls.tolist()
+    measurements = {
+        "list of dataclass DiceResult (before)": lambda: [
+            LegacyDiceResult(sides=10, dice_modifier=0, result=value) for value in values
+        ],
+        "list of slotted DiceResult": lambda: [
+            DiceResult(sides=10, dice_modifier=0, result=value) for value in values
+        ],
+        "materialized slotted DiceResult": lambda: materialize_dice(rolls, 10, 0),
+        "array-backed ComplexPool result": lambda: ComplexPool(number=number, sides=10).roll(),
+    }
+    for name, build in measurements.items():
+        print(f"{name:<40} {bytes_per_die(build, number):7.1f} bytes per die")
+
+
+if __name__ == "__main__":
+    main()
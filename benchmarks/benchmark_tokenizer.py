@@ -0,0 +1,71 @@
+"""Compares the single-pass dice tokenizer with the previous character-by-character tokenizer."""
+import sys
+import timeit
+
+sys.path.append(".")
+
+from app.library.complex_dice_parser import Parser, ParsingState
+
+
+def legacy_tokenize(description: str) -> list[tuple[ParsingState, int]]:
+    """The tokenizer as it was before the scanner, slicing the description for every character."""
+    state = ParsingState.NUMBER
+    stack = ""
+    tokens_found = []
+    while description:
+        if description[0].isdigit():
+            stack += description[0]
+            description = description[1:]
+        else:
+            tokens_found.append((state, int(stack) if stack else 1))
+            stack = ""
+            state = ParsingState.NONE
+            for token in Parser.tokens_list:
+                if description.startswith(token):
+                    state = Parser.tokens[token]
+                    description = description[len(token) :]
+                    break
+            else:
+                raise ValueError(f"Unknown token {description[0]}")
+    if stack:
+        tokens_found.append((state, int(stack) if stack else 1))
+    return tokens_found
+
+
+def description_of_length(length: int) -> str:
+    """Builds a valid description of about the given length."""
+    description = "12d10s6f1!!10h8"
+    while len(description) < length:
+        description += "++1--2+3-4"
+    return description[:length].rstrip("+-")
+
+
+def main():
+    for length in (1000, 10000):
+        description = description_of_length(length)
+        assert Parser(description).tokens_found == legacy_tokenize(description)
+        number = 200 if length == 1000 else 20
+        legacy = timeit.timeit(lambda: legacy_tokenize(description), number=number) / number
+        scanner = timeit.timeit(lambda: Parser(description), number=number) / number
+        print(
+            f"{length:>6} characters: legacy {legacy * 1e3:8.3f} ms, "
+            f"scanner {scanner * 1e3:8.3f} ms ({legacy / scanner:.1f}x)"
+        )
+    dice_pool = " ".join(["2d6", "1d10", "4d10s6f1!!10", "d20<14"] * 250) + " #comment"
+    number = 50
+    legacy = (
+        timeit.timeit(
+            lambda: [legacy_tokenize(part) for part in dice_pool.split("#")[0].split(" ") if part],
+            number=number,
+        )
+        / number
+    )
+    scanner = timeit.timeit(lambda: Parser.tokenize(dice_pool), number=number) / number
+    print(
+        f"{len(dice_pool):>6} characters in {len(Parser.tokenize(dice_pool))} pools: "
+        f"legacy {legacy * 1e3:8.3f} ms, scanner {scanner * 1e3:8.3f} ms ({legacy / scanner:.1f}x)"
+    )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Runs every database lookup helper and prints the query plan of each statement it sends.
+
+Usage:
+    python benchmarks/explain_queries.py                 fresh sqlite database migrated to head
+    python benchmarks/explain_queries.py --url <url>     an existing database, e.g. a copy of production
+
+The script exits with 1 if any statement reads a whole table instead of searching an index.
+The plans of other databases than sqlite depend on the table statistics, so small tables can be
+scanned although a matching index exists.
+"""
+import argparse
+import os
+import sys
+import tempfile
+
+sys.path.append(".")
+
+
+def lookups() -> list[tuple[str, callable]]:
+    """Returns the lookup helpers of all models, called with arguments that match nothing."""
+    from app.library import initiativatracking, saved_rolls
+    from app.library.charsheet import (
+        CategorySetting,
+        CategoryUser,
+        CharacterHeader,
+        CharactersheetEntry,
+        RuleSystemRolls,
+        RuleSystemSuggestions,
+        SheetModification,
+    )
+
+    return [
+        ("CategoryUser.get", lambda: CategoryUser.get("c", "u")),
+        ("CategoryUser.get_by_category", lambda: CategoryUser.get_by_category("c")),
+        ("CategoryUser.get_by_user", lambda: CategoryUser.get_by_user("u")),
+        ("CategorySetting.get_by_category", lambda: CategorySetting.get_by_category("c")),
+        ("CharacterHeader.get", lambda: CharacterHeader.get("u", "c", "n")),
+        ("CharacterHeader.get_available", lambda: CharacterHeader.get_available("u", "c")),
+        ("CharacterHeader.find_by_name", lambda: CharacterHeader.find_by_name("c", "n")),
+        ("CharacterHeader.get_by_category", lambda: CharacterHeader.get_by_category("c")),
+        ("CharactersheetEntry.get", lambda: CharactersheetEntry.get("u", "c", "n")),
+        ("CharactersheetEntry.get_by_category", lambda: CharactersheetEntry.get_by_category("c")),
+        ("CharactersheetEntry.get_by_user", lambda: CharactersheetEntry.get_by_user("u")),
+        (
+            "CharactersheetEntry.get_by_user_and_category",
+            lambda: CharactersheetEntry.get_by_user_and_category("u", "c"),
+        ),
+        ("SheetModification.get_key", lambda: SheetModification.get_key("u", "c", "n", "k")),
+        ("SheetModification.get", lambda: SheetModification.get("u", "c", "n")),
+        ("SheetModification.get_by_category", lambda: SheetModification.get_by_category("c")),
+        ("SheetModification.get_by_user", lambda: SheetModification.get_by_user("u")),
+        (
+            "SheetModification.get_by_user_and_category",
+            lambda: SheetModification.get_by_user_and_category("u", "c"),
+        ),
+        ("RuleSystemRolls.get", lambda: RuleSystemRolls.get("r", "n")),
+        ("RuleSystemRolls.get_by_rule_system", lambda: RuleSystemRolls.get_by_rule_system("r")),
+        (
+            "RuleSystemSuggestions.get_by_rule_system",
+            lambda: RuleSystemSuggestions.get_by_rule_system("r"),
+        ),
+        # the cached functions are called through __wrapped__, a cache hit sends no statement
+        ("saved_rolls.get_by_user", lambda: saved_rolls.get_by_user.__wrapped__("u")),
+        ("saved_rolls.get_by_id", lambda: saved_rolls.get_by_id.__wrapped__(1)),
+        (
+            "initiativatracking.get_channel_initiative",
+            lambda: initiativatracking.get_channel_initiative("c"),
+        ),
+        (
+            "initiativatracking.load_channel_initiative",
+            lambda: initiativatracking.load_channel_initiative("c"),
+        ),
+    ]
+
+
+def explain(connection, statement: str, parameters) -> list[str]:
+    """Returns the lines of the query plan of a statement."""
+    if connection.dialect.name == "sqlite":
+        rows = connection.exec_driver_sql(f"EXPLAIN QUERY PLAN {statement}", parameters)
+        return [row[-1] for row in rows]
+    return [row[0] for row in connection.exec_driver_sql(f"EXPLAIN {statement}", parameters)]
+
+
+def is_full_scan(plan_line: str) -> bool:
+    """Returns True if the plan line reads a whole table (or a whole index) instead of searching."""
+    return plan_line.startswith("SCAN ") or "Seq Scan" in plan_line
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--url", help="the database to explain the queries on")
+    args = parser.parse_args()
+
+    if args.url:
+        os.environ["DB_CONNECTION_STRING"] = args.url
+    else:
+        database_file = os.path.join(tempfile.mkdtemp(), "explain.db")
+        os.environ["DB_CONNECTION_STRING"] = f"sqlite:///{database_file}"
+        from alembic import command
+        from alembic.config import Config
+
+        command.upgrade(Config("alembic.ini"), "head")
+
+    from sqlalchemy import event
+
+    from app.library.database import engine
+
+    statements: list[tuple[str, object]] = []
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def capture(connection, cursor, statement, parameters, context, executemany):
+        statements.append((statement, parameters))
+
+    full_scans = 0
+    with engine.connect() as connection:
+        for label, lookup in lookups():
+            statements.clear()
+            lookup()
+            captured = list(statements)
+            print(label)
+            for statement, parameters in captured:
+                for line in explain(connection, statement, parameters):
+                    marker = "!!" if is_full_scan(line) else "  "
+                    full_scans += is_full_scan(line)
+                    print(f"  {marker} {line}")
+    print(f"{full_scans} full scans")
+    sys.exit(1 if full_scans else 0)
+
+
+if __name__ == "__main__":
+    main()
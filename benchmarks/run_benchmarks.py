@@ -0,0 +1,128 @@
+"""
+Benchmarks the dice engine and parser and compares the timings with stored baselines.
+
+Usage:
+    python benchmarks/run_benchmarks.py             compare with benchmarks/baseline.json
+    python benchmarks/run_benchmarks.py --update    store the current timings as new baseline
+
+The script exits with 1 if any benchmark got slower than the baseline times the threshold.
+Baselines depend on the machine, update them when running on new hardware.
+"""
+import argparse
+import json
+import pathlib
+import sys
+import timeit
+
+import colorama
+
+sys.path.append(".")
+
+from app.library.complex_dice_parser import Parser, compile_dice_pool, compile_pool
+from app.library.polydice import (
+    ExplodingBehavior,
+    NumpyRng,
+    roll_dice_successes,
+    roll_dice_sum,
+    roll_many,
+    use_rng,
+)
+
+BASELINE_PATH = pathlib.Path(__file__).parent / "baseline.json"
+DEFAULT_THRESHOLD = 1.5
+REPEATS = 7
+
+ADVERSARIAL_DESCRIPTION = "12d10s6f1!!10h8" + "++1--2+3-4" * 1000
+MULTI_POOL = " ".join(["2d6", "1d10", "4d10s6f1!!10", "d20<14"] * 25) + " #comment"
+
+small_pool = compile_pool("2d6+3")
+large_pool = compile_pool("1000d10s6f1")
+exploding_pool = compile_pool("20d6!!6h3")
+adversarial_exploding_pool = compile_pool("50d2!!2")
+small_result = compile_pool("4d10s6f1!!10").roll()
+large_result = compile_pool("5000d6").roll()
+
+BENCHMARKS = {
+    "roll_dice_successes 10d10": lambda: roll_dice_successes(
+        10, 10, ExplodingBehavior.ONCE, True, 0, 0, 6
+    ),
+    "roll_dice_sum 3d6": lambda: roll_dice_sum(3, 6),
+    "ComplexPool.roll small": small_pool.roll,
+    "ComplexPool.roll large": large_pool.roll,
+    "ComplexPool.roll exploding": exploding_pool.roll,
+    "ComplexPool.roll adversarial explosions": adversarial_exploding_pool.roll,
+    "roll_many 36 pools": lambda: roll_many(
+        [small_pool, exploding_pool, compile_pool("1d20+3")] * 12
+    ),
+    "Parser typical": lambda: Parser("4d10s6f1!!10").build_pool(),
+    "Parser adversarial 10k characters": lambda: Parser(ADVERSARIAL_DESCRIPTION),
+    "Parser.tokenize 100 pools": lambda: Parser.tokenize(MULTI_POOL),
+    "formatted small": lambda: compile_pool("4d10s6f1!!10").result_from_rolls(
+        small_result.base_rolls, small_result.extra_rolls
+    ).formatted(),
+    "formatted large with budget": lambda: compile_pool("5000d6").result_from_rolls(
+        large_result.base_rolls, large_result.extra_rolls
+    ).formatted(budget=1024),
+    "roll_complex pipeline": lambda: [
+        result.formatted(budget=1024)
+        for result in roll_many(compile_dice_pool("2d6 1d10 4d10s6f1!!10 d20<14 #Attack"))
+    ],
+}
+
+
+def measure(benchmark) -> float:
+    """Returns the fastest time of a single call in seconds, over REPEATS automatically sized runs."""
+    timer = timeit.Timer(benchmark)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat=REPEATS, number=number)) / number
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--update", action="store_true", help="store the timings as new baseline")
+    parser.add_argument(
+        "--threshold",
+        type=float,
+        default=DEFAULT_THRESHOLD,
+        help=f"slowdown factor that counts as regression (default {DEFAULT_THRESHOLD})",
+    )
+    arguments = parser.parse_args()
+    baseline: dict[str, float] = (
+        json.loads(BASELINE_PATH.read_text(encoding="utf8")) if BASELINE_PATH.exists() else {}
+    )
+    timings = {}
+    regressions = []
+    with use_rng(NumpyRng(1234)):
+        for name, benchmark in BENCHMARKS.items():
+            timings[name] = measure(benchmark)
+            old_timing = baseline.get(name)
+            ratio = timings[name] / old_timing if old_timing else 1.0
+            line_color = colorama.Fore.LIGHTWHITE_EX
+            if ratio > arguments.threshold:
+                line_color = colorama.Fore.RED
+                regressions.append(name)
+            elif ratio < 1 / arguments.threshold:
+                line_color = colorama.Fore.GREEN
+            print(
+                line_color,
+                name.ljust(45, "-"),
+                f"{timings[name] * 1e6:10.1f} µs".ljust(14),
+                f"({old_timing * 1e6:.1f} µs)".ljust(16) if old_timing else "(new)".ljust(16),
+                f"x{ratio:.2f}",
+            )
+    print(colorama.Fore.RESET)
+    if arguments.update:
+        BASELINE_PATH.write_text(json.dumps(timings, indent=4), encoding="utf8")
+        print(f"Stored baseline in {BASELINE_PATH}")
+    elif regressions:
+        print(
+            f"{len(regressions)} benchmark(s) slower than x{arguments.threshold}: "
+            + ", ".join(regressions)
+        )
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -69,3 +69,45 @@ def test_init_with_highest_2():
         (ParsingState.SIDES, 6),
         (ParsingState.HIGHEST, 2),
     ]
+
+
+def test_compile_pool_is_cached_and_immutable():
+    pool = compile_pool("4d10s6f1!!10")
+    assert compile_pool("4d10s6f1!!10") is pool
+    assert pool == Parser("4d10s6f1!!10").build_pool()
+    assert hash(pool) == hash(Parser("4d10s6f1!!10").build_pool())
+    try:
+        pool.number = 5
+    except AttributeError:
+        pass
+    else:
+        assert False, "Expected the compiled pool to be immutable"
+
+
+def test_compile_dice_pool_ignores_comment():
+    pools = compile_dice_pool("d20<14  2d6+3 #Attack 1d4")
+    assert [pool.description for pool in pools] == ["d20<14", "2d6+3"]
+    assert pools[1].pool_modifier == 3
+    assert compile_dice_pool("d20<14  2d6+3 #Attack 1d4") is pools
+
+
+def test_tokenize_multiple_pools_with_comment():
+    pools = Parser.tokenize("2d6 1d10!!\t4d10s6f1 #Jump 3d4")
+    assert [description for description, _ in pools] == ["2d6", "1d10!!", "4d10s6f1"]
+    assert pools[1][1] == [(ParsingState.NUMBER, 1), (ParsingState.SIDES, 10)]
+    assert pools[2][1] == [
+        (ParsingState.NUMBER, 4),
+        (ParsingState.SIDES, 10),
+        (ParsingState.SUCCESS, 6),
+        (ParsingState.FAILURE, 1),
+    ]
+
+
+def test_tokenize_reports_error_position():
+    try:
+        Parser.tokenize("2d6 3d6x2")
+    except DiceSyntaxError as e:
+        assert str(e) == "Unknown token x"
+        assert e.position == 7
+    else:
+        assert False, "Expected DiceSyntaxError to be raised"
@@ -0,0 +1,82 @@
+import asyncio
+import sys
+import threading
+
+sys.path.append(".")
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from app.library import charsheet, db_models, initiativatracking, saved_rolls
+from app.library.database import *
+
+
+def test_all_modules_share_one_engine():
+    assert db_models.engine is engine
+    assert saved_rolls.engine is engine
+    assert initiativatracking.engine is engine
+    assert charsheet.Session is Session
+
+
+def test_engine_options():
+    options = engine_options("sqlite:///some.db", 1000, "WARNING")
+    assert options["echo"] is False
+    assert options["pool_size"] == POOL_SIZE
+    assert "pool_size" not in engine_options("sqlite://", 1000, "INFO")
+    assert engine_options("sqlite://", 1000, "INFO")["echo"] is True
+    assert engine_options("sqlite://", 1000, "DEBUG")["echo"] == "debug"
+    assert engine_options("postgresql://user@host/db", 1000)["connect_args"] == {
+        "options": "-c statement_timeout=1000"
+    }
+
+
+def test_sqlite_statement_timeout():
+    timed_engine = create_database_engine("sqlite://", statement_timeout_ms=50)
+    slow_query = text(
+        "WITH RECURSIVE numbers(n) AS (SELECT 1 UNION ALL SELECT n + 1 FROM numbers)"
+        " SELECT count(*) FROM numbers"
+    )
+    with timed_engine.connect() as connection:
+        assert connection.execute(text("SELECT 1")).scalar() == 1
+        with pytest.raises(OperationalError):
+            connection.execute(slow_query).scalar()
+
+
+def test_run_db_runs_in_database_thread():
+    thread_name = asyncio.run(run_db(lambda: threading.current_thread().name))
+    assert thread_name.startswith("database")
+    assert asyncio.run(run_db(int, "12", base=16)) == 18
+
+
+def test_sqlite_pragmas_on_connect(tmp_path):
+    tuned_engine = create_database_engine(f"sqlite:///{tmp_path / 'tuned.db'}")
+    with tuned_engine.connect() as connection:
+        assert connection.execute(text("PRAGMA journal_mode")).scalar() == "wal"
+        assert connection.execute(text("PRAGMA synchronous")).scalar() == 1
+        assert connection.execute(text("PRAGMA busy_timeout")).scalar() == SQLITE_BUSY_TIMEOUT_MS
+        assert connection.execute(text("PRAGMA cache_size")).scalar() == -SQLITE_CACHE_KIB
+    assert "PRAGMA journal_mode = WAL" not in sqlite_pragmas(":memory:")
+
+
+def test_sqlite_writes_are_serialized():
+    async def write_all():
+        return await asyncio.gather(
+            *[run_db_write(lambda: threading.current_thread().name) for _ in range(5)]
+        )
+
+    assert set(asyncio.run(write_all())) == {"database-writer_0"}
+
+
+def test_find_by_name_prefers_prefix():
+    category_id = "test_find_by_name"
+    charsheet.CharacterHeader.create("1", category_id, "Anna", "")
+    charsheet.CharacterHeader.create("2", category_id, "Joanna", "")
+    try:
+        assert charsheet.CharacterHeader.get("2", category_id, "Joanna").name_lower == "joanna"
+        assert [header.name for header in charsheet.CharacterHeader.find_by_name(category_id, "ANN")] == ["Anna"]
+        assert [header.name for header in charsheet.CharacterHeader.find_by_name(category_id, "oann")] == ["Joanna"]
+        assert charsheet.CharacterHeader.find_by_name(category_id, "%") == []
+    finally:
+        charsheet.CharacterHeader.delete("1", category_id, "Anna")
+        charsheet.CharacterHeader.delete("2", category_id, "Joanna")
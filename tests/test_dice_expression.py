@@ -0,0 +1,64 @@
+import sys
+
+sys.path.append(".")
+
+import numpy as np
+
+from app.library.complex_dice_parser import DiceSyntaxError
+from app.library.dice_expression import *
+from app.library.polydice import NumpyRng, use_rng
+
+
+def test_plain_pools_stay_pools():
+    items = compile_dice_expressions("2d6+3 d20<14 4d10s6f1++1 #Attack 1d4")
+    assert all(isinstance(item, ComplexPool) for item in items)
+    assert [item.description for item in items] == ["2d6+3", "d20<14", "4d10s6f1++1"]
+
+
+def test_compile_expression_precedence_and_cache():
+    expression = compile_expression("2d6+1d8*2-3")
+    assert compile_expression("2d6+1d8*2-3") is expression
+    assert [pool.description for pool in expression.pools] == ["2d6", "1d8"]
+    assert expression.root == BinaryOperation(
+        "-",
+        BinaryOperation("+", PoolLeaf(0), BinaryOperation("*", PoolLeaf(1), Constant(2))),
+        Constant(3),
+    )
+    assert expression.evaluate([7, 5]) == 14
+
+
+def test_evaluate_brackets_negation_and_division():
+    assert compile_expression("(1d6+1d4)*2").evaluate([3, 2]) == 10
+    assert compile_expression("-1d6/2").evaluate([5]) == -3
+    assert list(compile_expression("(3d6h2)/2").evaluate([np.array([3, 12])])) == [1, 6]
+
+
+def test_roll_dice_expressions_uses_one_batch():
+    items = compile_dice_expressions("(1d1+2)*3 2d1 1d1-3")
+    results = roll_dice_expressions(items)
+    assert results[0].value == 9
+    assert results[0].formatted().endswith("= 9")
+    assert results[1].sum == 2
+    assert results[2].sum == -2
+    with use_rng(NumpyRng(7)):
+        first = roll_dice_expressions(compile_dice_expressions("2d6+1d8+3"))[0]
+    with use_rng(NumpyRng(7)):
+        second = compile_expression("2d6+1d8+3").roll()
+    assert first.value == second.value
+    assert first.value == sum(result.sum for result in first.results) + 3
+
+
+def test_expression_errors_report_position():
+    for dice_pool, token, position in [
+        ("2d6 (1d4+2", "(", 10),
+        ("2d6/1d4", "/", 3),
+        ("1d4 (2d6))", ")", 9),
+        ("2d6+x", "x", 4),
+    ]:
+        try:
+            compile_dice_expressions(dice_pool)
+        except DiceSyntaxError as e:
+            assert e.token == token, dice_pool
+            assert e.position == position, dice_pool
+        else:
+            assert False, f"Expected DiceSyntaxError for {dice_pool}"
@@ -0,0 +1,86 @@
+import pytest
+
+from app.library.complex_dice_parser import Parser
+from app.library.dice_expression import compile_expression
+from app.library.dice_odds import (
+    OddsTooExpensive,
+    OutcomeDistribution,
+    expression_distribution,
+    pool_distribution,
+    render_distribution,
+    trim_chart,
+)
+
+
+def odds(description: str) -> OutcomeDistribution:
+    return pool_distribution(Parser(description).build_pool())
+
+
+def test_sum_of_two_dice():
+    distribution = odds("2d6")
+    assert distribution.probability(7) == pytest.approx(6 / 36)
+    assert distribution.probability(2) == pytest.approx(1 / 36)
+    assert distribution.mean == pytest.approx(7)
+
+
+def test_keep_highest_and_lowest():
+    assert odds("4d6h3").mean == pytest.approx(15869 / 1296)
+    assert odds("2d20b1").mean == pytest.approx(7.175)
+
+
+def test_exploding_once():
+    assert odds("1d6!6").mean == pytest.approx(3.5 + 3.5 / 6)
+
+
+def test_cascading_explosions_are_truncated():
+    distribution = pool_distribution(Parser("1d6!!6").build_pool(), explosion_depth=2)
+    assert distribution.probabilities.sum() == pytest.approx(1)
+    assert distribution.outcomes.max() == 18
+
+
+def test_successes_and_difference():
+    distribution = odds("4d10s6f1")
+    assert distribution.mean == pytest.approx(4 * (0.5 - 0.1))
+    assert distribution.outcomes.min() == -4
+    assert odds("d20<14").mean == pytest.approx(-21 / 20)
+
+
+def test_render_distribution():
+    rendered = render_distribution(odds("2d6"))
+    assert len(rendered.splitlines()) == 11
+    assert "16.67%" in rendered
+
+
+def test_expensive_pools_are_rejected():
+    with pytest.raises(OddsTooExpensive):
+        odds("500d100h250")
+    with pytest.raises(OddsTooExpensive):
+        odds("100000d100")
+    assert odds("1000d6h8").outcomes.max() == 48
+
+
+def test_expressions_combine_their_pools():
+    distribution = expression_distribution(compile_expression("2d6+1d8"))
+    assert distribution.mean == pytest.approx(11.5)
+    assert (distribution.outcomes.min(), distribution.outcomes.max()) == (3, 20)
+    doubled = expression_distribution(compile_expression("(2d6+3)*2"))
+    assert doubled.probability(20) == pytest.approx(6 / 36)
+    assert doubled.probability(21) == 0
+    assert expression_distribution(compile_expression("2d6-d20<14")).mean == pytest.approx(7 - 21 / 20)
+    assert expression_distribution(compile_expression("d6*d6")).mean == pytest.approx(3.5**2)
+
+
+def test_render_distribution_covers_wide_pools():
+    distribution = odds("5d1000")
+    rows = render_distribution(distribution).splitlines()
+    assert len(rows) == 20
+    low = int(rows[0].split()[0].split("-")[0])
+    high = int(rows[-1].split()[0].split("-")[-1])
+    covered = distribution.at_least(low) - distribution.at_least(high + 1)
+    assert covered >= 0.999
+
+
+def test_trim_chart_drops_the_tails():
+    rows = render_distribution(odds("2d6")).splitlines()
+    trimmed = trim_chart("\n".join(rows), len("\n".join(rows[1:-1])))
+    assert trimmed.splitlines() == rows[1:-1]
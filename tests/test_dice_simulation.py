@@ -0,0 +1,36 @@
+import numpy as np
+import pytest
+
+from app.library.complex_dice_parser import Parser
+from app.library.dice_odds import pool_distribution
+from app.library.dice_simulation import simulate_dice_pool, simulate_pool
+
+
+def test_simulate_pool_matches_expected_value():
+    results = simulate_pool(Parser("4d6h3").build_pool(), 200000, np.random.default_rng(1))
+    assert results.min() >= 3 and results.max() <= 18
+    assert results.mean() == pytest.approx(15869 / 1296, abs=0.05)
+
+
+def test_simulate_pool_exploding():
+    pool = Parser("3d6!!6h2").build_pool()
+    results = simulate_pool(pool, 200000, np.random.default_rng(2))
+    assert results.min() == 2 and results.max() == 12
+    assert results.mean() == pytest.approx(pool_distribution(pool).mean, abs=0.05)
+
+
+def test_simulate_dice_pool_totals():
+    simulation = simulate_dice_pool("d20<14 d20<12 3d10s6 #Mu Ch", 1000, seed=3)
+    assert simulation.rolls == 1000
+    assert [statistic.label for statistic in simulation.statistics] == ["d20<14", "d20<12", "3d10s6", "Σ sum"]
+    assert simulation.statistics[3].mean == pytest.approx(
+        -(simulation.statistics[0].mean + simulation.statistics[1].mean)
+    )
+    assert simulation.statistics[3].percentiles[5] <= simulation.statistics[3].percentiles[95]
+    assert "%" in simulation.statistics[2].chart
+    assert simulation.rolls_per_second > 0
+
+
+def test_simulated_chart_covers_wide_pools():
+    simulation = simulate_dice_pool("3000d100", 100000, seed=4)
+    assert len(simulation.statistics[0].chart.splitlines()) == 20
@@ -0,0 +1,36 @@
+import sys
+
+sys.path.append(".")
+
+from interactions import Embed
+
+from app.embeds import *
+
+
+def make_embed(field_length: int, fields: int = 1) -> Embed:
+    embed = Embed(title="T")
+    for _ in range(fields):
+        embed.add_field(name="n", value="x" * field_length)
+    return embed
+
+
+def test_embed_length_without_description():
+    assert embed_length(make_embed(10, 3)) == 1 + 3 * 11
+    assert embed_length(Embed(title="T", description="abc", footer="four")) == 8
+
+
+def test_pack_embeds_respects_count_and_length():
+    assert pack_embeds([]) == []
+    small = [make_embed(10) for _ in range(25)]
+    assert [len(message) for message in pack_embeds(small)] == [10, 10, 5]
+    large = [make_embed(1000, 2) for _ in range(5)]
+    assert [len(message) for message in pack_embeds(large)] == [2, 2, 1]
+    assert sum(pack_embeds(small + large), []) == small + large
+
+
+def test_split_fields_respects_count_and_length():
+    assert len(split_fields("T", [])) == 1
+    embeds = split_fields("T", [("n", "x" * 1000)] * 7, description="d")
+    assert [len(embed.fields) for embed in embeds] == [5, 2]
+    assert all(embed_length(embed) <= EMBED_TOTAL_MAX for embed in embeds)
+    assert [len(embed.fields) for embed in split_fields("T", [("n", "x")] * 30)] == [25, 5]
@@ -303,6 +303,18 @@ class TestCommands(unittest.IsolatedAsyncioTestCase):
         self.assertTrue(actions[0].message['content'] == "Fehlende Werte für char3: attribute1" , actions[0].message)
         self.assertTrue("char2" in actions[1].message['content'], actions[1].message)
 
+        print("check initiative roll with many npcs")
+        actions = await call_slash(
+            CharSheetManager.gm_roll_initiative,
+            **special_context_kwargs,
+            npc_slots=150,
+            npc_roll="10d6",
+            )
+        contents = [action.message['content'] for action in actions[1:]]
+        self.assertTrue(len(contents) > 1, "Expected the rolls to be split over several messages")
+        self.assertTrue(all(len(content) <= 2000 for content in contents), [len(content) for content in contents])
+        self.assertTrue(sum(content.count("NSC") for content in contents) == 150, contents)
+
 
 
 
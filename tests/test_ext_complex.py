@@ -124,3 +124,172 @@ class TestCommands(unittest.IsolatedAsyncioTestCase):
         self.assertTrue(actions[0].action_type == ActionType.DEFER, "Expected a defer action")
         self.assertTrue(actions[1].action_type == ActionType.SEND, "Expected a message to be sent")
         self.assertTrue(actions[1].message["embeds"][0]["description"].startswith("Würfele 2d6+3"), actions[1].message)
+
+    async def test_roll_odds(self):
+        actions = await call_slash(
+            RollComplex.roll_odds,
+            **self.context_kwargs,
+            dice_pool="2d6 4d10s6f1 #Test")
+        self.assertTrue(len(actions) == 2, f"Expected a defer and a send action but got {actions}")
+        self.assertTrue(actions[0].action_type == ActionType.DEFER, "Expected a defer action")
+        fields = actions[1].message["embeds"][0]["fields"]
+        self.assertTrue(len(fields) == 2, fields)
+        self.assertTrue(fields[0]["value"].startswith("Erwartungswert 7.00"), fields[0])
+
+    async def test_roll_odds_expression(self):
+        actions = await call_slash(
+            RollComplex.roll_odds,
+            **self.context_kwargs,
+            dice_pool="2d6+1d8")
+        fields = actions[1].message["embeds"][0]["fields"]
+        self.assertTrue(fields[0]["value"].startswith("Erwartungswert 11.50"), fields[0])
+
+    async def test_roll_odds_splits_embeds(self):
+        actions = await call_slash(
+            RollComplex.roll_odds,
+            **self.context_kwargs,
+            dice_pool=" ".join(["100d100"] * 8))
+        embeds = [embed for action in actions[1:] for embed in action.message["embeds"]]
+        self.assertTrue(len(embeds) > 1, embeds)
+        self.assertTrue(sum(len(embed["fields"]) for embed in embeds) == 8, embeds)
+        for action in actions[1:]:
+            length = sum(
+                len(embed["title"]) + sum(len(field["name"]) + len(field["value"]) for field in embed["fields"])
+                for embed in action.message["embeds"]
+            )
+            self.assertTrue(length <= 6000, length)
+
+    async def test_roll_odds_too_expensive(self):
+        actions = await call_slash(
+            RollComplex.roll_odds,
+            **self.context_kwargs,
+            dice_pool="2d6 500d100h250")
+        fields = actions[1].message["embeds"][0]["fields"]
+        self.assertTrue(len(fields) == 2, fields)
+        self.assertTrue("/roll_simulate" in fields[1]["value"], fields[1])
+
+    async def test_roll_simulate(self):
+        actions = await call_slash(
+            RollComplex.roll_simulate,
+            **self.context_kwargs,
+            dice_pool="d20<14 d20<12 #Mu Ch",
+            rolls=1000)
+        self.assertTrue(len(actions) == 2, f"Expected a defer and a send action but got {actions}")
+        self.assertTrue(actions[0].action_type == ActionType.DEFER, "Expected a defer action")
+        embed = actions[1].message["embeds"][0]
+        self.assertTrue(embed["description"].startswith("1000 Würfe"), embed)
+        self.assertTrue(len(embed["fields"]) == 3, embed["fields"])
+
+    async def test_roll_simulate_splits_embeds(self):
+        actions = await call_slash(
+            RollComplex.roll_simulate,
+            **self.context_kwargs,
+            dice_pool=" ".join(["1500d100"] * 6),
+            rolls=1000)
+        embeds = [embed for action in actions[1:] for embed in action.message["embeds"]]
+        self.assertTrue(len(embeds) > 1, embeds)
+        fields = [field for embed in embeds for field in embed["fields"]]
+        self.assertTrue(len(fields) == 7, fields)
+        self.assertTrue(all(len(field["value"]) <= 1024 for field in fields), fields)
+
+    async def test_roll_simulate_respects_budget(self):
+        actions = await call_slash(
+            RollComplex.roll_simulate,
+            **self.context_kwargs,
+            dice_pool="10000d6",
+            rolls=1000000)
+        self.assertTrue(len(actions) == 2, f"Expected a defer and a send action but got {actions}")
+        self.assertTrue("höchstens 10000 sind möglich" in actions[1].message["content"], actions[1].message)
+
+    async def test_roll_rng_seeded_replays(self):
+        results = []
+        for _ in range(2):
+            await call_slash(
+                RollComplex.roll_rng,
+                **self.context_kwargs,
+                source="seeded",
+                seed=42)
+            actions = await call_slash(
+                RollComplex.roll_complex,
+                **self.context_kwargs,
+                dice_pool="20d10")
+            results.append(actions[1].message["embeds"][0]["fields"][0]["value"])
+        await call_slash(
+            RollComplex.roll_rng,
+            **self.context_kwargs,
+            source="fast")
+        self.assertTrue(results[0] == results[1], results)
+
+    async def test_roll_rng_server_scope_needs_guild(self):
+        direct_message_kwargs = {
+            key: value for key, value in self.context_kwargs.items() if key != "test_ctx_guild"
+        }
+        direct_message_kwargs["test_ctx_guild_id"] = None
+        actions = await call_slash(
+            RollComplex.roll_rng,
+            **direct_message_kwargs,
+            source="seeded",
+            seed=42,
+            scope="server")
+        self.assertTrue(len(actions) == 1, f"Expected a send action but got {actions}")
+        self.assertTrue(actions[0].message["content"].startswith("Die Zufallsquelle"), actions[0].message)
+        self.assertTrue(actions[0].message["flags"] & MessageFlags.EPHEMERAL, actions[0].message)
+
+    async def test_roll_complex_expression(self):
+        actions = await call_slash(
+            RollComplex.roll_complex,
+            **self.context_kwargs,
+            dice_pool="(1d1+2)*3 2d6")
+        self.assertTrue(len(actions) == 2, f"Expected a defer and a send action but got {actions}")
+        fields = actions[1].message["embeds"][0]["fields"]
+        self.assertTrue(len(fields) == 2, fields)
+        self.assertTrue(fields[0]["name"] == "(1d1+2)*3:", fields[0])
+        self.assertTrue(fields[0]["value"].endswith("= 9"), fields[0])
+
+    async def test_roll_limits(self):
+        await call_slash(
+            RollComplex.roll_limits,
+            **self.context_kwargs,
+            max_dice=100)
+        actions = await call_slash(
+            RollComplex.roll_complex,
+            **self.context_kwargs,
+            dice_pool="99999999d100!!")
+        self.assertTrue(actions[1].message["embeds"][0]["description"].startswith("Zu viele Würfel"), actions[1].message)
+        await call_slash(
+            RollComplex.roll_limits,
+            **self.context_kwargs,
+            max_dice=100,
+            mode="downgrade")
+        actions = await call_slash(
+            RollComplex.roll_complex,
+            **self.context_kwargs,
+            dice_pool="500d6")
+        embed = actions[1].message["embeds"][0]
+        self.assertTrue("reduziert auf 100" in embed["description"], embed)
+        await call_slash(
+            RollComplex.roll_limits,
+            **self.context_kwargs)
+
+    async def test_roll_complex_packs_embeds(self):
+        actions = await call_slash(
+            RollComplex.roll_complex,
+            **self.context_kwargs,
+            dice_pool=" ".join(["2d6"] * 60))
+        self.assertTrue(len(actions) == 2, f"Expected a defer and a single send action but got {actions}")
+        embeds = actions[1].message["embeds"]
+        self.assertTrue([len(embed["fields"]) for embed in embeds] == [25, 25, 10], embeds)
+
+    async def test_roll_syntax_error_shows_position(self):
+        actions = await call_slash(
+            RollComplex.roll_complex,
+            **self.context_kwargs,
+            dice_pool="2d6 d6/0")
+        description = actions[1].message["embeds"][0]["description"]
+        self.assertTrue(description.startswith("Unerwartetes `/` an Position 7"), description)
+        self.assertTrue("2d6 d6/0\n      ^" in description, description)
+        actions = await call_slash(
+            RollComplex.roll_odds,
+            **self.context_kwargs,
+            dice_pool="2d6x")
+        self.assertTrue(actions[1].message["content"].startswith("Unerwartetes `x` an Position 4"), actions[1].message)
@@ -1,10 +1,13 @@
 import unittest
 import asyncio
-from interactions import MessageFlags
+from unittest.mock import patch
+from interactions import MessageFlags, to_snowflake
 
 
-from app.interactions_unittest import ActionType, SendAction, call_slash, get_client, FakeGuild
+from app.interactions_unittest import ActionType, SendAction, call_component, call_slash, get_client, FakeGuild
+from app.exts import initiative
 from app.exts.initiative import InitiativeTracker
+from app.library.initiative_store import initiative_store
 
 class TestCommands(unittest.IsolatedAsyncioTestCase):
     async def asyncSetUp(self) -> None:
@@ -26,12 +29,30 @@ class TestCommands(unittest.IsolatedAsyncioTestCase):
             'test_ctx_guild':self.fake_guild,
             'test_ctx_channel':self.fake_guild.channels[0],
         }
+        self.display_delay = initiative.DISPLAY_DELAY
+        initiative.DISPLAY_DELAY = 0.01
         return await super().asyncSetUp()
 
     async def asyncTearDown(self) -> None:
         self.bot.unload_extension("app.exts.initiative")
+        initiative.DISPLAY_DELAY = self.display_delay
         return await super().asyncTearDown()
 
+    def assertUpdated(self, actions):
+        self.assertTrue(len(actions) == 1, f"Expected a single action got {actions}")
+        self.assertTrue(actions[0].action_type == ActionType.SEND, "Expected a message to be sent")
+        self.assertTrue(actions[0].message['flags'] & MessageFlags.EPHEMERAL, actions[0].message['flags'])
+
+    async def displayed(self) -> list[str]:
+        """Wait for the pending edit and return the lines of the initiative message."""
+        await asyncio.sleep(initiative.DISPLAY_DELAY * 5)
+        state = await initiative_store.get(str(self.fake_guild.channels[0].id))
+        message = self.bot._fake_cache[to_snowflake(state.message_id)]
+        return message.embeds[0].description.split("\n")
+
+    def edits(self):
+        return [action for action in self.bot.http.actions if action.action_type == ActionType.EDIT]
+
     async def test_initiative_help(self):
         actions = await call_slash(
             InitiativeTracker.initiative_help,
@@ -66,15 +87,15 @@ class TestCommands(unittest.IsolatedAsyncioTestCase):
             **self.context_kwargs,
             name="x",
             name_after="b")
-        self.assertTrue(actions[0].action_type == ActionType.SEND, "Expected a message to be sent")
-        self.assertTrue(actions[0].message["embeds"][0]["description"].split("\n") == ["1. a","2. x","3. b","4. c"], actions[0].message)
+        self.assertUpdated(actions)
+        self.assertTrue(await self.displayed() == ["1. a","2. x","3. b","4. c"])
         actions = await call_slash(
             InitiativeTracker.insert_before,
             **self.context_kwargs,
             name="z",
             name_after="a")
-        self.assertTrue(actions[0].action_type == ActionType.SEND, "Expected a message to be sent")
-        self.assertTrue(actions[0].message["embeds"][0]["description"].split("\n") == ["1. z","2. a","3. x","4. b","5. c"], actions[0].message)
+        self.assertUpdated(actions)
+        self.assertTrue(await self.displayed() == ["1. z","2. a","3. x","4. b","5. c"])
 
     async def test_initiative_remove(self):
         arange_actions =await call_slash(
@@ -87,12 +108,9 @@ class TestCommands(unittest.IsolatedAsyncioTestCase):
             InitiativeTracker.remove_name,
             **self.context_kwargs,
             name="b")
-        self.assertTrue(len(actions) == 2, f"Expected a delete and send action got {actions}")
-        for action in actions:
-            print(action.creation_time, action.action_type,)
-        self.assertTrue(actions[0].action_type == ActionType.DELETE, f"Expected a message to be deleted {actions}")
-        self.assertTrue(actions[1].action_type == ActionType.SEND, "Expected a message to be sent")
-        self.assertTrue(actions[1].message["embeds"][0]["description"].split("\n") == ["1. a","2. c"], actions[1].message)
+        self.assertUpdated(actions)
+        self.assertTrue(await self.displayed() == ["1. a","2. c"])
+        self.assertTrue(first_action.message["id"] in self.bot._fake_cache, "Expected the message to be edited in place")
 
     async def test_initiative_delete(self):
         arange_actions =await call_slash(
@@ -125,8 +143,8 @@ class TestCommands(unittest.IsolatedAsyncioTestCase):
             InitiativeTracker.insert_last,
             **self.context_kwargs,
             name="x")
-        self.assertTrue(actions[0].action_type == ActionType.SEND, "Expected a message to be sent")
-        self.assertTrue(actions[0].message["embeds"][0]["description"].split("\n") == ["1. a","2. b","3. c","4. x"], actions[0].message)
+        self.assertUpdated(actions)
+        self.assertTrue(await self.displayed() == ["1. a","2. b","3. c","4. x"])
 
     async def test_initiative_insert_first(self):
         await call_slash(
@@ -137,8 +155,8 @@ class TestCommands(unittest.IsolatedAsyncioTestCase):
             InitiativeTracker.insert_first,
             **self.context_kwargs,
             name="x")
-        self.assertTrue(actions[0].action_type == ActionType.SEND, "Expected a message to be sent")
-        self.assertTrue(actions[0].message["embeds"][0]["description"].split("\n") == ["1. x","2. a","3. b","4. c"], actions[0].message)
+        self.assertUpdated(actions)
+        self.assertTrue(await self.displayed() == ["1. x","2. a","3. b","4. c"])
 
     async def test_initiative_insert_after(self):
         await call_slash(
@@ -150,15 +168,15 @@ class TestCommands(unittest.IsolatedAsyncioTestCase):
             **self.context_kwargs,
             name="x",
             name_before="b")
-        self.assertTrue(actions[0].action_type == ActionType.SEND, "Expected a message to be sent")
-        self.assertTrue(actions[0].message["embeds"][0]["description"].split("\n") == ["1. a","2. b","3. x","4. c"], actions[0].message)
+        self.assertUpdated(actions)
+        self.assertTrue(await self.displayed() == ["1. a","2. b","3. x","4. c"])
         actions = await call_slash(
             InitiativeTracker.insert_after,
             **self.context_kwargs,
             name="z",
             name_before="a")
-        self.assertTrue(actions[0].action_type == ActionType.SEND, "Expected a message to be sent")
-        self.assertTrue(actions[0].message["embeds"][0]["description"].split("\n") == ["1. a","2. z","3. b","4. x","5. c"], actions[0].message)
+        self.assertUpdated(actions)
+        self.assertTrue(await self.displayed() == ["1. a","2. z","3. b","4. x","5. c"])
 
     async def test_initiative_show(self):
         await call_slash(
@@ -168,5 +186,97 @@ class TestCommands(unittest.IsolatedAsyncioTestCase):
         actions = await call_slash(
             InitiativeTracker.show_initiative,
             **self.context_kwargs)
-        self.assertTrue(actions[0].action_type == ActionType.SEND, "Expected a message to be sent")
-        self.assertTrue(actions[0].message["embeds"][0]["description"].split("\n") == ["1. a","2. b","3. c"], actions[0].message)
+        self.assertTrue(len(actions) == 2, f"Expected a delete and send action got {actions}")
+        self.assertTrue(actions[0].action_type == ActionType.DELETE, "Expected the old message to be deleted")
+        self.assertTrue(actions[1].action_type == ActionType.SEND, "Expected a message to be sent")
+        self.assertTrue(actions[1].message["embeds"][0]["description"].split("\n") == ["1. a","2. b","3. c"], actions[1].message)
+
+    async def test_initiative_edits_coalesced(self):
+        await call_slash(
+            InitiativeTracker.start_initiative,
+            **self.context_kwargs,
+            participants="a,b,c")
+        edits_before = len(self.edits())
+        for name in "xyz":
+            actions = await call_slash(
+                InitiativeTracker.insert_last,
+                **self.context_kwargs,
+                name=name)
+            self.assertUpdated(actions)
+        self.assertTrue(await self.displayed() == ["1. a","2. b","3. c","4. x","5. y","6. z"])
+        self.assertTrue(len(self.edits()) == edits_before + 1, f"Expected a single edit got {self.edits()}")
+
+    async def test_initiative_reposted_when_deleted(self):
+        arange_actions = await call_slash(
+            InitiativeTracker.start_initiative,
+            **self.context_kwargs,
+            participants="a,b,c")
+        del self.bot._fake_cache[to_snowflake(arange_actions[0].message["id"])]
+        actions = await call_slash(
+            InitiativeTracker.insert_last,
+            **self.context_kwargs,
+            name="x")
+        self.assertTrue(len(actions) == 1, f"Expected a single action got {actions}")
+        self.assertFalse(actions[0].message.get('flags', 0) & MessageFlags.EPHEMERAL, "Expected the list to be sent again")
+        self.assertTrue(actions[0].message["embeds"][0]["description"].split("\n") == ["1. a","2. b","3. c","4. x"], actions[0].message)
+
+    async def test_initiative_turn_buttons(self):
+        arange_actions = await call_slash(
+            InitiativeTracker.start_initiative,
+            **self.context_kwargs,
+            participants="a,b")
+        buttons = arange_actions[0].message["components"][0]["components"]
+        self.assertTrue([button["custom_id"] for button in buttons] == ["initiative_previous_turn", "initiative_next_turn", "initiative_new_round"], buttons)
+        message = self.bot._fake_cache[to_snowflake(arange_actions[0].message["id"])]
+        for custom_id, lines, footer in [
+            ("initiative_next_turn", ["**1. a** ◀","2. b"], "Runde 1"),
+            ("initiative_next_turn", ["1. a","**2. b** ◀"], "Runde 1"),
+            ("initiative_next_turn", ["**1. a** ◀","2. b"], "Runde 2"),
+            ("initiative_previous_turn", ["1. a","**2. b** ◀"], "Runde 1"),
+            ("initiative_new_round", ["**1. a** ◀","2. b"], "Runde 2"),
+        ]:
+            actions = await call_component(
+                InitiativeTracker.turn_button,
+                **self.context_kwargs,
+                test_ctx_message=message,
+                test_ctx_custom_id=custom_id)
+            self.assertTrue(len(actions) == 1, f"Expected a single action got {actions}")
+            self.assertTrue(actions[0].action_type == ActionType.EDIT, "Expected the message to be edited")
+            self.assertTrue(actions[0].message["embeds"][0]["description"].split("\n") == lines, actions[0].message)
+            self.assertTrue(actions[0].message["embeds"][0]["footer"]["text"] == footer, actions[0].message)
+
+    async def test_initiative_delete_while_editing(self):
+        await call_slash(
+            InitiativeTracker.start_initiative,
+            **self.context_kwargs,
+            participants="a,b,c")
+        await call_slash(
+            InitiativeTracker.insert_last,
+            **self.context_kwargs,
+            name="x")
+        fetch_initiative_message = initiative.fetch_initiative_message
+
+        slow_fetches = [initiative.DISPLAY_DELAY * 5]
+
+        async def slow_fetch(channel, state):
+            # only the fetch of the pending edit is slow
+            if slow_fetches:
+                await asyncio.sleep(slow_fetches.pop())
+            return await fetch_initiative_message(channel, state)
+
+        reposts = []
+
+        async def send(channel, **kwargs):
+            reposts.append(kwargs)
+
+        with patch.object(initiative, "fetch_initiative_message", slow_fetch), patch.object(
+            type(self.fake_guild.channels[0]), "send", send, create=True
+        ):
+            # the pending edit has started fetching the message when the tracking is deleted
+            await asyncio.sleep(initiative.DISPLAY_DELAY * 2)
+            await call_slash(
+                InitiativeTracker.delete_initiative,
+                **self.context_kwargs,
+                confirmation="YES")
+            await asyncio.sleep(initiative.DISPLAY_DELAY * 10)
+        self.assertTrue(reposts == [], "Expected the deleted tracking not to be posted again")
@@ -4,6 +4,7 @@ from unittest.mock import AsyncMock, PropertyMock, patch
 from interactions import Attachment
 
 from app.exts.werewolf_w20 import Gift, WerewolfW20
+from app.library.roll_limits import RollLimits, set_guild_limits
 from app.interactions_unittest import (
     ActionType,
     FakeGuild,
@@ -55,6 +56,21 @@ class TestCommands(unittest.IsolatedAsyncioTestCase):
             actions[0].message,
         )
 
+    async def test_ww_respects_guild_limits(self):
+        set_guild_limits(self.fake_guild.id, RollLimits(max_dice=10))
+        try:
+            actions = await call_slash(
+                WerewolfW20.ww,
+                **self.context_kwargs,
+                number=11,
+            )
+        finally:
+            set_guild_limits(self.fake_guild.id, None)
+        self.assertTrue(len(actions) == 1)
+        self.assertTrue(
+            actions[0].message["content"].startswith("Zu viele Würfel: 11"), actions[0].message
+        )
+
     async def test_ww_full(self):
         actions = await call_slash(
             WerewolfW20.ww,
@@ -0,0 +1,234 @@
+import asyncio
+import sys
+
+sys.path.append(".")
+
+from sqlmodel import Session
+
+from app.library import initiative_store as store_module
+from app.library.database import engine
+from app.library.initiativatracking import (
+    ORDER_GAP,
+    InitiativeChannel,
+    InitiativeTracking,
+    get_channel_initiative,
+    get_initiative_channel,
+    insert_after_name,
+    insert_before_index,
+    insert_before_name,
+    insert_channel_message,
+    order_between,
+    recover_channel_initiatives,
+    remove_channel_initiative,
+    save_channel_initiative,
+    set_channel_initiative,
+    spaced_orders,
+    update_channel_initiative,
+)
+from app.library.initiative_store import ChannelInitiative, InitiativeStore
+
+
+def test_order_between():
+    assert order_between(None, None) == 0
+    assert order_between(None, 0) == -ORDER_GAP
+    assert order_between(0, None) == ORDER_GAP
+    assert order_between(0, ORDER_GAP) == ORDER_GAP // 2
+    assert order_between(4, 5) is None
+
+
+def test_library_inserts_touch_one_row():
+    channel_id = "test_library_inserts_touch_one_row"
+    set_channel_initiative(channel_id, "a", "b", "c", "a")
+    try:
+        insert_before_name(channel_id, "c", "a")
+        insert_after_name(channel_id, "b", "x")
+        insert_before_index(channel_id, 0, "y")
+        trackings = get_channel_initiative(channel_id)
+        assert [tracking.name for tracking in trackings] == ["y", "b", "x", "a", "c"]
+        assert trackings[1].initiative_order == ORDER_GAP
+        assert trackings[4].initiative_order == 2 * ORDER_GAP
+    finally:
+        remove_channel_initiative(channel_id)
+
+
+def test_channel_initiative_mutations():
+    state = ChannelInitiative("c")
+    state.reset(["a", "b", "c"])
+    state.insert_before("c", "a")
+    assert state.names == ["b", "a", "c"]
+    state.insert_after("b", "c")
+    assert state.names == ["b", "c", "a"]
+    state.insert(0, "x")
+    state.insert(99, "y")
+    assert state.names == ["x", "b", "c", "a", "y"]
+    state.remove("b")
+    state.remove("missing")
+    assert state.names == ["x", "c", "a", "y"]
+
+    empty = ChannelInitiative("c")
+    empty.insert_before("b", "a")
+    assert empty.names == ["a", "b"]
+
+
+def test_channel_initiative_order_keys():
+    state = ChannelInitiative("c")
+    state.reset(["a", "b", "c"])
+    state.take_changes()
+    state.insert_after("a", "x")
+    function, args = state.take_changes()
+    assert function is update_channel_initiative
+    assert args[1] == {"x": ORDER_GAP // 2}
+    assert state.orders == sorted(state.orders)
+
+    # inserting again and again at the same place uses up the gap, then the keys are spaced out
+    for number in range(20):
+        state.insert_after("a", str(number))
+        function, _ = state.take_changes()
+        if function is save_channel_initiative:
+            break
+    assert function is save_channel_initiative
+    assert state.orders == spaced_orders(len(state.names))
+    assert state.names[:2] == ["a", str(number)]
+
+    state.remove("b")
+    state.insert(0, "b")
+    function, args = state.take_changes()
+    assert args[1] == {"b": -ORDER_GAP} and args[2] == []
+
+
+def test_channel_initiative_turns():
+    state = ChannelInitiative("c")
+    state.reset(["a", "b", "c"])
+    state.previous_turn()
+    assert (state.current_turn, state.round) == (None, 0)
+    state.take_changes()
+    for _ in range(4):
+        state.next_turn()
+    assert (state.current_turn, state.round) == ("a", 2)
+    state.previous_turn()
+    assert (state.current_turn, state.round) == ("c", 1)
+    state.new_round()
+    assert (state.current_turn, state.round) == ("a", 2)
+    # the turn of a removed participant passes on
+    state.remove("a")
+    assert (state.current_turn, state.round) == ("b", 2)
+    state.remove("c")
+    state.remove("b")
+    assert (state.current_turn, state.round) == (None, 2)
+    state.take_changes()
+
+    # advancing only changes the turn, no participant is written
+    state.reset(["a", "b"])
+    state.take_changes()
+    state.next_turn()
+    function, args = state.take_changes()
+    assert function is update_channel_initiative
+    assert args[1:] == ({}, [], {"message_id": None, "current_turn": "a", "round": 1})
+
+
+def test_channel_initiative_from_trackings():
+    trackings = [
+        InitiativeTracking(initiative_order=order, channel_id="c", name=name)
+        for order, name in [(0, "a"), (1, "b"), (1, "c"), (2, "a")]
+    ]
+    channel = InitiativeChannel(channel_id="c", message_id="1", current_turn="b", round=3)
+    state = ChannelInitiative.from_trackings("c", trackings, channel)
+    assert state.names == ["a", "b", "c"]
+    assert state.replace_all and not state.header_changed
+    assert (state.message_id, state.current_turn, state.round) == ("1", "b", 3)
+
+
+def test_store_batches_writes(monkeypatch):
+    channel_id = "test_store_batches_writes"
+    writes = []
+
+    def counting(function):
+        def write(*args):
+            writes.append(args)
+            function(*args)
+
+        return write
+
+    for name in ("save_channel_initiative", "update_channel_initiative"):
+        monkeypatch.setattr(store_module, name, counting(getattr(store_module, name)))
+
+    async def run():
+        store = InitiativeStore(flush_delay=0.05)
+        await store.set_names(channel_id, ["a", "b"])
+        state = await store.get(channel_id)
+        for name in "cdef":
+            state.insert(len(state.names), name)
+            store.changed(state)
+        assert writes == []
+        await asyncio.sleep(0.2)
+        assert len(writes) == 1
+        state.insert_before("c", "f")
+        state.remove("a")
+        store.changed(state)
+        await asyncio.sleep(0.2)
+        return store
+
+    try:
+        store = asyncio.run(run())
+        assert len(writes) == 2
+        assert [tracking.name for tracking in get_channel_initiative(channel_id)] == list("bfcde")
+        assert not store.channels[channel_id].dirty
+    finally:
+        remove_channel_initiative(channel_id)
+
+
+def test_store_evicts_saved_channels():
+    async def run():
+        store = InitiativeStore(flush_delay=60, cached_channels=1)
+        await store.get("test_evict_1")
+        await store.set_names("test_evict_2", ["a"])
+        await store.get("test_evict_3")
+        return store
+
+    store = asyncio.run(run())
+    assert list(store.channels) == ["test_evict_2", "test_evict_3"]
+    store.flush_all_sync()
+    remove_channel_initiative("test_evict_2")
+
+
+def test_recover_channel_initiatives():
+    channel_id = "test_recover_channel_initiatives"
+    with Session(engine) as session:
+        for order, name in [(0, "a"), (2, "b"), (2, "c"), (3, "a")]:
+            session.add(InitiativeTracking(initiative_order=order, channel_id=channel_id, name=name))
+        session.commit()
+    try:
+        assert recover_channel_initiatives() >= 1
+        trackings = get_channel_initiative(channel_id)
+        assert [(tracking.initiative_order, tracking.name) for tracking in trackings] == [
+            (0, "a"),
+            (ORDER_GAP, "b"),
+            (2 * ORDER_GAP, "c"),
+        ]
+        assert recover_channel_initiatives() == 0
+    finally:
+        remove_channel_initiative(channel_id)
+
+
+def test_message_is_saved_in_one_row():
+    channel_id = "test_message_is_saved_in_one_row"
+    set_channel_initiative(channel_id, "a", "b", message_id="1")
+    try:
+        assert get_initiative_channel(channel_id).version == 1
+        insert_channel_message(channel_id, "2")
+        channel = get_initiative_channel(channel_id)
+        assert (channel.message_id, channel.round, channel.version) == ("2", 0, 2)
+
+        async def run():
+            store = InitiativeStore(flush_delay=60)
+            state = await store.get(channel_id)
+            assert (state.names, state.message_id) == (["a", "b"], "2")
+            await store.set_message(channel_id, "3")
+            function, args = state.take_changes()
+            assert function is update_channel_initiative
+            assert args == (channel_id, {}, [], {"message_id": "3", "current_turn": None, "round": 0})
+
+        asyncio.run(run())
+    finally:
+        remove_channel_initiative(channel_id)
+    assert get_initiative_channel(channel_id) is None
@@ -1,10 +1,14 @@
 import sys
 from unittest.mock import patch
 
+import numpy as np
+import pytest
+
 sys.path.append(".")
 
 from app.library.complex_dice_parser import Parser
 from app.library.polydice import (
+    DicePoolExclusions,
     DicePoolExclusionsSuccesses,
     DicePoolExclusionsSum,
     DicePoolResultSuccesses,
@@ -14,10 +18,33 @@ from app.library.polydice import (
     ExplodingBehavior,
     DicePoolResultSum,
     roll_pool,
+    roll_pool_arrays,
+    keep_mask,
+    DiceRng,
+    NumpyRng,
+    SecureRng,
+    current_rng,
+    rng_for_scope,
+    roll_many,
+    seeded_rng,
+    set_scope_rng,
+    use_rng,
 )
 
-@patch('random.randint', side_effect=[1, 2, 6])
-def test_roll_dice_basic(_):
+
+class FixedRng(DiceRng):
+    """Returns the given results in order, for predictable rolls."""
+
+    def __init__(self, *results: int):
+        self.results = list(results)
+
+    def integers(self, sides: int, size: int, dtype: type = np.int64) -> np.ndarray:
+        drawn, self.results = self.results[:size], self.results[size:]
+        return np.array(drawn, dtype=dtype)
+
+
+@patch('app.library.polydice._default_rng', FixedRng(1, 2, 6))
+def test_roll_dice_basic():
     results = roll_dice_basic(number=3, sides=6, dice_modifier=2)
     assert len(results) == 3
     assert results[0].result == 1
@@ -36,8 +63,8 @@ def test_roll_dice_sum():
     assert result.sum >= 3 and result.sum <= 20
 
 
-@patch('random.randint', side_effect=[1, 2, 6,7,10])
-def test_roll_dice_successes(_):
+@patch('app.library.polydice._default_rng', FixedRng(1, 2, 6, 7, 10))
+def test_roll_dice_successes():
     result = roll_dice_successes(
         number=5,
         sides=10,
@@ -51,8 +78,8 @@ def test_roll_dice_successes(_):
     assert result.successes == 2
 
 
-@patch('random.randint', side_effect=[1,7,10])
-def test_roll_dice_successes_with_low_subtraction(_):
+@patch('app.library.polydice._default_rng', FixedRng(1, 7, 10))
+def test_roll_dice_successes_with_low_subtraction():
     result = roll_dice_successes(
         number=3,
         sides=10,
@@ -66,8 +93,8 @@ def test_roll_dice_successes_with_low_subtraction(_):
     assert result.successes == 1
 
 
-@patch('random.randint', side_effect=[1,7,10,7])
-def test_roll_dice_successes_with_low_subtraction_and_exploding_once(_):
+@patch('app.library.polydice._default_rng', FixedRng(1, 7, 10, 7))
+def test_roll_dice_successes_with_low_subtraction_and_exploding_once():
     result = roll_dice_successes(
         number=3,
         sides=10,
@@ -80,8 +107,8 @@ def test_roll_dice_successes_with_low_subtraction_and_exploding_once(_):
     assert isinstance(result, DicePoolResultSuccesses)
     assert result.successes == 2
 
-@patch('random.randint', side_effect=[1,7,10,2])
-def test_roll_dice_successes_with_low_subtraction_and_exploding_plus(_):
+@patch('app.library.polydice._default_rng', FixedRng(1, 7, 10, 2))
+def test_roll_dice_successes_with_low_subtraction_and_exploding_plus():
     result = roll_dice_successes(
         number=3,
         sides=10,
@@ -95,9 +122,9 @@ def test_roll_dice_successes_with_low_subtraction_and_exploding_plus(_):
     assert result.successes == 2
 
 
-@patch('random.randint', side_effect=[1,7,10,4])
-def test_roll_dice_exploding_once(_):
-    original_dice, extra_dice = roll_pool(
+@patch('app.library.polydice._default_rng', FixedRng(1, 7, 10, 4))
+def test_roll_dice_exploding_once():
+    original_dice, extra_dice, _ = roll_pool(
         number=3, sides=10, dice_modifier=0, high_exploding=ExplodingBehavior.ONCE
     )
     assert len(original_dice) == 3
@@ -105,7 +132,7 @@ def test_roll_dice_exploding_once(_):
 
 
 def test_roll_dice_exploding_cascading():
-    original_dice, extra_dice = roll_pool(
+    original_dice, extra_dice, _ = roll_pool(
         number=60, sides=6, dice_modifier=0, high_exploding=ExplodingBehavior.CASCADING
     )
     assert len(original_dice) >= 3
@@ -179,3 +206,128 @@ def test_roll_dice_with_high_limit():
     assert len(result.excluded) == len(result.dice_results) - 3, result.formatted()
     assert all(1 <= dice_result.result <= 6 for dice_result in result.dice_results)
     assert result.sum >= 3 and result.sum <= 18
+
+
+def test_keep_mask_highest_and_lowest():
+    rolls = np.array([3, 6, 1, 6, 2])
+    assert keep_mask(rolls, highest_count=2).tolist() == [False, True, False, True, False]
+    assert keep_mask(rolls, lowest_count=2).tolist() == [False, False, True, False, True]
+    assert keep_mask(rolls).all()
+
+
+@patch('app.library.polydice._default_rng', FixedRng(10, 3, 10, 10, 4))
+def test_roll_pool_arrays_exploding_once():
+    base_rolls, extra_rolls, capped = roll_pool_arrays(3, 10, ExplodingBehavior.ONCE)
+    assert base_rolls.tolist() == [10, 3, 10]
+    assert extra_rolls.tolist() == [10, 4]
+    assert not capped
+
+
+@patch('app.library.polydice._default_rng', FixedRng(1, 6, 10, 2))
+def test_complex_pool_subtracts_failures():
+    result = Parser("4d10s6f1").build_pool().roll()
+    assert isinstance(result, DicePoolExclusionsSuccesses)
+    assert result.successes == 1
+    assert len(result.dice_results) == 4
+    assert result.formatted().startswith("~~1~~")
+
+
+def test_results_use_slots():
+    result = Parser("10d10s6").build_pool().roll()
+    assert not hasattr(result, "__dict__")
+    assert not hasattr(result.dice_results[0], "__dict__")
+    assert result.base_rolls.dtype == np.int32
+    assert not hasattr(roll_dice_sum(3, 6), "__dict__")
+
+
+@patch('app.library.polydice._default_rng', FixedRng(4, 1, 3, 6))
+def test_pool_total_is_memoized():
+    result = Parser("4d6b2").build_pool().roll()
+    assert [dice.result for dice in result.excluded] == [4, 6]
+    assert result.sum == 4
+    result.pool_modifier = 10
+    assert result.sum == 4
+
+
+def test_difference_results_compare_by_sum():
+    first = Parser("d20<14").build_pool().roll()
+    second = Parser("d20<14").build_pool().roll()
+    assert (first == second) == (first.sum == second.sum)
+    assert (first < second) == (first.sum < second.sum)
+
+
+def test_use_rng_selects_the_source_per_call():
+    with use_rng(FixedRng(6, 6, 6)):
+        assert roll_dice_sum(3, 6).sum == 18
+    assert isinstance(current_rng(), NumpyRng)
+    with use_rng(SecureRng()):
+        assert all(1 <= dice.result <= 4 for dice in roll_dice_basic(20, 4))
+
+
+def test_seeded_rng_replays_rolls():
+    with use_rng(seeded_rng(42, 1, 2)):
+        first = Parser("10d10").build_pool().roll()
+    with use_rng(seeded_rng(42, 1, 2)):
+        replay = Parser("10d10").build_pool().roll()
+    with use_rng(seeded_rng(42, 1, 3)):
+        other_channel = Parser("10d10").build_pool().roll()
+    assert first.base_rolls.tolist() == replay.base_rolls.tolist()
+    assert first.base_rolls.tolist() != other_channel.base_rolls.tolist()
+
+
+def test_abstract_bases_can_not_be_instantiated():
+    with pytest.raises(TypeError):
+        DiceRng()
+    assert DicePoolExclusions.__abstractmethods__ == {"_calculate_total"}
+
+
+def test_scope_rng():
+    rng = seeded_rng(7, 100)
+    set_scope_rng(100, rng)
+    assert rng_for_scope(5, 100) is rng
+    set_scope_rng(100, None)
+    assert rng_for_scope(5, 100) is None
+
+
+def test_cascading_explosions_are_capped():
+    base_rolls, extra_rolls, capped = roll_pool_arrays(3, 1, ExplodingBehavior.CASCADING, max_depth=5)
+    assert len(base_rolls) == 3
+    assert len(extra_rolls) == 15
+    assert capped
+    base_rolls, extra_rolls, capped = roll_pool_arrays(100, 1, ExplodingBehavior.CASCADING, dice_budget=250)
+    assert len(extra_rolls) == 250
+    assert capped
+    result = Parser("2d1!!1").build_pool().roll()
+    assert result.capped
+    assert result.sum == 2 + 2 * 100
+    assert "Bonuswürfel (begrenzt):" in result.formatted()
+    assert roll_dice_sum(2, 1, ExplodingBehavior.CASCADING).capped
+
+
+def test_roll_many_groups_pools_by_shape():
+    pools = [Parser(description).build_pool() for description in ["2d6", "3d10s6", "1d6+2", "4d10!!10h2"]]
+    rng = FixedRng(1, 6, 5, 7, 3, 9, 9, 10, 1, 2, 10, 4)
+    with use_rng(rng):
+        results = roll_many(pools)
+    assert [result.description for result in results] == ["2d6", "3d10s6", "1d6+2", "4d10!!10h2"]
+    assert results[0].sum == 7
+    assert results[2].sum == 7
+    assert results[1].successes == 2
+    assert results[3].base_rolls.tolist() == [9, 10, 1, 2]
+    assert results[3].extra_rolls.tolist() == [10, 4]
+    assert results[3].sum == 20
+    assert rng.results == []
+
+
+def test_formatting_compresses_runs_and_respects_budget():
+    with use_rng(FixedRng(10, 10, 10, 10, 10, 10, 10, 3, 4)):
+        result = Parser("9d10").build_pool().roll()
+    assert result.formatted() == "7×**10** , 3 , 4  -> 77"
+    big_result = Parser("5000d6s5").build_pool().roll()
+    formatted = big_result.formatted(budget=1024)
+    assert len(formatted) <= 1024
+    assert formatted.endswith(")")
+    assert "… (+" in formatted
+    sum_result = Parser("5000d6").build_pool().roll()
+    assert len(sum_result.formatted(budget=1024)) <= 1024
+    assert sum_result.formatted(budget=1024).endswith(f" -> {sum_result.sum}")
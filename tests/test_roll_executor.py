@@ -0,0 +1,56 @@
+import asyncio
+import os
+import sys
+from unittest.mock import patch
+
+sys.path.append(".")
+
+from app.library.complex_dice_parser import compile_dice_pool
+from app.library.polydice import (
+    DicePoolResultSuccesses,
+    ExplodingBehavior,
+    NumpyRng,
+    SecureRng,
+    roll_dice_successes,
+    roll_many,
+    use_rng,
+)
+from app.library.roll_executor import *
+from app.library.roll_limits import DEFAULT_MAX_DICE
+
+
+def test_small_rolls_run_inline():
+    assert asyncio.run(run_roll(1, os.getpid)) == os.getpid()
+    # rolls at the default limit are heavy enough for a worker
+    assert PROCESS_THRESHOLD_DICE <= DEFAULT_MAX_DICE
+
+
+@patch("app.library.roll_executor.PROCESS_THRESHOLD_DICE", 10)
+def test_heavy_rolls_run_in_worker_and_replay_seeded():
+    try:
+        assert asyncio.run(run_roll(10, os.getpid)) != os.getpid()
+        pools = compile_dice_pool("100d10s6 50d6!!6")
+        results = []
+        for _ in range(2):
+            with use_rng(NumpyRng(42)):
+                results.append(asyncio.run(run_roll(150, roll_many, pools)))
+        assert [result.total for result in results[0]] == [result.total for result in results[1]]
+        assert len(results[0][0].base_rolls) == 100
+        # dice lists are sent back as arrays and rebuilt
+        with use_rng(NumpyRng(42)):
+            result = asyncio.run(run_roll(100, roll_dice_successes, 100, 10, ExplodingBehavior.ONCE))
+        assert isinstance(result, DicePoolResultSuccesses)
+        assert len(result.dice_results) == 100
+        assert result.high_exploding == ExplodingBehavior.ONCE
+        assert all(1 <= dice.result <= 10 for dice in result.all_result)
+    finally:
+        shutdown_roll_executor()
+
+
+def test_worker_rng_keeps_secure_source():
+    with use_rng(SecureRng()):
+        assert isinstance(worker_rng(), SecureRng)
+    with use_rng(NumpyRng(1)):
+        first = worker_rng().integers(100, 5).tolist()
+    with use_rng(NumpyRng(1)):
+        assert worker_rng().integers(100, 5).tolist() == first
@@ -0,0 +1,69 @@
+import sys
+
+sys.path.append(".")
+
+from app.library.complex_dice_parser import compile_pool
+from app.library.dice_expression import compile_dice_expressions, roll_dice_expressions
+from app.library.roll_limits import *
+
+
+def test_estimate_cost_without_rolling():
+    cost = compile_pool("99999999d100!!100").estimate_cost()
+    assert cost.dice == 99999999
+    assert cost.explosion_budget == MAX_EXPLOSION_DICE
+    assert 0 < cost.expected_explosion_dice <= MAX_EXPLOSION_DICE
+    assert cost.output_characters > 99999999
+    once = compile_pool("10d10!10").estimate_cost()
+    assert once.explosion_budget == 10
+    assert once.expected_explosion_dice == 1
+    cascading = compile_pool("10d2!!2").estimate_cost()
+    assert cascading.expected_explosion_dice == 10
+    assert compile_pool("2d6").estimate_cost().explosion_budget == 0
+
+
+def test_estimate_cost_of_expressions_adds_pools():
+    cost = estimate_cost(compile_dice_expressions("2d6+1d8 3d10"))
+    assert cost.dice == 6
+
+
+def test_max_simulated_rolls_counts_all_dice():
+    limits = RollLimits(max_simulated_dice=1000)
+    assert max_simulated_rolls(compile_dice_expressions("2d6+1d8 7d10"), limits) == 100
+    assert max_simulated_rolls(compile_dice_expressions("5d2!!2"), limits) == 100
+
+
+def test_plan_roll_rejects_too_many_dice():
+    try:
+        plan_roll(compile_dice_expressions("99999999d100!!"), RollLimits(max_dice=1000))
+    except RollLimitExceeded as e:
+        assert e.cost.dice == 99999999
+    else:
+        assert False, "Expected RollLimitExceeded to be raised"
+
+
+def test_plan_roll_downgrades_and_summarizes():
+    limits = RollLimits(max_dice=1000, summary_characters=500, downgrade=True)
+    plan = plan_roll(compile_dice_expressions("3000d6 (1000d10)*2"), limits)
+    assert plan.downgraded
+    assert plan.summary_only
+    assert plan.cost.dice == 1000
+    assert [item.number for item in plan.items[:1]] == [750]
+    assert plan.items[1].pools[0].number == 250
+    results = roll_dice_expressions(plan.items)
+    assert results[0].summarized().startswith("750W6 -> ")
+    assert results[1].summarized().endswith(f"= {results[1].value}")
+
+
+def test_plan_roll_keeps_small_rolls():
+    plan = plan_roll(compile_dice_expressions("2d6+3 1d20"), RollLimits())
+    assert not plan.downgraded
+    assert not plan.summary_only
+    assert plan.items == compile_dice_expressions("2d6+3 1d20")
+
+
+def test_guild_limits():
+    set_guild_limits(1234, RollLimits(max_dice=5))
+    assert limits_for_guild(1234).max_dice == 5
+    assert limits_for_guild(4321) == RollLimits()
+    set_guild_limits(1234, None)
+    assert limits_for_guild(1234) == RollLimits()